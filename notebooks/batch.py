@@ -0,0 +1,265 @@
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+import pandas as pd
+from pydantic import ValidationError
+
+from utils import (
+    SYSTEM_MESSAGE,
+    MetadataAnalysis,
+    get_client,
+    model,
+    openai_model,
+    parse_instructor_results,
+    render_analysis_prompt,
+)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Expired and cancelled jobs can still have partial results.
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def response_format(response_model=MetadataAnalysis):
+    """Build a strict JSON schema `response_format` for the given pydantic model."""
+    schema = response_model.model_json_schema()
+    schema["additionalProperties"] = False
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": response_model.__name__,
+            "schema": schema,
+            "strict": True,
+        },
+    }
+
+
+def build_batch_requests(df, provider="openai", model_id=None):
+    """Render one batch request per dataset.
+
+    Args:
+        df (pd.DataFrame): The metadata with an `id` column and the fields used by PROMPT_ANALYSIS.
+        provider (str): "openai" or "mistral". The two batch APIs differ slightly in their line format.
+        model_id (str): Model to use. Defaults to the model used by `do_full_analysis`.
+
+    Returns:
+        list: Request dicts, with the dataset id as `custom_id`.
+    """
+    if model_id is None:
+        model_id = openai_model if provider == "openai" else model
+
+    batch_requests = []
+    for _, row in df.iterrows():
+        body = {
+            "temperature": 0,
+            "messages": [
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": render_analysis_prompt(row)},
+            ],
+            "response_format": response_format(),
+        }
+        if provider == "openai":
+            body["model"] = model_id
+            batch_requests.append(
+                {
+                    "custom_id": str(row["id"]),
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": body,
+                }
+            )
+        else:
+            # Mistral takes the model when the job is created, not per line.
+            batch_requests.append({"custom_id": str(row["id"]), "body": body})
+    return batch_requests
+
+
+def write_batch_file(df, path, provider="openai", model_id=None):
+    """Write the batch requests for all datasets in `df` to a JSONL file.
+
+    Returns:
+        int: Number of requests written.
+    """
+    batch_requests = build_batch_requests(df, provider=provider, model_id=model_id)
+    with open(path, "w", encoding="utf-8") as file:
+        for request in batch_requests:
+            file.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return len(batch_requests)
+
+
+def read_batch_results(path):
+    """Parse a batch results JSONL file.
+
+    Every line is validated against MetadataAnalysis. Lines that failed on the
+    provider side or do not contain a valid analysis are reported instead of
+    raising, so that their ids can be queued again.
+
+    Args:
+        path (str): The results file downloaded from the provider.
+
+    Returns:
+        tuple: A DataFrame with an `id` column plus the columns of
+            `parse_instructor_results`, a DataFrame of errors (`line`, `id`,
+            `error`), and the list of failed ids.
+    """
+    ids = []
+    analyses = []
+    errors = []
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            custom_id = None
+            try:
+                record = json.loads(line)
+                custom_id = record.get("custom_id")
+                if record.get("error"):
+                    raise ValueError(record["error"])
+                response = record["response"]
+                if response["status_code"] != 200:
+                    raise ValueError(f"status code {response['status_code']}")
+                content = response["body"]["choices"][0]["message"]["content"]
+                analyses.append(MetadataAnalysis.model_validate_json(content))
+                ids.append(custom_id)
+            except (ValueError, KeyError, IndexError, TypeError, ValidationError) as e:
+                errors.append({"line": line_number, "id": custom_id, "error": str(e)})
+
+    results = parse_instructor_results(analyses)
+    results.insert(0, "id", ids)
+    errors = pd.DataFrame(errors, columns=["line", "id", "error"])
+    failed_ids = errors["id"].dropna().tolist()
+    if len(errors):
+        print(f"{len(errors)} of {len(ids) + len(errors)} batch results failed.")
+    return results, errors, failed_ids
+
+
+class BatchBackend(ABC):
+    """Interface for submitting batch files to a provider.
+
+    Implementations upload a requests file, report the job status and download
+    the results file once the job is done.
+    """
+
+    @abstractmethod
+    def submit(self, path):
+        """Submit a requests file and return a job id."""
+
+    @abstractmethod
+    def status(self, job_id):
+        """Return "completed", "failed" or any other (in-progress) status string."""
+
+    @abstractmethod
+    def download(self, job_id, path):
+        """Write the results of a completed job to `path`."""
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Run batch files through the OpenAI Batch API."""
+
+    def __init__(self, client=None, completion_window="24h"):
+        self.client = client or get_client("openai_client")
+        self.completion_window = completion_window
+
+    def submit(self, path):
+        with open(path, "rb") as file:
+            input_file = self.client.files.create(file=file, purpose="batch")
+        job = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return job.id
+
+    def status(self, job_id):
+        return self.client.batches.retrieve(job_id).status
+
+    def download(self, job_id, path):
+        job = self.client.batches.retrieve(job_id)
+        with open(path, "w", encoding="utf-8") as file:
+            for file_id in (job.output_file_id, job.error_file_id):
+                if file_id:
+                    file.write(self.client.files.content(file_id).text)
+
+
+class LocalBatchBackend(BatchBackend):
+    """File-based stand-in for a provider batch API.
+
+    Requests are answered synchronously by `answer(body)`, which returns the
+    message content as a string. Useful for testing the batch pipeline without
+    network access.
+
+    Args:
+        answer (callable): Maps a request body to the response content.
+        directory (str): Where job results are stored.
+    """
+
+    def __init__(self, answer, directory="_batch"):
+        self.answer = answer
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _results_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}_results.jsonl")
+
+    def submit(self, path):
+        job_id = uuid.uuid4().hex
+        with open(path, encoding="utf-8") as requests_file, open(
+            self._results_path(job_id), "w", encoding="utf-8"
+        ) as results_file:
+            for line in requests_file:
+                request = json.loads(line)
+                try:
+                    content = self.answer(request["body"])
+                    record = {
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {"choices": [{"message": {"content": content}}]},
+                        },
+                        "error": None,
+                    }
+                except Exception as e:
+                    record = {
+                        "custom_id": request["custom_id"],
+                        "response": None,
+                        "error": {"message": str(e)},
+                    }
+                results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return job_id
+
+    def status(self, job_id):
+        return "completed" if os.path.exists(self._results_path(job_id)) else "failed"
+
+    def download(self, job_id, path):
+        with open(self._results_path(job_id), encoding="utf-8") as source, open(
+            path, "w", encoding="utf-8"
+        ) as target:
+            target.write(source.read())
+
+
+def run_batch(backend, df, requests_path, results_path, poll_interval=60):
+    """Write, submit and wait for a batch job, then ingest its results.
+
+    Datasets without any line in the results (e.g. because the job expired) are
+    added to the failed ids, so they can be submitted again with
+    `run_batch(backend, df[df["id"].isin(failed_ids)], ...)`.
+
+    Returns:
+        tuple: See `read_batch_results`.
+    """
+    count = write_batch_file(df, requests_path)
+    job_id = backend.submit(requests_path)
+    print(f"Submitted {count} requests as batch job {job_id}.")
+
+    while (status := backend.status(job_id)) not in BATCH_FINAL_STATUSES:
+        time.sleep(poll_interval)
+    if status == "failed":
+        raise RuntimeError(f"Batch job {job_id} failed.")
+
+    backend.download(job_id, results_path)
+    results, errors, failed_ids = read_batch_results(results_path)
+    answered = set(results["id"]) | set(errors["id"])
+    failed_ids += [str(id_) for id_ in df["id"] if str(id_) not in answered]
+    return results, errors, failed_ids
@@ -0,0 +1,558 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from ckan import (
+    ANALYSIS_COLUMNS,
+    active_tag_names,
+    extract_active_names,
+    flatten_packages,
+    read_snapshot,
+    write_snapshot,
+)
+from export import EXPORT_COLUMNS, export_results
+from mock_llm import MockLLMServer
+from scheduler import AdaptiveConcurrency, RateLimitedScheduler, estimate_tokens
+from telemetry import CallMetrics, add_hook, remove_hook
+from utils import (
+    SYSTEM_MESSAGE,
+    analyze_batch,
+    configure_client,
+    do_full_analysis,
+    do_score_analysis,
+    estimate_analysis_tokens,
+    pack_batches,
+    parse_analysis_results,
+    render_batch_prompt,
+)
+
+_WORDS = (
+    "Der Titel beschreibt den Datensatz nur ungenau und die Beschreibung nennt "
+    "weder Quelle noch Methodik der Erhebung sowie keine Angaben zur Vollständigkeit"
+).split()
+
+_TAGS = [
+    "dateninhalt",
+    "methodik",
+    "datenqualität",
+    "geographie",
+    "tag-qualität",
+    "referenz",
+]
+
+
+def synthetic_tagged_responses(n=10_000, malformed_share=0.05, seed=42):
+    """Generate tagged LLM responses like those parsed by `parse_analysis_results`.
+
+    A share of the responses is malformed (a missing section or an invalid score).
+    """
+    rng = random.Random(seed)
+    responses = []
+    for _ in range(n):
+        sections = []
+        for tag in _TAGS:
+            text = " ".join(rng.choices(_WORDS, k=rng.randint(30, 80)))
+            sections.append(f"<{tag}>\n{text}\n</{tag}>")
+            sections.append(f"<{tag}-score>{rng.randint(1, 3)}</{tag}-score>")
+        if rng.random() < malformed_share:
+            del sections[rng.randrange(len(sections))]
+        responses.append("Hier ist meine Analyse:\n\n" + "\n".join(sections))
+    return responses
+
+
+def _legacy_parse_analysis_results(results):
+    """The previous implementation of `parse_analysis_results`, kept for comparison."""
+    content = re.findall(r"<dateninhalt>(.*?)</dateninhalt>", results, re.DOTALL)[
+        0
+    ].strip()
+    content_score = re.findall(
+        r"<dateninhalt-score>(.*?)</dateninhalt-score>", results, re.DOTALL
+    )[0].strip()
+    context = re.findall(r"<methodik>(.*?)</methodik>", results, re.DOTALL)[0].strip()
+    context_score = re.findall(
+        r"<methodik-score>(.*?)</methodik-score>", results, re.DOTALL
+    )[0].strip()
+    quality = re.findall(r"<datenqualität>(.*?)</datenqualität>", results, re.DOTALL)[
+        0
+    ].strip()
+    quality_score = re.findall(
+        r"<datenqualität-score>(.*?)</datenqualität-score>", results, re.DOTALL
+    )[0].strip()
+    spacial = re.findall(r"<geographie>(.*?)</geographie>", results, re.DOTALL)[
+        0
+    ].strip()
+    spacial_score = re.findall(
+        r"<geographie-score>(.*?)</geographie-score>", results, re.DOTALL
+    )[0].strip()
+    tmp = pd.DataFrame(
+        (
+            content,
+            content_score,
+            context,
+            context_score,
+            quality,
+            quality_score,
+            spacial,
+            spacial_score,
+        )
+    ).T
+    tmp.columns = [
+        "content",
+        "content_score",
+        "context",
+        "context_score",
+        "quality",
+        "quality_score",
+        "spacial",
+        "spacial_score",
+    ]
+    return tmp
+
+
+def benchmark_parse_analysis_results(n=10_000):
+    """Compare the single-pass parser with the previous per-tag implementation.
+
+    The previous implementation raises on malformed responses, so it is timed on
+    well-formed responses only; the new parser is timed on both corpora.
+
+    Returns:
+        pd.DataFrame: Runtime, responses per second and parse errors per parser and corpus.
+    """
+    corpora = {
+        "well-formed": synthetic_tagged_responses(n, malformed_share=0),
+        "5% malformed": synthetic_tagged_responses(n, malformed_share=0.05),
+    }
+    rows = []
+
+    start = time.perf_counter()
+    pd.concat([_legacy_parse_analysis_results(r) for r in corpora["well-formed"]])
+    elapsed = time.perf_counter() - start
+    rows.append(("per-tag regex + concat", "well-formed", elapsed, 0))
+
+    for corpus, responses in corpora.items():
+        start = time.perf_counter()
+        parsed = parse_analysis_results(responses)
+        elapsed = time.perf_counter() - start
+        rows.append(
+            ("single-pass", corpus, elapsed, int(parsed["parse_error"].notna().sum()))
+        )
+
+    df = pd.DataFrame(rows, columns=["parser", "corpus", "seconds", "parse_errors"])
+    df["responses_per_second"] = n / df["seconds"]
+    return df
+
+
+def synthetic_packages(n=20_000, seed=42):
+    """Generate raw CKAN package dicts shaped like those of the Berlin portal."""
+    rng = random.Random(seed)
+
+    def words(k):
+        return " ".join(rng.choices(_WORDS, k=k))
+
+    packages = []
+    for i in range(n):
+        org = rng.randrange(80)
+        packages.append(
+            {
+                "id": f"{i:08d}-0000-4000-8000-000000000000",
+                "name": f"datensatz-{i}",
+                "title": words(8),
+                "notes": words(rng.randint(20, 120)),
+                "author": f"Senatsverwaltung {org}",
+                "author_email": f"poststelle{org}@berlin.de",
+                "maintainer": f"Referat {org}",
+                "maintainer_email": f"referat{org}@berlin.de",
+                "license_id": rng.choice(["cc-by", "dl-de-by-2.0", "dl-de-zero-2.0"]),
+                "geographical_coverage": "Berlin",
+                "geographical_granularity": rng.choice(
+                    ["Berlin", "Bezirk", "Ortsteil"]
+                ),
+                "metadata_created": "2020-01-01T00:00:00.000000",
+                "metadata_modified": f"2024-{rng.randint(1, 12):02d}-01T12:00:00.000000",
+                "organization": {
+                    "id": f"org-{org}",
+                    "name": f"org-{org}",
+                    "title": f"Senatsverwaltung {org}",
+                    "description": words(40),
+                },
+                "tags": [
+                    {"name": word, "display_name": word, "state": "active", "id": "x"}
+                    for word in rng.sample(_WORDS, 5)
+                ],
+                "resources": [
+                    {
+                        "id": f"{i}-{j}",
+                        "name": words(4),
+                        "description": words(20),
+                        "url": f"https://daten.berlin.de/{i}/{j}.csv",
+                        "format": rng.choice(["CSV", "JSON", "WFS"]),
+                        "size": rng.randint(100, 10**7),
+                        "created": "2020-01-01T00:00:00",
+                        "position": j,
+                    }
+                    for j in range(rng.randint(1, 4))
+                ],
+                "extras": [{"key": "berlin_type", "value": "datensatz"}],
+            }
+        )
+    return packages
+
+
+def _legacy_snapshot(packages):
+    """The previous snapshot format: nested objects serialized as JSON strings."""
+    data = pd.json_normalize(packages)
+    for col in ["tags", "resources", "extras"]:
+        data[col] = data[col].apply(json.dumps)
+    return data
+
+
+def benchmark_snapshot(n=20_000):
+    """Compare loading the JSON-string snapshot with the typed, projected snapshot.
+
+    Both variants read `metadata.parquet` and extract the active tag names, which is
+    what the notebook does before the analysis.
+
+    Returns:
+        pd.DataFrame: Load time, memory of the loaded DataFrame and file size per format.
+    """
+    packages = synthetic_packages(n)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_path = os.path.join(directory, "legacy.parquet")
+        typed_path = os.path.join(directory, "typed.parquet")
+        _legacy_snapshot(packages).to_parquet(legacy_path)
+        write_snapshot(pd.json_normalize(packages), typed_path)
+
+        def load_legacy():
+            df = pd.read_parquet(legacy_path)
+            df["formatted_tags"] = df["tags"].apply(extract_active_names)
+            return df
+
+        def load_typed(columns):
+            df = read_snapshot(typed_path, columns=columns)
+            df["formatted_tags"] = active_tag_names(df["tags"])
+            return df
+
+        for name, load, path in [
+            ("JSON strings, all columns", load_legacy, legacy_path),
+            ("typed, all columns", lambda: load_typed(None), typed_path),
+            (
+                "typed, analysis columns",
+                lambda: load_typed(ANALYSIS_COLUMNS),
+                typed_path,
+            ),
+        ]:
+            start = time.perf_counter()
+            df = load()
+            elapsed = time.perf_counter() - start
+            memory = df.memory_usage(deep=True).sum() / 1e6
+            rows.append((name, elapsed, memory, os.path.getsize(path) / 1e6))
+
+    return pd.DataFrame(rows, columns=["snapshot", "seconds", "memory_mb", "file_mb"])
+
+
+def synthetic_results(df, seed=42):
+    """Generate analysis results with German rationale texts for every row of `df`."""
+    rng = np.random.default_rng(seed)
+    results = pd.DataFrame(index=df.index)
+    for criterion in _TAGS:
+        column = criterion.replace("-", "_").replace("ä", "ae")
+        results[column] = [
+            " ".join(rng.choice(_WORDS, size=rng.integers(40, 120)))
+            for _ in range(len(df))
+        ]
+        results[f"{column}_score"] = pd.array(
+            rng.integers(1, 4, size=len(df)), dtype="Int64"
+        )
+    return results
+
+
+def _measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def benchmark_export(n=20_000, formats=("xlsx", "parquet", "csv")):
+    """Compare `DataFrame.to_excel` with the streaming export of `export_results`.
+
+    The streaming export also computes the score distributions per criterion,
+    publisher and author.
+
+    Returns:
+        pd.DataFrame: Runtime, peak Python memory and file size per exporter.
+    """
+    df = flatten_packages(synthetic_packages(n))
+    df["formatted_tags"] = active_tag_names(df["tags"])
+    df_final = pd.concat([df, synthetic_results(df)], axis=1)
+    columns = [column for column in EXPORT_COLUMNS if column in df_final.columns]
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "to_excel.xlsx")
+        elapsed, peak = _measure(lambda: df_final[columns].to_excel(path, index=False))
+        rows.append(("to_excel", elapsed, peak, os.path.getsize(path) / 1e6))
+        for fmt in formats:
+            paths = {}
+
+            def run():
+                paths.update(
+                    export_results(df_final, directory, formats=(fmt,), timestamp=fmt)
+                )
+
+            elapsed, peak = _measure(run)
+            size = sum(os.path.getsize(path) for path in paths[fmt]) / 1e6
+            rows.append((f"export_results {fmt}", elapsed, peak, size))
+    df = pd.DataFrame(
+        rows, columns=["exporter", "seconds", "peak_memory_mb", "file_mb"]
+    )
+    df["rows_per_second"] = n / df["seconds"]
+    return df
+
+
+def synthetic_data_rows(n=200, seed=42):
+    """Generate metadata rows as the notebook passes them to `do_full_analysis`."""
+    df = flatten_packages(synthetic_packages(n, seed=seed))
+    df["formatted_tags"] = active_tag_names(df["tags"])
+    return [row for _, row in df.iterrows()]
+
+
+def _run_analysis(
+    data_rows, use_openai, concurrency, batch_size, rpm, tpm, scores_only=False
+):
+    """Run the analysis of `data_rows` like the notebook and time every dataset.
+
+    With `batch_size` 1 every dataset goes through `do_full_analysis` (or
+    `do_score_analysis` if `scores_only`), otherwise the rows are packed into batches
+    for `analyze_batch`. Returns the results per item, the latency per dataset (first
+    attempt until result, including retries) and the scheduler.
+    """
+    scheduler = RateLimitedScheduler(
+        provider="openai" if use_openai else "mistral",
+        rpm=rpm,
+        tpm=tpm,
+        concurrency=AdaptiveConcurrency(initial=concurrency, maximum=concurrency),
+    )
+    if batch_size == 1:
+        items = [[data] for data in data_rows]
+        analyze = partial(
+            do_score_analysis if scores_only else do_full_analysis,
+            use_openai=use_openai,
+            raise_errors=True,
+        )
+
+        def fn(batch):
+            result = analyze(batch[0])
+            return {} if result is None else {str(batch[0]["id"]): result}
+
+        def estimate(batch):
+            return estimate_analysis_tokens(
+                batch[0], use_openai=use_openai, scores_only=scores_only
+            )
+
+    else:
+        items = pack_batches(data_rows, max_datasets=batch_size)
+        fn = partial(analyze_batch, use_openai=use_openai)
+
+        def estimate(batch):
+            return estimate_tokens(SYSTEM_MESSAGE + render_batch_prompt(batch))
+
+    first_attempt = {}
+    latencies = []
+    lock = threading.Lock()
+
+    def timed(batch):
+        key = id(batch)
+        with lock:
+            start = first_attempt.setdefault(key, time.perf_counter())
+        result = fn(batch)
+        with lock:
+            latencies.extend([time.perf_counter() - start] * len(batch))
+        return result
+
+    results = scheduler.map(timed, items, estimate=estimate)
+    return results, latencies, scheduler
+
+
+def benchmark_pipeline(
+    data_rows=None,
+    n=200,
+    concurrency_levels=(1, 8, 32),
+    batch_sizes=(1, 5),
+    modes=("full",),
+    use_openai=True,
+    rpm=1_000_000,
+    tpm=1_000_000_000,
+    server_rpm=None,
+    **server_options,
+):
+    """Measure throughput and tail latency of the analysis against a mock LLM server.
+
+    A `MockLLMServer` is started and the provider client is pointed at it, then the
+    real analysis path (scheduler, instructor, response validation, batching) runs
+    once per combination of concurrency level and batch size. No real API is called.
+
+    Args:
+        data_rows (list): Metadata rows to analyze. Defaults to `n` synthetic rows.
+        n (int): Number of synthetic rows if `data_rows` is not given.
+        concurrency_levels (tuple): Fixed numbers of parallel requests to compare.
+        batch_sizes (tuple): Datasets per request; 1 uses `do_full_analysis`.
+        modes (tuple): "full" analysis with rationales and/or "scores" only
+            (`do_score_analysis`, single datasets only).
+        use_openai (bool): Benchmark the OpenAI client if True, otherwise Mistral.
+        rpm (int): Requests per minute of the scheduler. The defaults are high, so
+            that only the mock server limits (see its `rpm`) take effect.
+        tpm (int): Tokens per minute of the scheduler.
+        server_rpm (int): Requests per minute after which the mock server answers
+            with 429. None disables its rate limiting.
+        **server_options: Passed on to `MockLLMServer`, e.g. `latency`,
+            `latency_sigma`, `tokens_per_second` or `error_rate`.
+
+    Returns:
+        pd.DataFrame: One row per run with datasets per minute, p50/p95/p99 latency
+            per dataset in seconds, prompt and completion tokens per dataset, retries,
+            simulated errors and 429 answers, and the peak memory traced during the run.
+    """
+    data_rows = synthetic_data_rows(n) if data_rows is None else list(data_rows)
+    provider = "openai" if use_openai else "mistral"
+    rows = []
+    with MockLLMServer(rpm=server_rpm, **server_options) as server:
+        if use_openai:
+            # Retries are left to the scheduler, so that they are counted.
+            configure_client(
+                provider, base_url=server.openai_url, api_key="mock", max_retries=0
+            )
+        else:
+            configure_client(provider, base_url=server.url, api_key="mock")
+        try:
+            # Warm-up: imports the provider SDK and creates the client.
+            _run_analysis(data_rows[:1], use_openai, 1, 1, rpm, tpm)
+            server.stats = dict.fromkeys(server.stats, 0)
+            runs = [
+                (mode, batch_size, concurrency)
+                for mode in modes
+                for batch_size in batch_sizes
+                for concurrency in concurrency_levels
+                if mode == "full" or batch_size == 1
+            ]
+            for mode, batch_size, concurrency in runs:
+                before = dict(server.stats)
+                metrics = add_hook(CallMetrics())
+                tracemalloc.start()
+                start = time.perf_counter()
+                results, latencies, scheduler = _run_analysis(
+                    data_rows,
+                    use_openai,
+                    concurrency,
+                    batch_size,
+                    rpm,
+                    tpm,
+                    scores_only=mode == "scores",
+                )
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                remove_hook(metrics)
+                tokens = metrics.to_frame()[["prompt_tokens", "completion_tokens"]]
+                tokens = tokens.sum() / len(data_rows)
+                p50, p95, p99 = (
+                    np.percentile(latencies, [50, 95, 99])
+                    if latencies
+                    else (np.nan,) * 3
+                )
+                rows.append(
+                    {
+                        "provider": provider,
+                        "mode": mode,
+                        "batch_size": batch_size,
+                        "concurrency": concurrency,
+                        "datasets": len(data_rows),
+                        "valid_results": sum(
+                            len(result) for result in results if result
+                        ),
+                        "seconds": elapsed,
+                        "datasets_per_minute": len(data_rows) / elapsed * 60,
+                        "p50": p50,
+                        "p95": p95,
+                        "p99": p99,
+                        "prompt_tokens_per_dataset": tokens["prompt_tokens"],
+                        "completion_tokens_per_dataset": tokens["completion_tokens"],
+                        "retries": scheduler.retries,
+                        "failed": len(scheduler.failed),
+                        "server_errors": server.stats["errors"] - before["errors"],
+                        "rate_limited": server.stats["rate_limited"]
+                        - before["rate_limited"],
+                        "peak_memory_mb": peak / 1e6,
+                    }
+                )
+        finally:
+            configure_client(provider)
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the analysis pipeline against a local mock LLM server."
+    )
+    parser.add_argument("--n", type=int, default=200, help="Number of datasets.")
+    parser.add_argument("--provider", choices=["openai", "mistral"], default="openai")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 5])
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["full", "scores"],
+        default=["full"],
+        help="'scores' benchmarks the scores-only fast mode (batch size 1).",
+    )
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--server-rpm", type=int, help="Rate limit of the mock server.")
+    parser.add_argument("--output", help="Write the results to this CSV file.")
+    parser.add_argument(
+        "--min-datasets-per-minute",
+        type=float,
+        help="Exit with status 1 if any run is slower, e.g. in CI.",
+    )
+    args = parser.parse_args(argv)
+
+    results = benchmark_pipeline(
+        n=args.n,
+        concurrency_levels=args.concurrency,
+        batch_sizes=args.batch_sizes,
+        modes=args.modes,
+        use_openai=args.provider == "openai",
+        latency=args.latency,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        server_rpm=args.server_rpm,
+    )
+    print(results.to_string(index=False, float_format="{:.2f}".format))
+    if args.output:
+        results.to_csv(args.output, index=False)
+    if (
+        args.min_datasets_per_minute is not None
+        and (results["datasets_per_minute"] < args.min_datasets_per_minute).any()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+from utils import (
+    PROMPT_ANALYSIS,
+    PROMPT_SCORES,
+    RESULT_COLUMNS,
+    SYSTEM_MESSAGE,
+    MetadataAnalysis,
+    MetadataScores,
+    _prompt_fields,
+    load_few_shots,
+)
+
+CHECKPOINT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "_checkpoints", "analysis.jsonl"
+)
+
+
+def prompt_version(model_id, scores_only=False):
+    """Short hash of everything that defines the analysis apart from the dataset itself.
+
+    Results produced with another prompt, few-shot file, model or schema get another
+    version and are not reused when resuming. `scores_only` selects the fast mode of
+    `do_score_analysis`.
+    """
+    prompt, response_model = (
+        (PROMPT_SCORES, MetadataScores)
+        if scores_only
+        else (PROMPT_ANALYSIS, MetadataAnalysis)
+    )
+    payload = json.dumps(
+        {
+            "prompt": prompt,
+            "few_shots": load_few_shots(),
+            "system_message": SYSTEM_MESSAGE,
+            "model_id": model_id,
+            "schema": response_model.model_json_schema(),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def content_hash(data):
+    """Short hash of the metadata fields a dataset's prompt is rendered from.
+
+    A stored result only counts as done while the hash of the dataset is unchanged,
+    so datasets edited upstream since their analysis are analysed again.
+    """
+    payload = json.dumps(
+        _prompt_fields(data), sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class CheckpointStore:
+    """Append-only JSONL store for analysis results.
+
+    Every result is written and flushed as soon as it is available, keyed by dataset
+    id, prompt version and content hash, so a crash or a hung request loses nothing
+    that was already finished. Lines of other prompt versions are ignored when
+    reading, and of several lines for one dataset the last one wins.
+
+    Args:
+        version (str): The prompt version, see `prompt_version`.
+        path (str): Location of the JSONL file.
+    """
+
+    def __init__(self, version, path=CHECKPOINT_PATH):
+        self.version = version
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, dataset_id, result, content=None):
+        """Write the result for one dataset. None (failed calls) is not stored.
+
+        `result` is a response model or a dict with RESULT_COLUMNS. `content` is the `content_hash` of the dataset the result was produced from.
+        """
+        if result is None:
+            return
+        line = json.dumps(
+            {
+                "id": str(dataset_id),
+                "prompt_version": self.version,
+                "content_hash": content,
+                "timestamp": time.time(),
+                "result": result if isinstance(result, dict) else result.model_dump(),
+            },
+            ensure_ascii=False,
+        )
+        with self._lock, open(self.path, "ab+") as file:
+            # After a crash the last line can be incomplete. Start a new line, so
+            # that only the broken record is lost and not this one as well.
+            if file.seek(0, os.SEEK_END) > 0:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    line = "\n" + line
+            file.write((line + "\n").encode("utf-8"))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _iter_records(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line can be incomplete after a crash.
+                    continue
+                if record.get("prompt_version") == self.version:
+                    yield record
+
+    def done_ids(self):
+        """Map the ids with a result for this prompt version to its content hash.
+
+        The hash is that of the latest result of each dataset.
+        """
+        return {
+            record["id"]: record.get("content_hash") for record in self._iter_records()
+        }
+
+    def pending(self, data_rows):
+        """Filter dataset rows down to those without an up-to-date result (resume mode).
+
+        A dataset is done if its latest stored result was produced from the same
+        metadata, i.e. has the same `content_hash`.
+        """
+        done = self.done_ids()
+        pending = [
+            data
+            for data in data_rows
+            if done.get(str(data["id"])) != content_hash(data)
+        ]
+        print(
+            f"{len(data_rows) - len(pending)} datasets already done, "
+            f"{len(pending)} pending."
+        )
+        return pending
+
+    def wrap(self, fn):
+        """Wrap an analysis function so that each result is stored as soon as it is returned."""
+
+        def checkpointed(data, *args, **kwargs):
+            result = fn(data, *args, **kwargs)
+            self.append(data["id"], result, content_hash(data))
+            return result
+
+        return checkpointed
+
+    def iter_frames(self, chunksize=1000):
+        """Stream the stored results as DataFrames of at most `chunksize` rows.
+
+        The columns are `id` plus those of `parse_instructor_results`. If a dataset
+        was stored more than once, the latest result is kept. The file is read twice,
+        so only the ids are held in memory, not the results.
+        """
+        latest = {
+            record["id"]: line for line, record in enumerate(self._iter_records())
+        }
+        rows = []
+        for line, record in enumerate(self._iter_records()):
+            if latest[record["id"]] != line:
+                continue
+            rows.append({"id": record["id"], **record["result"]})
+            if len(rows) >= chunksize:
+                yield pd.DataFrame(rows, columns=["id"] + RESULT_COLUMNS)
+                rows = []
+        if rows:
+            yield pd.DataFrame(rows, columns=["id"] + RESULT_COLUMNS)
+
+    def load_results(self, chunksize=1000):
+        """Assemble all stored results of this prompt version into one DataFrame."""
+        frames = list(self.iter_frames(chunksize=chunksize))
+        if not frames:
+            return pd.DataFrame(columns=["id"] + RESULT_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
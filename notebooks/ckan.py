@@ -0,0 +1,601 @@
+import glob
+import itertools
+import json
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import requests
+from requests.adapters import HTTPAdapter
+
+# Base URL of the CKAN action API of the Berlin open data portal.
+CKAN_API_BASE = "https://datenregister.berlin.de/api/3/action/"
+MDV_API_LINK = CKAN_API_BASE + "current_package_list_with_resources"
+
+
+# Keys of the CKAN resources kept in the snapshot, including all keys read by
+# `validation.DISTRIBUTION_FIELDS`. Other resource keys are dropped.
+RESOURCE_FIELDS = [
+    "id",
+    "name",
+    "description",
+    "url",
+    "access_url",
+    "download_url",
+    "format",
+    "mimetype",
+    "media_type",
+    "size",
+    "byte_size",
+    "hash",
+    "checksum",
+    "created",
+    "issued",
+    "modified",
+    "last_modified",
+    "metadata_modified",
+    "license",
+    "license_id",
+    "language",
+    "documentation",
+    "rights",
+    "conforms_to",
+    "availability",
+    "planned_availability",
+    "license_attribution_by_text",
+    "compress_format",
+    "package_format",
+    "has_policy",
+    "status",
+    "access_services",
+    "state",
+]
+
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+_TAG = pa.struct([(field, pa.string()) for field in ["name", "display_name", "state"]])
+_RESOURCE = pa.struct([(field, pa.string()) for field in RESOURCE_FIELDS])
+_GROUP = pa.struct([(field, pa.string()) for field in ["name", "title"]])
+_EXTRA = pa.struct([(field, pa.string()) for field in ["key", "value"]])
+
+# Arrow schema of the parquet snapshot. Nested tags and resources are stored as native
+# list<struct> columns, repetitive strings (author, organization, ...) are dictionary
+# encoded and read back as pandas categoricals. Columns of the CKAN payload that are not
+# listed here are kept as well, nested ones as JSON strings.
+PACKAGE_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("name", pa.string()),
+        ("title", pa.string()),
+        ("notes", pa.string()),
+        ("author", _CATEGORY),
+        ("author_email", _CATEGORY),
+        ("maintainer", _CATEGORY),
+        ("maintainer_email", _CATEGORY),
+        ("organization.id", _CATEGORY),
+        ("organization.name", _CATEGORY),
+        ("organization.title", _CATEGORY),
+        ("owner_org", _CATEGORY),
+        ("license_id", _CATEGORY),
+        ("license_title", _CATEGORY),
+        ("geographical_coverage", _CATEGORY),
+        ("geographical_granularity", _CATEGORY),
+        ("temporal_granularity", _CATEGORY),
+        ("berlin_type", _CATEGORY),
+        ("berlin_source", _CATEGORY),
+        ("state", _CATEGORY),
+        ("type", _CATEGORY),
+        ("url", pa.string()),
+        ("version", pa.string()),
+        ("date_released", pa.string()),
+        ("date_updated", pa.string()),
+        ("temporal_coverage_from", pa.string()),
+        ("temporal_coverage_to", pa.string()),
+        ("metadata_created", pa.timestamp("us")),
+        ("metadata_modified", pa.timestamp("us")),
+        ("private", pa.bool_()),
+        ("isopen", pa.bool_()),
+        ("num_resources", pa.int32()),
+        ("num_tags", pa.int32()),
+        ("tags", pa.list_(_TAG)),
+        ("resources", pa.list_(_RESOURCE)),
+        ("groups", pa.list_(_GROUP)),
+        ("extras", pa.list_(_EXTRA)),
+    ]
+)
+
+# The columns needed for triage, clustering, the LLM analysis and the export.
+# `read_snapshot` reads only these by default; `resources` is read separately for the
+# distribution validation.
+ANALYSIS_COLUMNS = [
+    "id",
+    "name",
+    "title",
+    "notes",
+    "tags",
+    "geographical_coverage",
+    "geographical_granularity",
+    "author",
+    "organization.title",
+]
+
+
+def _is_null(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _nested_records(value, struct):
+    """Turn a list of dicts (or its JSON string) into records matching a struct type."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    if _is_null(value):
+        return None
+    names = struct.names
+    return [
+        {
+            name: None if _is_null(item.get(name)) else str(item.get(name))
+            for name in names
+        }
+        for item in value
+    ]
+
+
+def _conform_column(values, type_):
+    """Convert a pandas column so that Arrow can build it with type `type_`."""
+    if pa.types.is_list(type_):
+        return values.map(
+            lambda value: _nested_records(value, type_.value_type),
+            na_action="ignore",
+        ).astype(object)
+    if pa.types.is_timestamp(type_):
+        values = pd.to_datetime(values, format="ISO8601", utc=True)
+        return values.dt.tz_localize(None).astype("datetime64[us]")
+    if pa.types.is_string(type_) or pa.types.is_dictionary(type_):
+        return values.astype(object).map(str, na_action="ignore")
+    return values
+
+
+def _nested_types(type_):
+    """Keep list columns Arrow-backed in pandas instead of building Python dicts."""
+    return pd.ArrowDtype(type_) if pa.types.is_list(type_) else None
+
+
+def package_table(data):
+    """Convert flattened packages into an Arrow table with PACKAGE_SCHEMA.
+
+    Missing schema columns are filled with nulls. Columns that are not part of the
+    schema are appended, nested values serialized as JSON strings.
+    """
+    data = data.reset_index(drop=True)
+    columns = {}
+    for field in PACKAGE_SCHEMA:
+        if field.name in data.columns:
+            values = data[field.name]
+            if isinstance(values.dtype, pd.ArrowDtype):
+                columns[field.name] = arrow_array(values).cast(field.type)
+                continue
+            values = _conform_column(values, field.type)
+            if pa.types.is_dictionary(field.type):
+                array = pa.array(values, type=pa.string(), from_pandas=True)
+                columns[field.name] = array.dictionary_encode()
+            else:
+                columns[field.name] = pa.array(
+                    values, type=field.type, from_pandas=True
+                )
+        else:
+            columns[field.name] = pa.nulls(len(data), type=field.type)
+    table = pa.table(columns, schema=PACKAGE_SCHEMA)
+
+    for name in data.columns.difference(PACKAGE_SCHEMA.names, sort=False):
+        values = data[name]
+        if values.dtype == object:
+            values = values.map(
+                lambda value: (
+                    json.dumps(value, ensure_ascii=False)
+                    if isinstance(value, (list, dict))
+                    else str(value)
+                ),
+                na_action="ignore",
+            )
+        table = table.append_column(name, pa.array(values, from_pandas=True))
+    return table
+
+
+def flatten_packages(packages):
+    """Flatten raw CKAN package dicts into a DataFrame typed like the parquet snapshot.
+
+    Args:
+        packages (list): Package dicts as returned by the CKAN API.
+
+    Returns:
+        pd.DataFrame: One row per package. Tags and resources are Arrow-backed list
+            columns, author and organization columns are categoricals.
+    """
+    return package_table(pd.json_normalize(packages)).to_pandas(
+        types_mapper=_nested_types
+    )
+
+
+def write_snapshot(data, path):
+    """Write flattened packages to a parquet file with PACKAGE_SCHEMA."""
+    pq.write_table(package_table(data), path)
+
+
+def read_snapshot(path, columns=ANALYSIS_COLUMNS):
+    """Read the parquet snapshot, by default only the ANALYSIS_COLUMNS.
+
+    Args:
+        path (str): Location of the parquet snapshot.
+        columns (list): Columns to read. None reads all columns. Columns that are not
+            in the file (e.g. in older snapshots) are skipped.
+
+    Returns:
+        pd.DataFrame: The snapshot. Dictionary-encoded columns become categoricals,
+            list columns (tags, resources, ...) stay Arrow-backed.
+    """
+    if columns is not None:
+        available = set(pq.read_schema(path).names)
+        columns = [column for column in columns if column in available]
+    return pq.read_table(path, columns=columns).to_pandas(types_mapper=_nested_types)
+
+
+def arrow_array(values):
+    """Return the data of an Arrow-backed pandas column as one contiguous Arrow array."""
+    array = pa.array(values.array)
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return array
+
+
+def active_tag_names(tags):
+    """Return the names of the active tags for a whole `tags` column at once.
+
+    Arrow-backed columns (see `read_snapshot`) are flattened without creating Python
+    dicts; other columns fall back to `extract_active_names` row by row.
+
+    Returns:
+        pd.Series: A list of tag names per package, indexed like `tags`.
+    """
+    if not isinstance(tags.dtype, pd.ArrowDtype):
+        return tags.map(extract_active_names)
+    array = arrow_array(tags)
+    flat = pc.list_flatten(array)
+    is_active = pc.equal(flat.field("state"), "active")
+    names = flat.field("name").filter(is_active).to_pylist()
+    # Parent indices are sorted, so the names of each package are one contiguous slice.
+    counts = np.bincount(
+        pc.list_parent_indices(array).filter(is_active).to_numpy(),
+        minlength=len(tags),
+    )
+    ends = np.cumsum(counts)
+    return pd.Series(
+        [names[end - count : end] for end, count in zip(ends, counts)],
+        index=tags.index,
+    )
+
+
+def extract_active_names(tag_entry):
+    """Return the names of the active tags of a package (tags as JSON string or list)."""
+    tag_list = json.loads(tag_entry) if isinstance(tag_entry, str) else tag_entry
+    if tag_list is None:
+        return []
+    return [tag["name"] for tag in tag_list if tag["state"] == "active"]
+
+
+def get_full_package_list(limit=500, sleep=2, api_link=MDV_API_LINK, session=None):
+    """Get full package list from CKAN API"""
+    http = session or requests
+    offset = 0
+    packages = []
+    while True:
+        print(f"{offset} packages retrieved.")
+        url = api_link + f"?limit={limit}&offset={offset}"
+        res = http.get(url)
+        data = res.json()
+        if data["result"] == []:
+            break
+        packages.extend(data["result"])
+        offset += limit
+        time.sleep(sleep)
+
+    return flatten_packages(packages)
+
+
+def get_modified_packages(
+    since, rows=1000, sleep=1, api_base=CKAN_API_BASE, session=None
+):
+    """Get all packages whose `metadata_modified` is at or after `since`.
+
+    Args:
+        since (str): ISO timestamp as stored in the `metadata_modified` column.
+        rows (int): Page size for `package_search`.
+        sleep (int): Seconds to wait between pages.
+        api_base (str): Base URL of the CKAN action API.
+        session (requests.Session): Session used for the requests, e.g. one with
+            politeness limits (see `portals.polite_session`).
+
+    Returns:
+        list: Raw package dicts.
+    """
+    http = session or requests
+    since = pd.Timestamp(since).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    start = 0
+    packages = []
+    while True:
+        res = http.get(
+            api_base + "package_search",
+            params={
+                "fq": f"metadata_modified:[{since} TO *]",
+                "sort": "metadata_modified asc",
+                "rows": rows,
+                "start": start,
+            },
+        )
+        result = res.json()["result"]
+        packages.extend(result["results"])
+        start += rows
+        if start >= result["count"] or not result["results"]:
+            break
+        time.sleep(sleep)
+    return packages
+
+
+def get_package_names(api_base=CKAN_API_BASE, session=None):
+    """Get the names of all packages currently published in the catalogue."""
+    res = (session or requests).get(api_base + "package_list")
+    return set(res.json()["result"])
+
+
+def sync_package_list(
+    path, api_base=CKAN_API_BASE, sleep=2, session=None, max_workers=4
+):
+    """Incrementally sync a local parquet snapshot of the catalogue.
+
+    The newest `metadata_modified` in the stored snapshot is used as a watermark.
+    Only packages modified since then are fetched and merged into the snapshot by
+    `id`. Packages that are no longer listed by the portal are removed. If no
+    snapshot exists yet, the full catalogue is crawled concurrently with
+    `fetch_package_pages` instead.
+
+    Args:
+        path (str): Location of the parquet snapshot. It is updated in place.
+        api_base (str): Base URL of the CKAN action API.
+        sleep (int): Seconds to wait between pages of the incremental sync. The full
+            crawl honours the server's back-pressure instead.
+        session (requests.Session): Session used for the requests. Defaults to a
+            new connection per request, and to a pooled session for the full crawl.
+        max_workers (int): Maximum number of concurrent page requests of the full
+            crawl.
+
+    Returns:
+        tuple: The updated DataFrame and a dict with the lists of `new`, `changed`
+            and `deleted` dataset ids.
+    """
+    if not os.path.exists(path):
+        # The pages are streamed to part files next to the snapshot and combined once
+        # the crawl is complete, so the raw pages are never all held in memory.
+        pages = path + ".pages"
+        fetch_package_pages(
+            pages, max_workers=max_workers, api_base=api_base, session=session
+        )
+        write_snapshot(read_package_pages(pages), path)
+        shutil.rmtree(pages)
+        data = read_snapshot(path, columns=None)
+        return data, {"new": data["id"].tolist(), "changed": [], "deleted": []}
+
+    snapshot = read_snapshot(path, columns=None)
+    watermark = snapshot["metadata_modified"].max()
+    print(f"Fetching packages modified since {watermark}.")
+
+    modified = get_modified_packages(
+        watermark, sleep=sleep, api_base=api_base, session=session
+    )
+    updates = flatten_packages(modified) if modified else snapshot.iloc[0:0]
+
+    previous = snapshot.set_index("id")["metadata_modified"]
+    is_known = updates["id"].isin(previous.index)
+    new_ids = updates.loc[~is_known, "id"].tolist()
+    changed_ids = updates.loc[
+        is_known
+        & (
+            updates["metadata_modified"].values
+            != previous.reindex(updates["id"]).values
+        ),
+        "id",
+    ].tolist()
+
+    data = pd.concat(
+        [snapshot[~snapshot["id"].isin(updates["id"])], updates], ignore_index=True
+    )
+
+    # Packages that were deleted or made private no longer show up in package_list.
+    current_names = get_package_names(api_base=api_base, session=session)
+    is_deleted = ~data["name"].isin(current_names)
+    deleted_ids = data.loc[is_deleted, "id"].tolist()
+    data = data[~is_deleted].reset_index(drop=True)
+
+    write_snapshot(data, path)
+    data = read_snapshot(path, columns=None)
+    print(
+        f"{len(new_ids)} new, {len(changed_ids)} changed and {len(deleted_ids)} deleted packages."
+    )
+    return data, {"new": new_ids, "changed": changed_ids, "deleted": deleted_ids}
+
+
+def make_session(pool_size=8):
+    """Create a requests session that keeps up to `pool_size` connections open per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_json(session, url, params=None, max_retries=5, backoff=1, timeout=60):
+    """GET a CKAN API url and return the decoded JSON.
+
+    Instead of sleeping a fixed time between requests, the server's back-pressure is
+    honoured: on 429 or 503 the request is retried after the number of seconds given
+    in `Retry-After`, or with exponential backoff if the header is missing.
+    """
+    for attempt in range(max_retries + 1):
+        res = session.get(url, params=params, timeout=timeout)
+        if res.status_code in (429, 503) and attempt < max_retries:
+            retry_after = res.headers.get("Retry-After", "")
+            wait = (
+                float(retry_after)
+                if retry_after.replace(".", "", 1).isdigit()
+                else backoff * 2**attempt
+            )
+            print(f"Server busy ({res.status_code}), retrying in {wait:.1f}s.")
+            time.sleep(wait)
+            continue
+        res.raise_for_status()
+        return res.json()
+
+
+def fetch_package_pages(
+    path, limit=500, max_workers=4, api_base=CKAN_API_BASE, session=None
+):
+    """Fetch the full catalogue concurrently and stream it into a parquet dataset.
+
+    Pages of `current_package_list_with_resources` are requested by up to
+    `max_workers` threads sharing one pooled session. Each page is written to its own
+    file in the directory `path` as soon as it arrives, so only the pages in flight
+    are held in memory. Use `read_package_pages` to load the result.
+
+    Args:
+        path (str): Directory for the parquet dataset. Existing part files are replaced.
+        limit (int): Number of packages per page.
+        max_workers (int): Maximum number of concurrent page requests.
+        api_base (str): Base URL of the CKAN action API.
+        session (requests.Session): Session shared by the threads, e.g. a
+            `portals.PoliteSession`. Defaults to a new pooled session.
+
+    Returns:
+        int: Number of packages written.
+    """
+    os.makedirs(path, exist_ok=True)
+    for part in glob.glob(os.path.join(path, "part-*.parquet")):
+        os.remove(part)
+
+    own_session = session is None
+    if own_session:
+        session = make_session(pool_size=max_workers)
+    count = get_json(session, api_base + "package_search", params={"rows": 0})[
+        "result"
+    ]["count"]
+    # One extra page picks up packages that were added while crawling.
+    offsets = range(0, count + limit, limit)
+    print(f"Fetching {count} packages in {len(offsets)} pages.")
+
+    def fetch_page(offset):
+        data = get_json(
+            session,
+            api_base + "current_package_list_with_resources",
+            params={"limit": limit, "offset": offset},
+        )
+        return data["result"]
+
+    # At most `max_workers` pages are requested or waiting to be written at a time, and
+    # each future is dropped as soon as its page is written, so the raw pages of the
+    # whole catalogue are never held in memory.
+    offsets = iter(offsets)
+    written = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(fetch_page, offset): offset
+            for offset in itertools.islice(offsets, max_workers)
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            while done:
+                future = done.pop()
+                offset = pending.pop(future)
+                packages = future.result()
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    pending[executor.submit(fetch_page, next_offset)] = next_offset
+                if not packages:
+                    continue
+                page = package_table(pd.json_normalize(packages))
+                pq.write_table(page, os.path.join(path, f"part-{offset:08d}.parquet"))
+                written += page.num_rows
+                print(f"{written} packages retrieved.")
+    if own_session:
+        session.close()
+    return written
+
+
+def read_package_pages(path, columns=None):
+    """Read a parquet dataset written by `fetch_package_pages` into one DataFrame.
+
+    Pages can differ in their columns, so the schemas of all part files are unified
+    before reading. Packages that appear on two pages (because the catalogue changed
+    during the crawl) are kept once. An empty catalogue gives an empty DataFrame
+    with the columns of PACKAGE_SCHEMA.
+    """
+    files = sorted(glob.glob(os.path.join(path, "part-*.parquet")))
+    if not files:
+        empty = PACKAGE_SCHEMA.empty_table()
+        return empty.select(columns or empty.column_names).to_pandas(
+            types_mapper=_nested_types
+        )
+    schema = pa.unify_schemas(
+        [pq.read_schema(file) for file in files], promote_options="permissive"
+    )
+    data = (
+        ds.dataset(files, schema=schema)
+        .to_table(columns=columns)
+        .to_pandas(types_mapper=_nested_types)
+    )
+    return data.drop_duplicates(subset="id", keep="last").reset_index(drop=True)
+
+
+def read_partitioned_snapshot(data_dir, key, values=None, columns=ANALYSIS_COLUMNS):
+    """Read snapshots stored in hive-style folders `<data_dir>/<key>=<value>/`.
+
+    The snapshots can differ in their columns, so their schemas are unified first.
+
+    Args:
+        data_dir (str): Root folder of the partitioned store.
+        key (str): Partition key; it becomes a categorical column.
+        values (list): Partitions to read. None reads all of them.
+        columns (list): Columns to read. None reads all columns. Columns that are
+            in none of the snapshots are skipped.
+
+    Returns:
+        pd.DataFrame: The rows of all partitions with a new RangeIndex.
+    """
+    files = sorted(glob.glob(os.path.join(data_dir, f"{key}=*", "*.parquet")))
+    if values is not None:
+        files = [
+            file
+            for file in files
+            if os.path.basename(os.path.dirname(file)).removeprefix(f"{key}=")
+            in set(values)
+        ]
+    if not files:
+        raise FileNotFoundError(f"No snapshots found in {data_dir}.")
+    schema = pa.unify_schemas(
+        [pq.read_schema(file) for file in files], promote_options="permissive"
+    ).append(pa.field(key, pa.string()))
+    if columns is not None:
+        columns = [column for column in columns if column in schema.names]
+        columns += [] if key in columns else [key]
+    partitioning = ds.partitioning(pa.schema([schema.field(key)]), flavor="hive")
+    data = (
+        ds.dataset(
+            files, schema=schema, partitioning=partitioning, partition_base_dir=data_dir
+        )
+        .to_table(columns=columns)
+        .to_pandas(types_mapper=_nested_types)
+    )
+    data[key] = data[key].astype("category")
+    return data
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import checkpoint
+import utils
+from benchmarks import synthetic_packages
+from ckan import active_tag_names, flatten_packages
+from mock_llm import MockLLMServer
+
+
+def _modified(value):
+    return datetime.fromisoformat(value.rstrip("Z"))
+
+
+class _CKANHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        action = url.path.rsplit("/", 1)[-1]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with server.lock:
+            server.requests.append((action, params))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            status = server.statuses.pop(0) if server.statuses else 200
+        try:
+            time.sleep(server.latency)
+            if status != 200:
+                self.send_response(status)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            body = json.dumps({"result": server.answer(action, params)}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+class StubCKAN(ThreadingHTTPServer):
+    """CKAN action API on localhost serving the package dicts in `packages`.
+
+    `statuses` are answered first, one per request (e.g. 429), and all requests are
+    recorded in `requests` with the highest number of concurrent ones.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, packages, latency=0.0, statuses=()):
+        super().__init__(("127.0.0.1", 0), _CKANHandler)
+        self.packages = list(packages)
+        self.latency = latency
+        self.statuses = list(statuses)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.api_base = f"http://127.0.0.1:{self.server_port}/api/3/action/"
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def answer(self, action, params):
+        if action == "current_package_list_with_resources":
+            offset = int(params.get("offset", 0))
+            return self.packages[offset : offset + int(params.get("limit", 500))]
+        if action == "package_list":
+            return [package["name"] for package in self.packages]
+        if action == "package_search":
+            packages = self.packages
+            if "fq" in params:
+                since = _modified(params["fq"].split("[", 1)[1].split(" TO ")[0])
+                packages = sorted(
+                    (p for p in packages if _modified(p["metadata_modified"]) >= since),
+                    key=lambda p: p["metadata_modified"],
+                )
+            start = int(params.get("start", 0))
+            rows = int(params.get("rows", 10))
+            return {"count": len(packages), "results": packages[start : start + rows]}
+        raise ValueError(action)
+
+    def actions(self):
+        return [action for action, _ in self.requests]
+
+
+@pytest.fixture(autouse=True)
+def few_shots(monkeypatch):
+    """The few-shot file is not part of the repository, so use a fixed example."""
+    for module in (utils, checkpoint):
+        monkeypatch.setattr(module, "load_few_shots", lambda path=None: "Beispiel")
+
+
+@pytest.fixture
+def packages():
+    """30 raw CKAN package dicts shaped like those of the Berlin portal."""
+    return synthetic_packages(30)
+
+
+@pytest.fixture
+def metadata(packages):
+    """The packages as flattened metadata with `formatted_tags`, as in the notebook."""
+    df = flatten_packages(packages)
+    df["formatted_tags"] = active_tag_names(df["tags"])
+    return df
+
+
+@pytest.fixture
+def ckan_server():
+    """Start stub CKAN servers: `ckan_server(packages, latency=0.0, statuses=())`."""
+    servers = []
+
+    def start(packages, **options):
+        server = StubCKAN(packages, **options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def llm_server():
+    """A fast MockLLMServer with the OpenAI clients of `utils` pointed at it."""
+    with MockLLMServer(latency=0.001) as server:
+        utils.configure_client(
+            "openai", base_url=server.openai_url, api_key="mock", max_retries=0
+        )
+        yield server
+    utils.configure_client("openai")
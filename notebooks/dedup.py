@@ -0,0 +1,215 @@
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+# Fields that make up the text of a dataset for the similarity check.
+DEDUP_FIELDS = ["title", "notes", "formatted_tags"]
+# Fields compared between a cluster member and its representative.
+DIFF_FIELDS = [
+    "title",
+    "notes",
+    "formatted_tags",
+    "geographical_coverage",
+    "geographical_granularity",
+    "author",
+]
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN_PATTERN = re.compile(r"\w+")
+_DIGITS = re.compile(r"\d")
+
+
+def _dataset_text(df):
+    """Join the DEDUP_FIELDS of every row into one string."""
+    parts = []
+    for field in DEDUP_FIELDS:
+        values = df[field]
+        if values.map(type).eq(list).any():
+            values = values.map(
+                lambda value: " ".join(value) if isinstance(value, list) else value
+            )
+        parts.append(values.fillna("").astype(str))
+    return pd.concat(parts, axis=1).agg(" ".join, axis=1)
+
+
+def shingles(text, size=3):
+    """Hash the word n-grams of a text into a set of 32 bit integers.
+
+    Digits are replaced by 0, so that datasets from one series that only differ in
+    years or numbers are considered similar.
+    """
+    tokens = _TOKEN_PATTERN.findall(_DIGITS.sub("0", text.lower()))
+    if len(tokens) < size:
+        tokens = tokens + [""] * (size - len(tokens))
+    return {
+        zlib.crc32(" ".join(tokens[i : i + size]).encode("utf-8"))
+        for i in range(len(tokens) - size + 1)
+    }
+
+
+def minhash_signatures(texts, num_perm=128, seed=42):
+    """Compute a MinHash signature of length `num_perm` for every text.
+
+    Returns:
+        np.ndarray: Array of shape (len(texts), num_perm).
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for row, text in enumerate(texts):
+        hashes = np.fromiter(shingles(text), dtype=np.uint64)
+        # Universal hashing (a * x + b) mod p, truncated to 32 bit, for all permutations.
+        permuted = _universal_hash(a, b, hashes) & _MAX_HASH
+        signatures[row] = permuted.min(axis=1)
+    return signatures
+
+
+def _universal_hash(a, b, x):
+    """Compute (a * x + b) mod 2^61 - 1 for all pairs of `a`/`b` and 32 bit `x`.
+
+    a * x has up to 93 bits and would wrap around in uint64. `a` is therefore split
+    into 32 bit halves, and the high product is shifted by 2^32 modulo the Mersenne
+    prime (2^61 = 1), so that no intermediate value exceeds 63 bits.
+
+    Returns:
+        np.ndarray: Array of shape (len(a), len(x)).
+    """
+    low = np.outer(a & _MAX_HASH, x)  # < 2^64
+    high = np.outer(a >> np.uint64(32), x)  # < 2^61
+    # high * 2^32 = (high >> 29) * 2^61 + (high mod 2^29) * 2^32
+    total = (
+        (low & _MERSENNE_PRIME)
+        + (low >> np.uint64(61))
+        + (high >> np.uint64(29))
+        + ((high & np.uint64((1 << 29) - 1)) << np.uint64(32))
+        + b[:, None]
+    )
+    return total % _MERSENNE_PRIME
+
+
+def cluster_datasets(df, threshold=0.8, num_perm=128, bands=16, sample_size=32):
+    """Cluster near-duplicate datasets with MinHash and locality sensitive hashing.
+
+    Datasets whose estimated Jaccard similarity of title, notes and tags reaches
+    `threshold` end up in the same cluster. In every cluster the member most
+    similar to all others is chosen as representative. For large clusters the
+    similarity is estimated against a random sample of members.
+
+    Args:
+        df (pd.DataFrame): The metadata with the DEDUP_FIELDS and an `id` column.
+        threshold (float): Minimum estimated Jaccard similarity.
+        num_perm (int): Length of the MinHash signatures.
+        bands (int): Number of LSH bands. `num_perm` must be divisible by it.
+        sample_size (int): Maximum number of members the representative is
+            compared with.
+
+    Returns:
+        pd.DataFrame: Indexed like `df` with `cluster_id`, `cluster_size`,
+            `representative` (index label), `is_representative` and `similarity`
+            to the representative.
+    """
+    signatures = minhash_signatures(_dataset_text(df).tolist(), num_perm=num_perm)
+    rows = num_perm // bands
+
+    parent = list(range(len(df)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = defaultdict(list)
+        band_signatures = signatures[:, band * rows : (band + 1) * rows]
+        for i, key in enumerate(map(bytes, band_signatures)):
+            buckets[key].append(i)
+        for members in buckets.values():
+            for j in members[1:]:
+                root_i, root_j = find(members[0]), find(j)
+                if root_i != root_j and (
+                    np.mean(signatures[members[0]] == signatures[j]) >= threshold
+                ):
+                    parent[root_j] = root_i
+
+    roots = np.array([find(i) for i in range(len(df))], dtype=np.int64)
+    representative = np.arange(len(df))
+    similarity = np.ones(len(df))
+    # Group the rows by root once instead of scanning all roots for every cluster.
+    order = np.argsort(roots, kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(roots[order])) + 1)
+    rng = np.random.default_rng(0)
+    for members in groups:
+        if len(members) == 1:
+            continue
+        member_signatures = signatures[members]
+        sample = members
+        if len(members) > sample_size:
+            sample = rng.choice(members, size=sample_size, replace=False)
+        # Mean similarity to the sampled members, one member at a time, so memory
+        # stays at one signature per member.
+        score = np.zeros(len(members))
+        for i in sample:
+            score += (member_signatures == signatures[i]).mean(axis=1)
+        best = members[score.argmax()]
+        representative[members] = best
+        similarity[members] = (member_signatures == signatures[best]).mean(axis=1)
+
+    clusters = pd.DataFrame(
+        {
+            "cluster_id": pd.factorize(roots)[0],
+            "representative": df.index[representative],
+            "similarity": similarity,
+        },
+        index=df.index,
+    )
+    clusters["is_representative"] = clusters["representative"] == clusters.index
+    clusters["cluster_size"] = clusters.groupby("cluster_id")["cluster_id"].transform(
+        "size"
+    )
+    print(
+        f"{len(df)} datasets grouped into {clusters['cluster_id'].nunique()} clusters, "
+        f"{(clusters['cluster_size'] > 1).sum()} datasets belong to a series."
+    )
+    return clusters
+
+
+def member_diffs(df, clusters):
+    """List the DIFF_FIELDS in which each member differs from its representative.
+
+    Returns:
+        pd.Series: Comma-separated field names, empty for representatives.
+    """
+    representatives = df.loc[clusters["representative"]]
+    diffs = pd.DataFrame(index=df.index)
+    for field in DIFF_FIELDS:
+        if field in df.columns:
+            diffs[field] = (
+                df[field].astype(str).values != representatives[field].astype(str).values
+            )
+    return diffs.apply(lambda row: ", ".join(row.index[row]), axis=1)
+
+
+def propagate_results(results, df, clusters):
+    """Copy the results of each representative to all members of its cluster.
+
+    Args:
+        results (pd.DataFrame): Analysis results indexed like the representatives in `df`.
+        df (pd.DataFrame): The metadata that was clustered.
+        clusters (pd.DataFrame): Output of `cluster_datasets`.
+
+    Returns:
+        pd.DataFrame: Results for every row of `df`, with `cluster_id`,
+            `representative_id` and `diff_fields` marking the fields in which a member
+            differs from the analyzed representative.
+    """
+    propagated = results.reindex(clusters["representative"]).set_axis(clusters.index)
+    propagated["cluster_id"] = clusters["cluster_id"]
+    propagated["representative_id"] = df.loc[clusters["representative"], "id"].values
+    propagated["diff_fields"] = member_diffs(df, clusters)
+    return propagated
@@ -0,0 +1,262 @@
+import csv
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from utils import CRITERION_LABELS
+
+EXPORT_COLUMNS = [
+    "portal",
+    "id",
+    "link",
+    "organization.title",
+    "title",
+    "notes",
+    "formatted_tags",
+    "geographical_coverage",
+    "geographical_granularity",
+    "author",
+    "dateninhalt",
+    "dateninhalt_score",
+    "methodik",
+    "methodik_score",
+    "datenqualitaet",
+    "datenqualitaet_score",
+    "geographie",
+    "geographie_score",
+    "tag_qualitaet",
+    "tag_qualitaet_score",
+    "referenz",
+    "referenz_score",
+    "cluster_id",
+    "diff_fields",
+]
+
+# Default folder of the output files, next to this module.
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_results")
+
+# Columns the score distributions are computed for, mapped to the name of their table.
+AGGREGATE_BY = {
+    "portal": "portale",
+    "organization.title": "organisationen",
+    "author": "autoren",
+}
+
+# Excel refuses cells longer than this.
+MAX_CELL_LENGTH = 32_767
+
+
+def _flat_text(values):
+    """Join list values (tags, diff fields) so that they fit into one cell."""
+    if values.map(type).isin([list, np.ndarray]).any():
+        values = values.map(
+            lambda value: (
+                ", ".join(map(str, value))
+                if isinstance(value, (list, np.ndarray))
+                else value
+            )
+        )
+    return values
+
+
+def export_table(df, columns=EXPORT_COLUMNS):
+    """Select the export columns and flatten list values. Missing columns are skipped."""
+    table = df[[column for column in columns if column in df.columns]].copy()
+    for column in table.columns:
+        if table[column].dtype == object:
+            table[column] = _flat_text(table[column])
+    return table.reset_index(drop=True)
+
+
+def score_aggregates(df, by=None):
+    """Score distribution per group and criterion, computed in one grouped pass.
+
+    The six score columns are stacked into a long table first, so all criteria are
+    counted by a single groupby instead of one per criterion.
+
+    Args:
+        df (pd.DataFrame): Results with the `<criterion>_score` columns.
+        by (str): Column to group by, e.g. "organization.title". None gives the
+            distribution over the whole catalogue.
+
+    Returns:
+        pd.DataFrame: One row per group and criterion with the number of scored
+            datasets, the mean score, the count and share of each score and the
+            number of datasets without a score.
+    """
+    score_columns = [f"{criterion}_score" for criterion in CRITERION_LABELS]
+    scores = df[score_columns].apply(pd.to_numeric)
+    long = pd.DataFrame(
+        {
+            "criterion": np.tile(list(CRITERION_LABELS), len(df)),
+            "score": scores.to_numpy(dtype=float, na_value=np.nan).ravel(),
+        }
+    )
+    group = ["criterion"]
+    if by is not None:
+        keys = df[by].astype(object).fillna("(ohne Angabe)").to_numpy()
+        long.insert(0, by, np.repeat(keys, len(CRITERION_LABELS)))
+        group = [by, "criterion"]
+    for score in (1, 2, 3):
+        long[f"n_{score}"] = long["score"] == score
+    long["unscored"] = long["score"].isna()
+    grouped = long.groupby(group, sort=False).agg(
+        n=("score", "count"),
+        mean_score=("score", "mean"),
+        n_1=("n_1", "sum"),
+        n_2=("n_2", "sum"),
+        n_3=("n_3", "sum"),
+        unscored=("unscored", "sum"),
+    )
+    for score in (1, 2, 3):
+        grouped[f"share_{score}"] = grouped[f"n_{score}"] / grouped["n"].where(
+            grouped["n"] > 0
+        )
+    return grouped.reset_index()
+
+
+def aggregate_tables(df, by=AGGREGATE_BY):
+    """Compute the catalogue-wide and the per-group score distributions.
+
+    Returns:
+        dict: The table `kriterien` and one table per entry of `by`, keyed by name.
+    """
+    tables = {"kriterien": score_aggregates(df)}
+    for column, name in by.items():
+        if column in df.columns:
+            tables[name] = score_aggregates(df, by=column)
+    return tables
+
+
+def _cell_values(table, chunksize):
+    """Yield rows of Excel-safe cell values, converting one chunk at a time."""
+    for start in range(0, len(table), chunksize):
+        chunk = table.iloc[start : start + chunksize].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        for column in chunk.columns:
+            if not pd.api.types.is_numeric_dtype(table[column]):
+                chunk[column] = chunk[column].map(
+                    lambda value: (
+                        ILLEGAL_CHARACTERS_RE.sub("", value)[:MAX_CELL_LENGTH]
+                        if isinstance(value, str)
+                        else value
+                    )
+                )
+        yield from chunk.itertuples(index=False, name=None)
+
+
+def write_xlsx(sheets, path, chunksize=10_000):
+    """Write tables to an Excel file in streaming (write-only) mode.
+
+    openpyxl's write-only mode keeps no cell objects in memory, so the memory use
+    does not grow with the number of rows. Control characters, which Excel does not
+    allow, are removed, and overlong texts are cut at MAX_CELL_LENGTH.
+
+    Args:
+        sheets (dict): DataFrames keyed by sheet name; the first one is the main table.
+        path (str): The xlsx file.
+        chunksize (int): Rows converted at once.
+    """
+    workbook = Workbook(write_only=True)
+    for name, table in sheets.items():
+        sheet = workbook.create_sheet(title=name[:31])
+        sheet.append([str(column) for column in table.columns])
+        for row in _cell_values(table, chunksize):
+            sheet.append(row)
+    workbook.save(path)
+
+
+def write_parquet(table, path, chunksize=50_000, partition_by=None):
+    """Write a table to parquet in row groups of `chunksize` rows.
+
+    With `partition_by`, `path` becomes a folder with one hive-style subfolder per
+    value of that column (e.g. `portal=berlin/`), readable with `pd.read_parquet`.
+    """
+    schema = pa.Schema.from_pandas(table, preserve_index=False)
+    chunks = (
+        pa.Table.from_pandas(
+            table.iloc[start : start + chunksize], schema=schema, preserve_index=False
+        )
+        for start in range(0, len(table), chunksize)
+    )
+    if partition_by is not None:
+        ds.write_dataset(
+            (batch for chunk in chunks for batch in chunk.to_batches()),
+            path,
+            schema=schema,
+            format="parquet",
+            partitioning=[partition_by],
+            partitioning_flavor="hive",
+            existing_data_behavior="delete_matching",
+        )
+        return
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(chunk)
+
+
+def write_csv(table, path, chunksize=50_000):
+    """Write a table to CSV (UTF-8 with BOM, so that Excel detects the encoding)."""
+    table.to_csv(
+        path,
+        index=False,
+        encoding="utf-8-sig",
+        quoting=csv.QUOTE_NONNUMERIC,
+        chunksize=chunksize,
+    )
+
+
+def export_results(
+    df_final,
+    output_dir=RESULTS_DIR,
+    formats=("xlsx",),
+    columns=EXPORT_COLUMNS,
+    timestamp=None,
+):
+    """Write the combined metadata and results, and the score distributions.
+
+    The xlsx file has the datasets on the first sheet and one sheet per aggregate
+    table. Parquet and CSV get one file per table. If the results come from several
+    portals, the parquet datasets are partitioned by `portal`.
+
+    Args:
+        df_final (pd.DataFrame): The metadata combined with the analysis results.
+        output_dir (str): Folder of the output files.
+        formats (tuple): Any of "xlsx", "parquet" and "csv".
+        columns (list): Columns of the dataset table.
+        timestamp (str): Part of the file names. Defaults to the current date.
+
+    Returns:
+        dict: Written paths keyed by format.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d")
+    base = os.path.join(output_dir, f"metadata_analysis_{timestamp}")
+    sheets = {"datensaetze": export_table(df_final, columns)}
+    sheets.update(aggregate_tables(df_final))
+
+    paths = {}
+    for fmt in formats:
+        if fmt == "xlsx":
+            paths[fmt] = [base + ".xlsx"]
+            write_xlsx(sheets, base + ".xlsx")
+            continue
+        paths[fmt] = []
+        for name, table in sheets.items():
+            path = base + ("" if name == "datensaetze" else f"_{name}") + f".{fmt}"
+            if fmt == "csv":
+                write_csv(table, path)
+            elif name == "datensaetze" and "portal" in table.columns:
+                write_parquet(table, path, partition_by="portal")
+            else:
+                write_parquet(table, path)
+            paths[fmt].append(path)
+    print(f"Saved {len(df_final)} datasets to: {', '.join(sum(paths.values(), []))}")
+    return paths
@@ -0,0 +1,285 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORDS = (
+    "Die Beschreibung nennt weder Quelle noch Methodik der Erhebung und der Titel "
+    "ist nur teilweise aussagekräftig während die Tags den Inhalt gut abdecken"
+).split()
+
+# Sections of the tagged (non-instructor) answer format, see `parse_analysis_results`.
+_TAGS = [
+    "dateninhalt",
+    "methodik",
+    "datenqualität",
+    "geographie",
+    "tag-qualität",
+    "referenz",
+]
+
+_DATASET_ID = re.compile(r'<datensatz id="([^"]+)">')
+
+
+def _text(rng, min_words=20, max_words=60):
+    return " ".join(rng.choices(_WORDS, k=rng.randint(min_words, max_words)))
+
+
+def fake_instance(schema, rng, defs=None, dataset_ids=None):
+    """Build a random value that validates against a JSON schema.
+
+    Only the subset of JSON schema produced by pydantic for the response models of
+    this project is supported. Arrays of objects with a `dataset_id` property get one
+    item per id in `dataset_ids`, so batched prompts are answered completely.
+    """
+    defs = schema.get("$defs", defs or {})
+    if "$ref" in schema:
+        return fake_instance(
+            defs[schema["$ref"].rsplit("/", 1)[-1]], rng, defs, dataset_ids
+        )
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if "const" in schema:
+        return schema["const"]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"]
+            return fake_instance(options[0], rng, defs, dataset_ids)
+
+    kind = schema.get("type", "object")
+    if kind == "object":
+        return {
+            name: fake_instance(prop, rng, defs, dataset_ids)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        items = schema.get("items", {})
+        item_schema = defs.get(items.get("$ref", "").rsplit("/", 1)[-1], items)
+        if dataset_ids and "dataset_id" in item_schema.get("properties", {}):
+            return [
+                dict(fake_instance(items, rng, defs), dataset_id=dataset_id)
+                for dataset_id in dataset_ids
+            ]
+        return [
+            fake_instance(items, rng, defs, dataset_ids)
+            for _ in range(rng.randint(schema.get("minItems", 1), 3))
+        ]
+    if kind == "integer":
+        return rng.randint(schema.get("minimum", 1), schema.get("maximum", 3))
+    if kind == "number":
+        return rng.uniform(schema.get("minimum", 0), schema.get("maximum", 1))
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return _text(rng)
+
+
+def fake_tagged_answer(rng):
+    """Build a random answer in the tagged format of PROMPT_ANALYSIS."""
+    sections = []
+    for tag in _TAGS:
+        sections.append(f"<{tag}>\n{_text(rng)}\n</{tag}>")
+        sections.append(f"<{tag}-score>{rng.randint(1, 3)}</{tag}-score>")
+    return "\n".join(sections)
+
+
+class MockLLMServer:
+    """Local stand-in for the OpenAI and Mistral chat completion APIs.
+
+    Answers `POST .../chat/completions` with random but schema-valid payloads: tool
+    calls for instructor requests, JSON for `response_format` requests and tagged
+    text otherwise. Latency, server errors and rate limiting are simulated, so the
+    real pipeline can be benchmarked without spending money.
+
+    Point the clients at it with `utils.configure_client`:
+
+        with MockLLMServer(latency=0.5) as server:
+            configure_client("openai", base_url=server.openai_url, api_key="mock")
+            configure_client("mistral", base_url=server.url, api_key="mock")
+
+    Args:
+        latency (float): Median seconds until the first token (log-normal).
+        latency_sigma (float): Shape of the log-normal latency distribution.
+        tokens_per_second (float): Generation speed. None adds no generation time.
+        error_rate (float): Share of requests answered with HTTP 500.
+        rpm (int): Requests per minute before answering with 429 and `Retry-After`.
+            None disables rate limiting.
+        seed (int): Seed for latencies, errors and payloads.
+        port (int): Port to listen on. 0 picks a free port.
+    """
+
+    def __init__(
+        self,
+        latency=0.5,
+        latency_sigma=0.5,
+        tokens_per_second=None,
+        error_rate=0.0,
+        rpm=None,
+        seed=42,
+        port=0,
+    ):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = deque()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_url(self):
+        return self.url + "/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _admit(self):
+        """Decide the fate of a request: (status, retry_after, latency, rng seed)."""
+        with self._lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            if self.rpm is not None:
+                while self._window and now - self._window[0] >= 60:
+                    self._window.popleft()
+                if len(self._window) >= self.rpm:
+                    self.stats["rate_limited"] += 1
+                    return 429, 60 - (now - self._window[0]), 0, None
+                self._window.append(now)
+            if self._rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500, None, 0, None
+            latency = self._rng.lognormvariate(
+                math.log(self.latency), self.latency_sigma
+            )
+            return 200, None, latency, self._rng.getrandbits(32)
+
+    def _completion(self, request, rng):
+        messages = request.get("messages", [])
+        prompt = " ".join(str(message.get("content", "")) for message in messages)
+        dataset_ids = _DATASET_ID.findall(prompt)
+        message = {"role": "assistant", "content": None}
+        tools = request.get("tools")
+        response_format = request.get("response_format") or {}
+        if tools:
+            function = tools[0]["function"]
+            arguments = json.dumps(
+                fake_instance(function["parameters"], rng, dataset_ids=dataset_ids),
+                ensure_ascii=False,
+            )
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{rng.getrandbits(32):08x}",
+                    "type": "function",
+                    "function": {"name": function["name"], "arguments": arguments},
+                }
+            ]
+            finish_reason = "tool_calls"
+            completion = arguments
+        elif "json_schema" in response_format:
+            completion = json.dumps(
+                fake_instance(
+                    response_format["json_schema"]["schema"],
+                    rng,
+                    dataset_ids=dataset_ids,
+                ),
+                ensure_ascii=False,
+            )
+            message["content"] = completion
+            finish_reason = "stop"
+        else:
+            completion = fake_tagged_answer(rng)
+            message["content"] = completion
+            finish_reason = "stop"
+
+        prompt_tokens = math.ceil(len(prompt) / 4)
+        completion_tokens = math.ceil(len(completion) / 4)
+        return {
+            "id": f"chatcmpl-{rng.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [
+                {"index": 0, "message": message, "finish_reason": finish_reason}
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, headers=None):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": "not found"}})
+                    return
+                status, retry_after, latency, seed = server._admit()
+                if status == 429:
+                    self._send(
+                        429,
+                        {
+                            "error": {
+                                "message": "Rate limit reached",
+                                "type": "requests",
+                            }
+                        },
+                        {"Retry-After": f"{retry_after:.1f}"},
+                    )
+                    return
+                if status == 500:
+                    self._send(500, {"error": {"message": "Internal server error"}})
+                    return
+                payload = server._completion(request, random.Random(seed))
+                if server.tokens_per_second:
+                    latency += (
+                        payload["usage"]["completion_tokens"] / server.tokens_per_second
+                    )
+                time.sleep(latency)
+                self._send(200, payload)
+
+        return Handler
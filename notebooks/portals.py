@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from ckan import (
+    ANALYSIS_COLUMNS,
+    CKAN_API_BASE,
+    read_partitioned_snapshot,
+    sync_package_list,
+)
+
+# CKAN (DCAT-AP.de) portals that can be harvested. `api_base` is the base URL of the
+# CKAN action API, dataset links are `dataset_url` + the dataset name. Add further
+# portals here or with `register_portal` / `load_portals`.
+PORTALS = {
+    "berlin": {
+        "api_base": CKAN_API_BASE,
+        "dataset_url": "https://daten.berlin.de/datensaetze/",
+    },
+}
+
+# Portal of the single-catalogue mode (`DATA_PATH` in the notebook, `--data-path` in
+# run_pipeline.py). Its ids are kept unqualified in the multi-portal mode as well, so
+# that checkpoints and the score model are shared between both modes.
+DEFAULT_PORTAL = "berlin"
+
+# Politeness limits per host: connections kept open and requests sent per second.
+# Portals on the same host share one connection pool and one limit.
+DEFAULT_HOST_LIMITS = {"max_connections": 4, "requests_per_second": 2.0}
+HOST_LIMITS = {}
+
+# Partitioned store of the harvested snapshots: one `portal=<name>` folder per portal.
+PORTAL_DATA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "_data", "portals"
+)
+
+
+def register_portal(name, api_base, dataset_url=None):
+    """Add a CKAN portal to PORTALS, or replace the entry of the same name."""
+    if not api_base.endswith("/"):
+        api_base += "/"
+    PORTALS[name] = {"api_base": api_base, "dataset_url": dataset_url}
+    return PORTALS[name]
+
+
+def load_portals(path):
+    """Register the portals of a JSON file with the structure of PORTALS.
+
+    Returns:
+        list: The names of the registered portals, in file order.
+    """
+    with open(path, encoding="utf-8") as file:
+        portals = json.load(file)
+    for name, portal in portals.items():
+        register_portal(name, portal["api_base"], portal.get("dataset_url"))
+    return list(portals)
+
+
+def portal_host(name):
+    """Host (and port) of the API of a portal, the unit of the politeness limits."""
+    return urlsplit(PORTALS[name]["api_base"]).netloc
+
+
+def portal_path(name, data_dir=PORTAL_DATA_DIR):
+    """Location of the parquet snapshot of a portal in the partitioned store."""
+    return os.path.join(data_dir, f"portal={name}", "metadata.parquet")
+
+
+class HostLimiter:
+    """Politeness limits for one host.
+
+    At most `max_connections` requests are in flight at once, and request starts
+    are spaced at least 1 / `requests_per_second` seconds apart.
+
+    Args:
+        max_connections (int): Maximum number of concurrent requests.
+        requests_per_second (float): Maximum request rate.
+    """
+
+    def __init__(self, max_connections=4, requests_per_second=2.0):
+        self.max_connections = max_connections
+        self.interval = 1 / requests_per_second
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._next_start = time.monotonic()
+
+    def __enter__(self):
+        self._slots.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._slots.release()
+
+
+class PoliteSession(requests.Session):
+    """Requests session that sends every request within the limits of a HostLimiter."""
+
+    def __init__(self, limiter):
+        super().__init__()
+        self.limiter = limiter
+        adapter = HTTPAdapter(
+            pool_connections=limiter.max_connections,
+            pool_maxsize=limiter.max_connections,
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, *args, **kwargs):
+        with self.limiter:
+            return super().request(*args, **kwargs)
+
+
+def polite_session(host):
+    """Create a pooled session with the politeness limits of `host` (see HOST_LIMITS)."""
+    return PoliteSession(
+        HostLimiter(**{**DEFAULT_HOST_LIMITS, **HOST_LIMITS.get(host, {})})
+    )
+
+
+def harvest_portals(
+    names=None, data_dir=PORTAL_DATA_DIR, max_workers=4, full_refresh=False
+):
+    """Sync the snapshots of several portals concurrently into the partitioned store.
+
+    Each portal is synced incrementally by `sync_package_list` in its own thread.
+    All portals on the same host share one `PoliteSession`, so the host's connection
+    pool and politeness limits hold across portals. A portal that fails is reported
+    and skipped; its previous snapshot stays in place.
+
+    Args:
+        names (list): Names of registered portals. Defaults to all of PORTALS.
+        data_dir (str): Root folder of the partitioned store.
+        max_workers (int): Maximum number of portals harvested at once.
+        full_refresh (bool): Discard the stored snapshots and crawl from scratch.
+
+    Returns:
+        dict: The `new`, `changed` and `deleted` dataset ids per harvested portal.
+    """
+    names = list(names or PORTALS)
+    sessions = {}
+    for name in names:
+        host = portal_host(name)
+        if host not in sessions:
+            sessions[host] = polite_session(host)
+
+    def harvest(name):
+        path = portal_path(name, data_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if full_refresh and os.path.exists(path):
+            os.remove(path)
+        # The session paces the requests, so no extra sleep between pages is needed.
+        _, changes = sync_package_list(
+            path,
+            api_base=PORTALS[name]["api_base"],
+            sleep=0,
+            session=sessions[portal_host(name)],
+        )
+        return changes
+
+    changes = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(harvest, name): name for name in names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                changes[name] = future.result()
+            except Exception as e:
+                print(f"Harvesting {name} failed: {type(e).__name__}: {e}")
+                continue
+            print(
+                f"{name}: "
+                + ", ".join(f"{len(ids)} {key}" for key, ids in changes[name].items())
+            )
+    for session in sessions.values():
+        session.close()
+    return changes
+
+
+def read_portals(data_dir=PORTAL_DATA_DIR, names=None, columns=ANALYSIS_COLUMNS):
+    """Read the snapshots of several portals from the partitioned store.
+
+    CKAN ids are only unique within a portal, and the checkpoints, telemetry and
+    score model are keyed by id. Ids are therefore qualified as `<portal>:<id>`,
+    except those of DEFAULT_PORTAL, which keep the ids of the single-catalogue mode.
+
+    Returns:
+        pd.DataFrame: The datasets of all portals with a `portal` column and a new
+            RangeIndex.
+    """
+    data = read_partitioned_snapshot(data_dir, "portal", names, columns)
+    if "id" in data.columns:
+        portal = data["portal"].astype(str)
+        ids = data["id"].astype(str)
+        data["id"] = ids.where(portal == DEFAULT_PORTAL, portal + ":" + ids)
+    return data
+
+
+def dataset_links(df):
+    """Link to every dataset on its portal: the portal's `dataset_url` + the name.
+
+    Rows without a `portal` column belong to DEFAULT_PORTAL. Portals without a
+    `dataset_url` get no link.
+
+    Returns:
+        pd.Series: The links, aligned with `df`.
+    """
+    if "portal" in df.columns:
+        portals = df["portal"].astype(str)
+    else:
+        portals = pd.Series(DEFAULT_PORTAL, index=df.index)
+    base = portals.map(lambda name: PORTALS.get(name, {}).get("dataset_url"))
+    # Missing base URLs or names propagate as NA.
+    return base.astype("string") + df["name"].astype("string")
+
+
+def interleave_portals(df):
+    """Order the rows round-robin across portals.
+
+    All portals share one scheduler and thus one LLM budget. Interleaving them lets
+    every portal progress at the same pace instead of one after the other, so that a
+    `--limit` or an interrupted run covers all portals evenly.
+
+    Returns:
+        pd.Index: The index of `df` in interleaved order.
+    """
+    if "portal" not in df.columns:
+        return df.index
+    rank = df.groupby("portal", observed=True, sort=False).cumcount().to_numpy()
+    return df.index[np.lexsort((pd.factorize(df["portal"])[0], rank))]
@@ -0,0 +1,309 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from scheduler import PROVIDER_LIMITS, TokenBucket, is_rate_limit_error
+from utils import do_full_analysis, do_score_analysis, estimate_analysis_tokens
+
+PROVIDERS = ("openai", "mistral")
+
+
+class CircuitBreaker:
+    """Stop sending requests to a provider after sustained errors.
+
+    The breaker opens after `failure_threshold` consecutive failures. While open, the
+    provider is skipped. After `reset_timeout` seconds one trial request is let
+    through (half-open); it closes the breaker on success and re-opens it on failure.
+
+    Args:
+        name (str): Name of the provider, used in log messages.
+        failure_threshold (int): Consecutive failures that open the breaker.
+        reset_timeout (float): Seconds until a trial request is allowed.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Check whether a request may be sent, reserving the trial when half-open."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or (
+                self.opened_at is None and self.failures >= self.failure_threshold
+            ):
+                print(
+                    f"Circuit breaker for {self.name} opened after "
+                    f"{self.failures} consecutive failures."
+                )
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies of one provider.
+
+    Args:
+        window (int): Number of recent latencies kept.
+        min_samples (int): Samples needed before percentiles are trusted.
+    """
+
+    def __init__(self, window=200, min_samples=20):
+        self.latencies = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def add(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def percentile(self, q, default):
+        """Return the `q`th percentile, or `default` while there are too few samples."""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return default
+            return float(np.percentile(self.latencies, q))
+
+
+class ProviderRouter:
+    """Route each analysis to OpenAI or Mistral with hedging and failover.
+
+    The request goes to the preferred provider first. If it has not answered after
+    the `hedge_percentile` of its recent latencies, a hedge request is sent to the
+    other provider and whichever valid analysis arrives first is used. If
+    a provider fails, the other one is asked right away. Providers with sustained
+    errors are skipped by their `CircuitBreaker` until they recover.
+
+    Python threads cannot be interrupted, so the losing request is not aborted; its
+    result is discarded when it arrives.
+
+    Every provider has its own requests- and tokens-per-minute budget, which hedge
+    and failover requests are charged to as well. Pass `analyze` to
+    `RateLimitedScheduler.map` with `estimate=router.estimate`, so that the scheduler
+    retries and keeps its adaptive concurrency limit, but does not charge the tokens
+    of the preferred provider a second time. Cache hits take no budget and are not
+    counted as calls of the provider.
+
+    Args:
+        preferred (str): Provider asked first while its circuit is closed.
+        cache (AnalysisCache): Optional cache passed on to `do_full_analysis`.
+        scores_only (bool): Use `do_score_analysis` (scores without rationales).
+        limits (dict): `rpm` and `tpm` per provider, overriding PROVIDER_LIMITS.
+        hedge_percentile (float): Latency percentile of the first provider after
+            which the hedge request is sent. None disables hedging (failover only).
+        default_hedge_delay (float): Hedge delay in seconds until enough latencies
+            have been observed.
+        min_hedge_delay (float): Lower bound of the hedge delay in seconds.
+        failure_threshold (int): Consecutive failures that open a circuit breaker.
+        reset_timeout (float): Seconds until an open circuit is tried again.
+        max_workers (int): Threads for the provider calls, including abandoned losers.
+    """
+
+    def __init__(
+        self,
+        preferred="openai",
+        cache=None,
+        scores_only=False,
+        limits=None,
+        hedge_percentile=95,
+        default_hedge_delay=20.0,
+        min_hedge_delay=1.0,
+        failure_threshold=5,
+        reset_timeout=30.0,
+        max_workers=128,
+    ):
+        self.preferred = preferred
+        self.cache = cache
+        self.scores_only = scores_only
+        self.analysis = do_score_analysis if scores_only else do_full_analysis
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.breakers = {
+            provider: CircuitBreaker(provider, failure_threshold, reset_timeout)
+            for provider in PROVIDERS
+        }
+        self.latencies = {provider: LatencyTracker() for provider in PROVIDERS}
+        limits = {
+            provider: {**PROVIDER_LIMITS[provider], **(limits or {}).get(provider, {})}
+            for provider in PROVIDERS
+        }
+        self.budgets = {
+            provider: (
+                TokenBucket(limits[provider]["rpm"]),
+                TokenBucket(limits[provider]["tpm"]),
+            )
+            for provider in PROVIDERS
+        }
+        self.answered_by = {}
+        self.stats = {"hedged": 0, "hedge_wins": 0, "failovers": 0}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _order(self):
+        other = PROVIDERS[1] if self.preferred == PROVIDERS[0] else PROVIDERS[0]
+        return [self.preferred, other]
+
+    def _call(self, provider, data):
+        use_openai = provider == "openai"
+        # 0 means a cache hit: no request is sent, so neither the budget nor the
+        # breaker and latency statistics of the provider are touched.
+        cost = estimate_analysis_tokens(
+            data, use_openai=use_openai, cache=self.cache, scores_only=self.scores_only
+        )
+        if cost:
+            requests, tokens = self.budgets[provider]
+            requests.acquire(1)
+            tokens.acquire(cost)
+        start = time.monotonic()
+        try:
+            result = self.analysis(
+                data, use_openai=use_openai, cache=self.cache, raise_errors=True
+            )
+            if result is None:
+                raise ValueError(f"{provider} returned no analysis")
+        except Exception as e:
+            if cost:
+                self.breakers[provider].record_failure()
+                if is_rate_limit_error(e):
+                    self.budgets[provider][0].drain()
+            raise
+        if cost:
+            self.breakers[provider].record_success()
+            self.latencies[provider].add(time.monotonic() - start)
+        return result
+
+    def estimate(self, data):
+        """Cost of `analyze` for `RateLimitedScheduler.map`: 1 unless the result is cached.
+
+        The tokens are charged to the provider budgets in `analyze`. The scheduler
+        only needs a non-zero cost to hold a concurrency slot while a request runs.
+        """
+        cost = estimate_analysis_tokens(
+            data,
+            use_openai=self.preferred == "openai",
+            cache=self.cache,
+            scores_only=self.scores_only,
+        )
+        return min(cost, 1)
+
+    def _submit(self, provider, data):
+        # Each call gets its own copy of the context, so telemetry keeps the dataset id.
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._call, provider, data)
+
+    def hedge_delay(self, provider):
+        """Seconds to wait for `provider` before sending the hedge request."""
+        delay = self.latencies[provider].percentile(
+            self.hedge_percentile, self.default_hedge_delay
+        )
+        return max(self.min_hedge_delay, delay)
+
+    def _next_provider(self, remaining):
+        """Pop the next provider whose circuit allows a request, or None."""
+        while remaining:
+            provider = remaining.pop(0)
+            if self.breakers[provider].allow():
+                return provider
+        return None
+
+    def analyze(self, data):
+        """Analyze one dataset row. Raises the last error if no provider succeeded.
+
+        Returns:
+            MetadataAnalysis: The first valid analysis (MetadataScores if
+                `scores_only`). The provider that delivered it is stored in
+                `answered_by` under the dataset id.
+        """
+        remaining = self._order()
+        # If all circuits are open, the preferred provider is tried anyway, so that
+        # the scheduler can back off and retry instead of failing immediately.
+        first = self._next_provider(remaining) or self.preferred
+        pending = {self._submit(first, data): first}
+        hedge_at = (
+            time.monotonic() + self.hedge_delay(first)
+            if self.hedge_percentile is not None
+            else None
+        )
+        hedged = False
+        last_error = None
+        while pending:
+            timeout = None
+            if remaining and hedge_at is not None and not hedged:
+                timeout = max(0.0, hedge_at - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                hedged = True
+                provider = self._next_provider(remaining)
+                if provider is not None:
+                    pending[self._submit(provider, data)] = provider
+                    with self._lock:
+                        self.stats["hedged"] += 1
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                # The loser keeps running in the background; its result is ignored.
+                for loser in pending:
+                    loser.cancel()
+                with self._lock:
+                    self.answered_by[str(data["id"])] = provider
+                    if provider != first and hedged:
+                        self.stats["hedge_wins"] += 1
+                return result
+
+            if not pending:
+                provider = self._next_provider(remaining)
+                if provider is not None:
+                    pending[self._submit(provider, data)] = provider
+                    with self._lock:
+                        self.stats["failovers"] += 1
+
+        raise last_error
+
+    def provider_table(self):
+        """Return which provider answered each dataset, indexed by dataset id."""
+        return pd.Series(self.answered_by, name="provider", dtype="object")
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,318 @@
+"""Run the metadata analysis without Jupyter: fetch -> triage -> analyse -> export.
+
+Example (e.g. from cron):
+
+    python notebooks/run_pipeline.py --provider openai --limit 100
+"""
+
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import os
+from datetime import datetime
+from functools import partial
+
+import pandas as pd
+
+from checkpoint import CHECKPOINT_PATH, CheckpointStore, prompt_version
+from ckan import CKAN_API_BASE, active_tag_names, read_snapshot, sync_package_list
+from dedup import cluster_datasets, propagate_results
+from export import RESULTS_DIR, export_results
+from portals import (
+    PORTAL_DATA_DIR,
+    PORTALS,
+    dataset_links,
+    harvest_portals,
+    interleave_portals,
+    load_portals,
+    read_portals,
+)
+from router import ProviderRouter
+from scheduler import AdaptiveConcurrency, RateLimitedScheduler
+from telemetry import CallMetrics, add_hook, remove_hook
+from triage import select_for_llm, triage_metadata, triage_results
+from utils import (
+    ANALYSIS_CACHE_PATH,
+    AnalysisCache,
+    add_rationales,
+    configure_client,
+    do_full_analysis,
+    do_score_analysis,
+    estimate_analysis_tokens,
+    model as mistral_model,
+    openai_model,
+)
+
+# Snapshot of the single catalogue, at the same place as the notebook's DATA_PATH.
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "metadata.parquet")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--api-base", default=CKAN_API_BASE)
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Crawl the whole catalogue instead of syncing the stored snapshot.",
+    )
+    parser.add_argument(
+        "--portals",
+        nargs="+",
+        help="Harvest and analyse these registered portals (see portals.PORTALS) "
+        "in one run, instead of the single catalogue at --api-base.",
+    )
+    parser.add_argument(
+        "--portals-file",
+        help="JSON file with additional portals, structured like portals.PORTALS.",
+    )
+    parser.add_argument("--portal-data-dir", default=PORTAL_DATA_DIR)
+    parser.add_argument(
+        "--harvest-workers",
+        type=int,
+        default=4,
+        help="Maximum number of portals harvested at once.",
+    )
+    parser.add_argument(
+        "--provider",
+        choices=["openai", "mistral", "auto"],
+        default="openai",
+        help="'auto' asks OpenAI first, hedges slow requests to Mistral and fails "
+        "over between them.",
+    )
+    parser.add_argument(
+        "--base-url",
+        help="Base URL of an OpenAI/Mistral-compatible endpoint (not with 'auto').",
+    )
+    parser.add_argument(
+        "--scores-only",
+        action="store_true",
+        help="Fast mode: ask only for the six scores, without the rationales.",
+    )
+    parser.add_argument(
+        "--rationales-max-score",
+        type=int,
+        choices=[1, 2, 3],
+        help="Generate the missing rationales of all scores up to this value "
+        "afterwards, e.g. 1 after a --scores-only run.",
+    )
+    parser.add_argument("--rpm", type=int, help="Requests per minute.")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Initial number of parallel requests.",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=64,
+        help="Upper bound of parallel requests.",
+    )
+    parser.add_argument("--limit", type=int, help="Analyze at most this many datasets.")
+    parser.add_argument("--cache-path", default=ANALYSIS_CACHE_PATH)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--checkpoint-path", default=CHECKPOINT_PATH)
+    parser.add_argument(
+        "--score-model",
+        help="Local score model. Datasets it scores confidently skip the LLM.",
+    )
+    parser.add_argument(
+        "--train-score-model",
+        action="store_true",
+        help="Send all datasets to the LLM, then (re)train the --score-model from "
+        "the stored results and print its agreement with the LLM.",
+    )
+    parser.add_argument("--output-dir", default=RESULTS_DIR)
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=["xlsx", "parquet", "csv"],
+        default=["xlsx"],
+        help="Output formats of the results and the per-publisher score tables.",
+    )
+    parser.add_argument(
+        "--metrics-path",
+        help="JSONL file for the per-call metrics. Defaults to the output directory.",
+    )
+    return parser.parse_args(argv)
+
+
+def fetch(args):
+    """Sync the catalogue snapshot and prepare the fields used by the analysis."""
+    if args.portals:
+        harvest_portals(
+            args.portals,
+            data_dir=args.portal_data_dir,
+            max_workers=args.harvest_workers,
+            full_refresh=args.full_refresh,
+        )
+        df = read_portals(args.portal_data_dir, names=args.portals)
+        df["formatted_tags"] = active_tag_names(df["tags"])
+        df["link"] = dataset_links(df)
+        print(df["portal"].value_counts().to_string())
+        return df
+    if args.full_refresh and os.path.exists(args.data_path):
+        os.remove(args.data_path)
+    _, changes = sync_package_list(args.data_path, api_base=args.api_base)
+    print({key: len(ids) for key, ids in changes.items()})
+    df = read_snapshot(args.data_path)
+    df["formatted_tags"] = active_tag_names(df["tags"])
+    df["link"] = dataset_links(df)
+    return df
+
+
+def analyse(df, args):
+    """Triage, cluster and analyse the datasets. Returns the combined results."""
+    triage = triage_metadata(df)
+    needs_llm = select_for_llm(triage)
+    clusters = cluster_datasets(df[needs_llm])
+    representatives = clusters.index[clusters["is_representative"]]
+    # With several portals, all of them share the scheduler and its rate limits.
+    representatives = interleave_portals(df.loc[representatives])
+    if args.limit is not None:
+        representatives = representatives[: args.limit]
+
+    if args.score_model:
+        # scikit-learn takes a while to import, so only runs with a model load it.
+        from score_model import ScorePredictor, agreement_report, predicted_results
+
+    local = None
+    if args.score_model and not args.train_score_model:
+        predictions = ScorePredictor.load(args.score_model).predict(
+            df.loc[representatives]
+        )
+        local = predicted_results(predictions[predictions["confident"]])
+        print(
+            f"{len(local)} of {len(representatives)} datasets are scored by the "
+            "local model."
+        )
+
+    use_openai = args.provider != "mistral"
+    if args.base_url and args.provider != "auto":
+        configure_client(args.provider, base_url=args.base_url)
+    if args.provider == "auto":
+        model_id = f"{openai_model}+{mistral_model}"
+    else:
+        model_id = openai_model if use_openai else mistral_model
+    store = CheckpointStore(
+        prompt_version(model_id, scores_only=args.scores_only),
+        path=args.checkpoint_path,
+    )
+    to_llm = (
+        representatives
+        if local is None
+        else representatives.difference(local.index, sort=False)
+    )
+    data_rows = store.pending([row for _, row in df.loc[to_llm].iterrows()])
+    cache = None if args.no_cache else AnalysisCache(args.cache_path)
+
+    limits = {
+        key: value for key, value in (("rpm", args.rpm), ("tpm", args.tpm)) if value
+    }
+    estimate = partial(
+        estimate_analysis_tokens,
+        use_openai=use_openai,
+        cache=cache,
+        scores_only=args.scores_only,
+    )
+    if args.provider == "auto":
+        router = ProviderRouter(
+            preferred="openai",
+            cache=cache,
+            scores_only=args.scores_only,
+            limits={"openai": limits},
+        )
+        analyze = router.analyze
+        # The router charges the budget of each provider itself. The scheduler still
+        # limits the number of datasets in flight.
+        estimate = router.estimate
+    else:
+        router = None
+        analyze = partial(
+            do_score_analysis if args.scores_only else do_full_analysis,
+            use_openai=use_openai,
+            cache=cache,
+            raise_errors=True,
+        )
+
+    scheduler = RateLimitedScheduler(
+        provider="openai" if use_openai else "mistral",
+        rpm=args.rpm,
+        tpm=args.tpm,
+        concurrency=AdaptiveConcurrency(
+            initial=args.concurrency, maximum=args.max_concurrency
+        ),
+    )
+    metrics_path = args.metrics_path or os.path.join(
+        args.output_dir, f"metrics_{datetime.now():%Y%m%d}.jsonl"
+    )
+    metrics = add_hook(CallMetrics(metrics_path))
+    scheduler.map(store.wrap(analyze), data_rows, estimate=estimate)
+    stored = store.load_results()
+    results = (
+        df.loc[to_llm, ["id"]]
+        .reset_index()
+        .merge(stored, on="id")
+        .set_index("index")
+        .drop(columns="id")
+    )
+    if args.rationales_max_score is not None:
+        results = add_rationales(
+            df,
+            results,
+            max_score=args.rationales_max_score,
+            use_openai=use_openai,
+            cache=cache,
+            scheduler=scheduler,
+            store=store,
+        )
+    remove_hook(metrics)
+    if cache is not None:
+        print(f"Cache statistics: {cache.stats()}")
+    run_summary = metrics.summary()
+    print(run_summary["totals"])
+    print(run_summary["by_provider"].to_string())
+    print(f"Call metrics written to: {metrics_path}")
+    if router is not None:
+        router.close()
+        print(f"Router statistics: {router.stats}")
+        print(router.provider_table().value_counts().to_string())
+
+    if args.train_score_model:
+        print(agreement_report(df, stored).to_string())
+        ScorePredictor().fit(df, stored).save(args.score_model)
+        print(f"Score model saved to: {args.score_model}")
+
+    results = pd.concat([results, local])
+    results = propagate_results(results, df[needs_llm], clusters)
+    return pd.concat([results, triage_results(triage[~needs_llm])])
+
+
+def export(df, results, args):
+    """Write the combined metadata and results, and the score distributions."""
+    df_final = pd.concat([df, results], axis=1, join="inner")
+    return export_results(df_final, args.output_dir, formats=args.formats)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.portals_file:
+        load_portals(args.portals_file)
+    unknown = set(args.portals or []) - set(PORTALS)
+    if unknown:
+        raise SystemExit(f"Unknown portals: {', '.join(sorted(unknown))}.")
+    if args.train_score_model and not args.score_model:
+        raise SystemExit("--train-score-model needs --score-model PATH.")
+    print(f"Cold start: {time.perf_counter() - _START:.2f}s")
+    df = fetch(args)
+    results = analyse(df, args)
+    export(df, results, args)
+    print(f"Finished in {time.perf_counter() - _START:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
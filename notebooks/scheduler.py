@@ -0,0 +1,272 @@
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import set_scheduling
+
+# Default rate limits per provider. Adjust them to the limits of your account tier,
+# see https://platform.openai.com/account/limits and https://admin.mistral.ai/plateforme/limits
+PROVIDER_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 200_000},
+    "mistral": {"rpm": 60, "tpm": 500_000},
+}
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+
+def estimate_tokens(text, chars_per_token=4):
+    """Roughly estimate the number of tokens of a prompt without calling a tokenizer."""
+    return math.ceil(len(text) / chars_per_token)
+
+
+def _status_code(error):
+    """Find the HTTP status code of an exception or of any exception in its chain."""
+    while error is not None:
+        status = getattr(error, "status_code", None)
+        if status is None and getattr(error, "response", None) is not None:
+            status = getattr(error.response, "status_code", None)
+        if status is not None:
+            return status
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def is_rate_limit_error(error):
+    """Check whether an exception from a provider SDK is a rate limit (429) error."""
+    return _status_code(error) == 429 or "RateLimit" in type(error).__name__
+
+
+def is_retryable_error(error):
+    """Check whether a provider call failed for a transient reason and can be retried."""
+    if is_rate_limit_error(error) or _status_code(error) in RETRYABLE_STATUS_CODES:
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def _retry_after(error):
+    """Return the number of seconds from a `Retry-After` header, if the error has one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket that refills `per_minute` units every minute.
+
+    Args:
+        per_minute (float): Refill rate and capacity of the bucket.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Block until `amount` units are available and take them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """Empty the bucket, e.g. after the provider answered with 429."""
+        with self._lock:
+            self._refill()
+            self.tokens = 0
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit that adapts to the observed latency (AIMD).
+
+    The limit grows by one for every request that finishes while the smoothed latency
+    stays below `latency_tolerance` times the best latency of the last `window`
+    requests. It shrinks by one when latency inflates, and is halved on rate limit
+    errors. Only successful requests update the latency, so fast error responses do
+    not distort it, and the windowed best latency follows lasting latency changes.
+
+    Args:
+        initial (int): Initial number of concurrent requests.
+        minimum (int): Lower bound of the limit.
+        maximum (int): Upper bound of the limit.
+        latency_tolerance (float): Allowed factor between smoothed and best latency.
+        window (int): Number of recent latencies the best latency is taken from.
+    """
+
+    def __init__(
+        self, initial=8, minimum=1, maximum=64, latency_tolerance=2.0, window=50
+    ):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.latency = None
+        self.best_latency = None
+        self._recent = deque(maxlen=window)
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, rate_limited=False):
+        """Free the slot of a finished request.
+
+        Args:
+            latency (float): Seconds of a successful request. None for failed
+                requests, which do not change the latency.
+            rate_limited (bool): The request failed with a rate limit error.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(self.minimum, self.limit // 2)
+            elif latency is not None:
+                self.latency = (
+                    latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                )
+                self._recent.append(self.latency)
+                self.best_latency = min(self._recent)
+                if self.latency > self.latency_tolerance * self.best_latency:
+                    self.limit = max(self.minimum, self.limit - 1)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1)
+            self._condition.notify_all()
+
+
+class RateLimitedScheduler:
+    """Run LLM calls as fast as the rate limits of a provider allow.
+
+    Requests-per-minute and tokens-per-minute budgets are enforced with token
+    buckets, using an estimate of the prompt tokens before each request is sent.
+    Rate limit and transient errors are retried with jittered exponential backoff
+    (or after `Retry-After`), and the number of concurrent requests adapts to the
+    observed latency.
+
+    Args:
+        provider (str): Key into PROVIDER_LIMITS, used when `rpm`/`tpm` are not given.
+        rpm (int): Requests per minute.
+        tpm (int): Tokens per minute.
+        max_retries (int): Retries per item before it is given up.
+        base_backoff (float): Backoff in seconds for the first retry.
+        max_backoff (float): Upper bound of the backoff in seconds.
+        concurrency (AdaptiveConcurrency): Concurrency controller. Defaults to a new one.
+    """
+
+    def __init__(
+        self,
+        provider="openai",
+        rpm=None,
+        tpm=None,
+        max_retries=8,
+        base_backoff=1.0,
+        max_backoff=60.0,
+        concurrency=None,
+    ):
+        limits = PROVIDER_LIMITS[provider]
+        self.provider = provider
+        self.requests = TokenBucket(rpm or limits["rpm"])
+        self.tokens = TokenBucket(tpm or limits["tpm"])
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.retries = 0
+        self.failed = {}
+        self._lock = threading.Lock()
+
+    def run(self, fn, item, cost=0):
+        """Call `fn(item)` within the rate limits, retrying transient errors.
+
+        Args:
+            fn (callable): The function doing the LLM call. It must raise on errors.
+            item: The argument for `fn`.
+            cost (int): Estimated tokens of the request. 0 means that no request is
+                sent (e.g. a cache hit), so neither budget nor a concurrency slot is
+                taken, and the latency of the call is not observed.
+        """
+        for attempt in range(self.max_retries + 1):
+            queued = time.monotonic()
+            if cost:
+                self.requests.acquire(1)
+                self.tokens.acquire(cost)
+                self.concurrency.acquire()
+            start = time.monotonic()
+            set_scheduling(start - queued, attempt)
+            try:
+                result = fn(item)
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                if cost:
+                    self.concurrency.release(rate_limited=rate_limited)
+                if not is_retryable_error(e) or attempt == self.max_retries:
+                    raise
+                if rate_limited:
+                    self.requests.drain()
+                with self._lock:
+                    self.retries += 1
+                delay = _retry_after(e) or min(
+                    self.max_backoff, self.base_backoff * 2**attempt
+                ) * random.uniform(0.5, 1.5)
+                time.sleep(delay)
+                continue
+            if cost:
+                self.concurrency.release(time.monotonic() - start)
+            return result
+
+    def map(self, fn, items, estimate=None):
+        """Apply `fn` to all items and return the results in order.
+
+        Items that still fail after all retries are returned as None, and their
+        exceptions are collected in `self.failed` (keyed by position), so no item is
+        dropped silently.
+
+        Args:
+            fn (callable): The function doing the LLM call. It must raise on errors.
+            items (list): The arguments for `fn`.
+            estimate (callable): Returns the estimated tokens of the request for an item.
+        """
+        items = list(items)
+        self.failed = {}
+
+        def run_item(index):
+            item = items[index]
+            cost = estimate(item) if estimate is not None else 0
+            try:
+                return self.run(fn, item, cost)
+            except Exception as e:
+                self.failed[index] = e
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.concurrency.maximum) as executor:
+            results = list(executor.map(run_item, range(len(items))))
+
+        print(
+            f"{len(items) - len(self.failed)} of {len(items)} items done "
+            f"({self.retries} retries, final concurrency {self.concurrency.limit})."
+        )
+        if self.failed:
+            print(f"Failed items: {sorted(self.failed)}")
+        return results
@@ -0,0 +1,330 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import cohen_kappa_score
+from sklearn.model_selection import KFold, train_test_split
+
+from triage import TRIAGE_FIELDS, is_missing
+from utils import RESULT_COLUMNS
+
+SCORE_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "_models", "score_model.pkl"
+)
+
+CRITERIA = [column.removesuffix("_score") for column in RESULT_COLUMNS[1::2]]
+
+# Input fields of the prompt, see `utils._prompt_fields`, and the size of their hashed
+# feature space. Titles and tags are short, so they get fewer buckets.
+TEXT_FIELDS = {
+    "title": 2**16,
+    "notes": 2**18,
+    "formatted_tags": 2**14,
+    "geographical_coverage": 2**10,
+    "geographical_granularity": 2**10,
+    "author": 2**12,
+}
+
+# Bucket edges for the length of title, notes and tags (characters or number of tags).
+LENGTH_BINS = [1, 3, 10, 30, 100, 200, 400, 800, 1600]
+
+PREDICTED = (
+    "Nicht vom LLM bewertet: Die Bewertung wurde von einem lokalen Modell geschätzt, "
+    "das mit früheren LLM-Bewertungen trainiert wurde."
+)
+
+
+def _text(values):
+    """Join list values (e.g. tags) and replace missing values by empty strings."""
+    # Categorical columns (as read from the snapshot) cannot be filled with "", so
+    # the values are converted to objects first.
+    return [
+        " ".join(map(str, value)) if isinstance(value, (list, np.ndarray)) else value
+        for value in values.astype(object).where(values.notna(), "")
+    ]
+
+
+def _vectorizers():
+    return {
+        field: HashingVectorizer(
+            n_features=n_features,
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm="l2",
+        )
+        for field, n_features in TEXT_FIELDS.items()
+    }
+
+
+def dataset_features(df, vectorizers=None):
+    """Build the sparse feature matrix of the prompt inputs of every dataset.
+
+    Word uni- and bigrams of every field are hashed into a separate block, so no
+    vocabulary has to be learned or stored. Missing-field flags and one-hot buckets of
+    the text lengths are added, because they drive most of the low scores.
+
+    Returns:
+        scipy.sparse.csr_matrix: One row per row of `df`.
+    """
+    vectorizers = vectorizers or _vectorizers()
+    blocks = [
+        vectorizers[field].transform(_text(df[field]))
+        for field in TEXT_FIELDS
+        if field in df.columns
+    ]
+    dense = [
+        is_missing(df[column]).to_numpy(float)
+        for column in TRIAGE_FIELDS.values()
+        if column in df.columns
+    ]
+    for field in ("title", "notes", "formatted_tags"):
+        if field in df.columns:
+            buckets = np.digitize(df[field].map(_length).to_numpy(), LENGTH_BINS)
+            dense.extend(np.eye(len(LENGTH_BINS) + 1)[buckets].T)
+    blocks.append(sp.csr_matrix(np.column_stack(dense)))
+    return sp.hstack(blocks, format="csr")
+
+
+def _length(value):
+    if isinstance(value, (list, np.ndarray, str)):
+        return len(value)
+    return 0
+
+
+def _agreement_threshold(confidence, correct, target):
+    """Lowest confidence at which the predictions above it reach `target` agreement.
+
+    Returns inf if no threshold reaches it, so that every dataset goes to the LLM.
+    """
+    order = np.argsort(-confidence, kind="stable")
+    agreement = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+    reached = np.flatnonzero(agreement >= target)
+    if len(reached) == 0:
+        return float("inf")
+    # Ties must be accepted or rejected together, so only cut between distinct values.
+    sorted_confidence = confidence[order]
+    for position in reached[::-1]:
+        if (
+            position + 1 == len(order)
+            or sorted_confidence[position + 1] < sorted_confidence[position]
+        ):
+            return float(sorted_confidence[position])
+    return float("inf")
+
+
+class ScorePredictor:
+    """Local model that predicts the six 1-3 scores from earlier LLM results.
+
+    One linear classifier with logistic loss per criterion is trained by stochastic
+    gradient descent on hashed n-grams of the prompt inputs, which takes seconds on a
+    CPU even for large catalogues. A part of the training data is held out to calibrate a confidence
+    threshold per criterion: predictions above it agree with the LLM in at least
+    `target_agreement` of the held-out datasets. A dataset only skips the LLM if all
+    six scores are confident, because `do_full_analysis` returns all of them at once.
+
+    Usage:
+
+        predictor = ScorePredictor().fit(df, store.load_results())
+        predictor.save(SCORE_MODEL_PATH)
+        needs_llm = predictor.needs_llm(df)
+
+    Args:
+        target_agreement (float): Required agreement with the LLM of confident predictions.
+        holdout_size (float): Share of the training data used to calibrate the thresholds.
+        alpha (float): Regularization strength of the classifiers.
+        min_samples (int): Minimum number of LLM results needed for training.
+        random_state (int): Seed of the holdout split.
+    """
+
+    def __init__(
+        self,
+        target_agreement=0.9,
+        holdout_size=0.25,
+        alpha=1e-4,
+        min_samples=200,
+        random_state=42,
+    ):
+        self.target_agreement = target_agreement
+        self.holdout_size = holdout_size
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.random_state = random_state
+        self.models = {}
+        self.thresholds = {}
+
+    def _classifier(self):
+        return SGDClassifier(
+            loss="log_loss", alpha=self.alpha, random_state=self.random_state
+        )
+
+    def fit(self, df, results):
+        """Train the models and calibrate the thresholds.
+
+        Args:
+            df (pd.DataFrame): The metadata with `id` and the TEXT_FIELDS.
+            results (pd.DataFrame): LLM results with `id` and the `<criterion>_score`
+                columns, e.g. from `CheckpointStore.load_results`.
+        """
+        return self._fit(training_data(df, results))
+
+    def _fit(self, data):
+        if len(data) < self.min_samples:
+            raise ValueError(
+                f"Only {len(data)} LLM results match the metadata, "
+                f"at least {self.min_samples} are needed to train the score model."
+            )
+        features = dataset_features(data)
+        train, holdout = train_test_split(
+            np.arange(len(data)),
+            test_size=self.holdout_size,
+            random_state=self.random_state,
+        )
+        for criterion in CRITERIA:
+            y = data[f"{criterion}_score"].to_numpy(int)
+            if len(np.unique(y[train])) < 2:
+                raise ValueError(f"All training scores of {criterion} are the same.")
+            model = self._classifier().fit(features[train], y[train])
+            probabilities = model.predict_proba(features[holdout])
+            predicted = model.classes_[probabilities.argmax(axis=1)]
+            self.thresholds[criterion] = _agreement_threshold(
+                probabilities.max(axis=1),
+                predicted == y[holdout],
+                self.target_agreement,
+            )
+            # The final model uses all data, the holdout only fixed the threshold.
+            self.models[criterion] = self._classifier().fit(features, y)
+        return self
+
+    def predict(self, df):
+        """Predict the scores of every dataset.
+
+        Returns:
+            pd.DataFrame: Same index as `df` with `<criterion>_score`,
+                `<criterion>_confidence` and `<criterion>_confident` (above the
+                threshold) per criterion, and `confident` (all six are).
+        """
+        if not self.models:
+            raise ValueError("The score model is not trained yet, call `fit` first.")
+        features = dataset_features(df)
+        predictions = pd.DataFrame(index=df.index)
+        confident = np.ones(len(df), dtype=bool)
+        for criterion in CRITERIA:
+            model = self.models[criterion]
+            probabilities = model.predict_proba(features)
+            confidence = probabilities.max(axis=1)
+            predictions[f"{criterion}_score"] = model.classes_[
+                probabilities.argmax(axis=1)
+            ]
+            predictions[f"{criterion}_confidence"] = confidence
+            predictions[f"{criterion}_confident"] = (
+                confidence >= self.thresholds[criterion]
+            )
+            confident &= predictions[f"{criterion}_confident"].to_numpy()
+        predictions["confident"] = confident
+        return predictions
+
+    def needs_llm(self, df):
+        """Return a boolean mask of the datasets whose scores are not confident."""
+        needs_llm = ~self.predict(df)["confident"]
+        print(
+            f"{needs_llm.sum()} of {len(df)} datasets need the LLM analysis, "
+            f"{(~needs_llm).sum()} are scored by the local model."
+        )
+        return needs_llm
+
+    def save(self, path=SCORE_MODEL_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as file:
+            pickle.dump(self, file)
+
+    @staticmethod
+    def load(path=SCORE_MODEL_PATH):
+        """Load a saved model. Only load files you created yourself (pickle)."""
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+
+def training_data(df, results):
+    """Pair the LLM scores with the current metadata of the same datasets."""
+    scores = results[["id"] + [f"{criterion}_score" for criterion in CRITERIA]]
+    scores = scores.dropna().drop_duplicates("id")
+    return df.assign(id=df["id"].astype(str)).merge(
+        scores.assign(id=scores["id"].astype(str)), on="id"
+    )
+
+
+def predicted_results(predictions):
+    """Build analysis results for rows scored by the local model.
+
+    The columns match `parse_instructor_results`, so the rows can be combined with
+    the LLM results, like `triage.triage_results`.
+    """
+    results = pd.DataFrame(index=predictions.index)
+    for criterion in CRITERIA:
+        results[criterion] = PREDICTED
+        results[f"{criterion}_score"] = predictions[f"{criterion}_score"].astype(
+            "Int64"
+        )
+    return results
+
+
+def agreement_report(df, results, n_splits=5, **options):
+    """Evaluate the local model against the LLM offline with k-fold cross-validation.
+
+    Every dataset is predicted by a model that did not see it. `options` are passed on
+    to `ScorePredictor`.
+
+    Returns:
+        pd.DataFrame: One row per criterion and an `alle` row for whole datasets, with
+            the agreement on all datasets, the agreement within one point, the quadratic
+            weighted kappa, the share of confident predictions (`coverage`) and the
+            agreement of the confident predictions alone.
+    """
+    data = training_data(df, results).reset_index(drop=True)
+    folds = KFold(n_splits=n_splits, shuffle=True, random_state=42)
+    predictions = []
+    for train, test in folds.split(data):
+        predictor = ScorePredictor(**options)._fit(data.iloc[train])
+        predictions.append(predictor.predict(data.iloc[test]))
+    predictions = pd.concat(predictions).sort_index()
+
+    rows = {}
+    all_agree = np.ones(len(data), dtype=bool)
+    all_confident = predictions["confident"].to_numpy()
+    for criterion in CRITERIA:
+        llm = data[f"{criterion}_score"].to_numpy(int)
+        local = predictions[f"{criterion}_score"].to_numpy(int)
+        confident = predictions[f"{criterion}_confident"].to_numpy()
+        agree = llm == local
+        all_agree &= agree
+        rows[criterion] = {
+            "agreement": agree.mean(),
+            "within_one": (np.abs(llm - local) <= 1).mean(),
+            "kappa": cohen_kappa_score(llm, local, weights="quadratic"),
+            "coverage": confident.mean(),
+            "confident_agreement": (
+                agree[confident].mean() if confident.any() else float("nan")
+            ),
+        }
+    rows["alle"] = {
+        "agreement": all_agree.mean(),
+        "within_one": float("nan"),
+        "kappa": float("nan"),
+        "coverage": all_confident.mean(),
+        "confident_agreement": (
+            all_agree[all_confident].mean() if all_confident.any() else float("nan")
+        ),
+    }
+    report = pd.DataFrame.from_dict(rows, orient="index")
+    report.index.name = "criterion"
+    print(
+        f"{len(data)} datasets evaluated: {all_confident.mean():.1%} would be scored "
+        f"locally, with {rows['alle']['confident_agreement']:.1%} full agreement."
+    )
+    return report
@@ -0,0 +1,262 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+# USD per million prompt and completion tokens. Adjust them to the current price lists,
+# see https://openai.com/api/pricing and https://mistral.ai/products/la-plateforme#pricing
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "mistral-small-latest": (0.10, 0.30),
+}
+
+METRIC_COLUMNS = [
+    "dataset_id",
+    "provider",
+    "model",
+    "response_model",
+    "outcome",
+    "error",
+    "started",
+    "queue_wait",
+    "wall_time",
+    "prompt_tokens",
+    "completion_tokens",
+    "validation_retries",
+    "attempt",
+]
+
+_NUMERIC_COLUMNS = {
+    "started": float,
+    "queue_wait": float,
+    "wall_time": float,
+    "prompt_tokens": int,
+    "completion_tokens": int,
+    "validation_retries": int,
+    "attempt": int,
+}
+
+_hooks = []
+_dataset_id = ContextVar("dataset_id", default=None)
+_scheduling = ContextVar("scheduling", default={})
+_record = ContextVar("record", default=None)
+
+
+def add_hook(hook):
+    """Register a callable that receives the record of every provider call."""
+    _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def emit(record):
+    """Pass a finished record to all hooks. Failing hooks never break the analysis."""
+    for hook in list(_hooks):
+        try:
+            hook(record)
+        except Exception as e:
+            print(f"Telemetry hook {hook!r} failed: {e}")
+
+
+@contextmanager
+def dataset_context(dataset_id):
+    """Attribute the provider calls made inside the block to a dataset (or batch) id."""
+    token = _dataset_id.set(None if dataset_id is None else str(dataset_id))
+    try:
+        yield
+    finally:
+        _dataset_id.reset(token)
+
+
+def set_scheduling(queue_wait, attempt):
+    """Note how long the current item waited for the rate limits, and which attempt it is."""
+    _scheduling.set({"queue_wait": queue_wait, "attempt": attempt})
+
+
+def _new_record(provider, model, response_model, outcome="ok"):
+    scheduling = _scheduling.get()
+    return {
+        "dataset_id": _dataset_id.get(),
+        "provider": provider,
+        "model": model,
+        "response_model": response_model,
+        "outcome": outcome,
+        "error": None,
+        "started": time.time(),
+        "queue_wait": scheduling.get("queue_wait", 0.0),
+        "wall_time": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "validation_retries": 0,
+        "attempt": scheduling.get("attempt", 0),
+    }
+
+
+@contextmanager
+def instrument_call(provider, model, response_model="text"):
+    """Time a provider call and emit its record to the hooks.
+
+    Token usage is added with `record_usage`, either directly from the response or
+    through the instructor hooks registered by `attach_instructor_hooks`.
+    `response_model` is the name of the requested pydantic model, or "text" for
+    unstructured calls, so that the analysis modes can be compared.
+    """
+    if not _hooks:
+        yield None
+        return
+    record = _new_record(provider, model, response_model)
+    token = _record.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["outcome"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        record["wall_time"] = time.perf_counter() - start
+        _record.reset(token)
+        emit(record)
+
+
+def record_cache_hit(provider, model, response_model="MetadataAnalysis"):
+    """Emit a record for a result that was answered from the cache."""
+    if _hooks:
+        emit(_new_record(provider, model, response_model, outcome="cache_hit"))
+
+
+def record_usage(response, record=None):
+    """Add the token usage of a raw OpenAI or Mistral response to the current record."""
+    record = record if record is not None else _record.get()
+    usage = getattr(response, "usage", None)
+    if record is None or usage is None:
+        return
+    record["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+    record["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+
+def _on_parse_error(error):
+    record = _record.get()
+    if record is not None:
+        record["validation_retries"] += 1
+
+
+def attach_instructor_hooks(client):
+    """Count tokens of every attempt and validation retries of an instructor client."""
+    client.on("completion:response", record_usage)
+    client.on("parse:error", _on_parse_error)
+    return client
+
+
+class CallMetrics:
+    """Hook that collects call records and optionally streams them to a JSONL file.
+
+    Usage:
+
+        metrics = add_hook(CallMetrics("_results/metrics.jsonl"))
+        ... run the analysis ...
+        remove_hook(metrics)
+        metrics.summary()
+
+    Args:
+        path (str): JSONL file the records are appended to. None keeps them in memory only.
+        prices (dict): USD per million prompt and completion tokens per model.
+    """
+
+    def __init__(self, path=None, prices=MODEL_PRICES):
+        self.path = path
+        self.prices = prices
+        self.records = []
+        self._lock = threading.Lock()
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def to_frame(self):
+        """Return all records as a DataFrame with an estimated `cost_usd` per call."""
+        with self._lock:
+            df = pd.DataFrame(self.records, columns=METRIC_COLUMNS)
+        # Typed columns keep the summary working for runs without any provider call.
+        df = df.astype(_NUMERIC_COLUMNS)
+        prices = df["model"].map(self.prices)
+        df["cost_usd"] = [
+            (
+                (prompt * price[0] + completion * price[1]) / 1e6
+                if isinstance(price, tuple)
+                else float("nan")
+            )
+            for prompt, completion, price in zip(
+                df["prompt_tokens"], df["completion_tokens"], prices
+            )
+        ]
+        return df
+
+    def summary(self, slowest=10):
+        """Summarize the run: throughput, latency, tokens, cost and slowest datasets.
+
+        Returns:
+            dict: Run totals, a per provider/model/response model table and the
+                slowest datasets.
+        """
+        df = self.to_frame()
+        calls = df[df["outcome"] != "cache_hit"]
+        elapsed = (
+            float((df["started"] + df["wall_time"]).max() - df["started"].min())
+            if len(df)
+            else 0.0
+        )
+        datasets = df.loc[df["outcome"] != "error", "dataset_id"].nunique()
+        totals = {
+            "calls": len(calls),
+            "errors": int((calls["outcome"] == "error").sum()),
+            "cache_hits": int((df["outcome"] == "cache_hit").sum()),
+            "datasets": datasets,
+            "seconds": elapsed,
+            "datasets_per_minute": datasets / elapsed * 60 if elapsed else float("nan"),
+            "prompt_tokens": int(calls["prompt_tokens"].sum()),
+            "completion_tokens": int(calls["completion_tokens"].sum()),
+            "validation_retries": int(calls["validation_retries"].sum()),
+            "cost_usd": float(calls["cost_usd"].sum()),
+        }
+        by_provider = calls.groupby(
+            ["provider", "model", "response_model"], dropna=False
+        ).agg(
+            calls=("outcome", "size"),
+            errors=("outcome", lambda outcome: (outcome == "error").sum()),
+            p50_seconds=("wall_time", "median"),
+            p95_seconds=("wall_time", lambda wall_time: wall_time.quantile(0.95)),
+            mean_queue_wait=("queue_wait", "mean"),
+            prompt_tokens=("prompt_tokens", "mean"),
+            completion_tokens=("completion_tokens", "mean"),
+            cost_usd=("cost_usd", "sum"),
+        )
+        slowest_datasets = (
+            calls.groupby("dataset_id")
+            .agg(
+                wall_time=("wall_time", "sum"),
+                calls=("outcome", "size"),
+                completion_tokens=("completion_tokens", "sum"),
+            )
+            .nlargest(slowest, "wall_time")
+        )
+        return {
+            "totals": totals,
+            "by_provider": by_provider,
+            "slowest_datasets": slowest_datasets,
+        }
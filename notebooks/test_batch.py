@@ -0,0 +1,103 @@
+import json
+import random
+
+import pytest
+
+from batch import (
+    BatchBackend,
+    LocalBatchBackend,
+    build_batch_requests,
+    read_batch_results,
+    run_batch,
+)
+from mock_llm import fake_instance
+from utils import MetadataAnalysis
+
+
+def valid_answer(seed=0):
+    schema = MetadataAnalysis.model_json_schema()
+    return json.dumps(fake_instance(schema, random.Random(seed)))
+
+
+def test_backend_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        BatchBackend()
+
+
+def test_requests_follow_the_provider_line_format(metadata):
+    openai_line, mistral_line = (
+        build_batch_requests(metadata.head(1), provider=provider)[0]
+        for provider in ("openai", "mistral")
+    )
+
+    assert openai_line["custom_id"] == mistral_line["custom_id"] == metadata["id"][0]
+    assert openai_line["url"] == "/v1/chat/completions"
+    assert "model" in openai_line["body"]
+    assert set(mistral_line) == {"custom_id", "body"}
+    assert openai_line["body"]["response_format"]["json_schema"]["strict"]
+
+
+def test_run_batch_ingests_results_and_reports_failures(metadata, tmp_path):
+    answers = iter([valid_answer(0), "kein JSON", valid_answer(1)])
+
+    def answer(body):
+        content = next(answers, None)
+        if content is None:
+            raise RuntimeError("server error")
+        return content
+
+    backend = LocalBatchBackend(answer, directory=str(tmp_path))
+    df = metadata.head(4)
+
+    results, errors, failed_ids = run_batch(
+        backend,
+        df,
+        str(tmp_path / "requests.jsonl"),
+        str(tmp_path / "results.jsonl"),
+        poll_interval=0,
+    )
+
+    ids = df["id"].tolist()
+    assert results["id"].tolist() == [ids[0], ids[2]]
+    assert results["dateninhalt_score"].between(1, 3).all()
+    assert errors["id"].tolist() == [ids[1], ids[3]]
+    assert failed_ids == [ids[1], ids[3]]
+
+
+def test_datasets_missing_from_the_results_are_failed(metadata, tmp_path):
+    class TruncatingBackend(LocalBatchBackend):
+        def download(self, job_id, path):
+            super().download(job_id, path)
+            with open(path, encoding="utf-8") as file:
+                lines = file.readlines()
+            with open(path, "w", encoding="utf-8") as file:
+                file.writelines(lines[:-1])
+
+    backend = TruncatingBackend(lambda body: valid_answer(), directory=str(tmp_path))
+    df = metadata.head(3)
+
+    results, errors, failed_ids = run_batch(
+        backend,
+        df,
+        str(tmp_path / "requests.jsonl"),
+        str(tmp_path / "results.jsonl"),
+        poll_interval=0,
+    )
+
+    assert len(results) == 2
+    assert errors.empty
+    assert failed_ids == [df["id"].iloc[2]]
+
+
+def test_read_batch_results_reports_invalid_lines(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text(
+        json.dumps({"custom_id": "a", "response": {"status_code": 500}}) + "\n"
+        "{nicht lesbar\n"
+    )
+
+    results, errors, failed_ids = read_batch_results(str(path))
+
+    assert results.empty
+    assert errors["line"].tolist() == [1, 2]
+    assert failed_ids == ["a"]
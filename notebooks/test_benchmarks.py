@@ -0,0 +1,41 @@
+import pytest
+
+from benchmarks import benchmark_pipeline, main, synthetic_data_rows
+
+
+def test_pipeline_benchmark_runs_against_the_mock_server():
+    results = benchmark_pipeline(
+        synthetic_data_rows(6),
+        concurrency_levels=(1, 4),
+        batch_sizes=(1, 3),
+        modes=("full", "scores"),
+        latency=0.001,
+    )
+
+    assert results[["mode", "batch_size", "concurrency"]].values.tolist() == [
+        ["full", 1, 1],
+        ["full", 1, 4],
+        ["full", 3, 1],
+        ["full", 3, 4],
+        ["scores", 1, 1],
+        ["scores", 1, 4],
+    ]
+    assert results["valid_results"].eq(6).all()
+    assert results["failed"].eq(0).all()
+    assert (results["p50"] <= results["p99"]).all()
+    assert results["prompt_tokens_per_dataset"].gt(0).all()
+
+
+def test_slow_runs_fail_the_gate(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(
+            [
+                "--n=2",
+                "--concurrency=1",
+                "--batch-sizes=1",
+                "--latency=0.001",
+                "--min-datasets-per-minute=1e9",
+            ]
+        )
+    assert exit_info.value.code == 1
+    assert "datasets_per_minute" in capsys.readouterr().out
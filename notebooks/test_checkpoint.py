@@ -0,0 +1,60 @@
+import random
+
+from checkpoint import CheckpointStore, content_hash, prompt_version
+from mock_llm import fake_instance
+from utils import MetadataAnalysis
+
+
+def analysis(seed):
+    schema = MetadataAnalysis.model_json_schema()
+    return MetadataAnalysis(**fake_instance(schema, random.Random(seed)))
+
+
+def test_resume_skips_only_unchanged_datasets(metadata, tmp_path):
+    store = CheckpointStore("v1", path=str(tmp_path / "analysis.jsonl"))
+    data_rows = [row for _, row in metadata.head(4).iterrows()]
+    analyze = store.wrap(lambda data: analysis(0))
+    for data in data_rows:
+        analyze(data)
+
+    assert store.pending(data_rows) == []
+
+    changed = data_rows[2].copy()
+    changed["title"] = "Neuer Titel"
+    assert content_hash(changed) != content_hash(data_rows[2])
+    pending = store.pending(data_rows[:2] + [changed, data_rows[3]])
+    assert [data["id"] for data in pending] == [changed["id"]]
+
+    other_version = CheckpointStore("v2", path=store.path)
+    assert len(other_version.pending(data_rows)) == 4
+
+
+def test_the_latest_result_of_a_dataset_wins(tmp_path):
+    store = CheckpointStore(prompt_version("model"), path=str(tmp_path / "a.jsonl"))
+    first, second = analysis(1), analysis(2)
+    store.append("a", first, "old")
+    store.append("b", first, "b")
+    store.append("a", second, "new")
+    with open(store.path, "a", encoding="utf-8") as file:
+        file.write('{"id": "c", "prompt_')  # incomplete line after a crash
+
+    assert store.done_ids() == {"a": "new", "b": "b"}
+    frames = list(store.iter_frames(chunksize=1))
+    assert [len(frame) for frame in frames] == [1, 1]
+    results = store.load_results().set_index("id")
+    assert results.index.tolist() == ["b", "a"]
+    assert results.loc["a", "dateninhalt"] == second.dateninhalt
+    assert results.loc["b", "dateninhalt"] == first.dateninhalt
+
+
+def test_appending_after_a_torn_line_keeps_the_new_record(tmp_path):
+    path = tmp_path / "analysis.jsonl"
+    store = CheckpointStore("v1", path=str(path))
+    store.append("a", analysis(0))
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"id": "b", "prompt_vers')
+
+    store.append("c", analysis(1))
+
+    assert set(store.done_ids()) == {"a", "c"}
+    assert path.read_text(encoding="utf-8").endswith("\n")
@@ -0,0 +1,183 @@
+import copy
+import gc
+import json
+import weakref
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import ckan
+from ckan import (
+    PACKAGE_SCHEMA,
+    active_tag_names,
+    extract_active_names,
+    fetch_package_pages,
+    flatten_packages,
+    read_package_pages,
+    read_snapshot,
+    sync_package_list,
+    write_snapshot,
+)
+
+
+def test_first_sync_crawls_the_whole_catalogue(ckan_server, packages, tmp_path):
+    server = ckan_server(packages)
+    path = tmp_path / "metadata.parquet"
+
+    data, changes = sync_package_list(str(path), api_base=server.api_base, sleep=0)
+
+    assert len(data) == len(packages)
+    assert changes["new"] == [package["id"] for package in packages]
+    assert changes["changed"] == changes["deleted"] == []
+    assert sorted(read_snapshot(str(path))["id"]) == sorted(changes["new"])
+    assert "package_search" in server.actions()
+    assert not (tmp_path / "metadata.parquet.pages").exists()
+
+
+def test_read_package_pages_of_empty_crawl(tmp_path):
+    data = read_package_pages(str(tmp_path), columns=["id", "title"])
+
+    assert data.empty
+    assert list(data.columns) == ["id", "title"]
+
+
+def test_sync_fetches_only_modified_packages(ckan_server, packages, tmp_path):
+    path = str(tmp_path / "metadata.parquet")
+    server = ckan_server(packages)
+    sync_package_list(path, api_base=server.api_base, sleep=0)
+
+    updated = copy.deepcopy(packages)
+    updated[3]["title"] = "Neuer Titel"
+    updated[3]["metadata_modified"] = "2025-06-01T00:00:00.000000"
+    added = dict(copy.deepcopy(updated[0]), id="new-id", name="neu")
+    added["metadata_modified"] = "2025-06-02T00:00:00.000000"
+    deleted = updated.pop(5)
+    server.packages = updated + [added]
+    server.requests.clear()
+
+    data, changes = sync_package_list(path, api_base=server.api_base, sleep=0)
+
+    assert changes == {
+        "new": ["new-id"],
+        "changed": [packages[3]["id"]],
+        "deleted": [deleted["id"]],
+    }
+    assert "current_package_list_with_resources" not in server.actions()
+    assert len(data) == len(packages)
+    stored = read_snapshot(path).set_index("id")
+    assert stored.loc[packages[3]["id"], "title"] == "Neuer Titel"
+    assert deleted["id"] not in stored.index
+
+
+class _Page(list):
+    """Page of packages that can be tracked with a weak reference."""
+
+    __hash__ = object.__hash__
+
+
+def test_fetch_package_pages_streams_pages_concurrently(
+    ckan_server, packages, tmp_path, monkeypatch
+):
+    server = ckan_server(packages, latency=0.02)
+    live_pages = weakref.WeakSet()
+    live_when_written = []
+    get_json = ckan.get_json
+    package_table = ckan.package_table
+
+    def tracked_get_json(session, url, params=None):
+        data = get_json(session, url, params=params)
+        if url.endswith("current_package_list_with_resources"):
+            data["result"] = _Page(data["result"])
+            live_pages.add(data["result"])
+        return data
+
+    def recording_package_table(data):
+        # Pages left in reference cycles by earlier tests are not yet reclaimed.
+        gc.collect()
+        live_when_written.append(len(live_pages))
+        return package_table(data)
+
+    monkeypatch.setattr(ckan, "get_json", tracked_get_json)
+    monkeypatch.setattr(ckan, "package_table", recording_package_table)
+
+    written = fetch_package_pages(
+        str(tmp_path), limit=2, max_workers=3, api_base=server.api_base
+    )
+
+    assert written == len(packages)
+    assert sorted(read_package_pages(str(tmp_path))["id"]) == sorted(
+        package["id"] for package in packages
+    )
+    assert 1 < server.max_in_flight <= 3
+    # Only the pages in flight and the one being written are held in memory.
+    assert len(live_when_written) == 15
+    assert max(live_when_written) <= 3 + 1
+
+
+def test_fetch_package_pages_retries_after_back_pressure(
+    ckan_server, packages, tmp_path
+):
+    server = ckan_server(packages, statuses=[429, 503])
+
+    written = fetch_package_pages(
+        str(tmp_path), limit=10, max_workers=2, api_base=server.api_base
+    )
+
+    assert written == len(packages)
+    assert server.actions().count("package_search") == 3
+
+
+def irregular_packages(packages):
+    """Three packages with empty, missing and partly filled nested fields."""
+    empty, missing, partial = copy.deepcopy(packages[:3])
+    empty["tags"] = []
+    for key in ("tags", "organization", "extras"):
+        del missing[key]
+    partial["tags"][0]["state"] = "deleted"
+    del partial["tags"][1]["display_name"]
+    del partial["resources"][0]["format"]
+    partial["relationships"] = [{"type": "child_of", "object": "x"}]
+    return [empty, missing, partial]
+
+
+def test_snapshot_round_trip_keeps_the_schema(packages, tmp_path):
+    path = str(tmp_path / "metadata.parquet")
+    raw = irregular_packages(packages)
+
+    write_snapshot(flatten_packages(raw), path)
+    data = read_snapshot(path, columns=None)
+
+    schema = pq.read_schema(path)
+    assert [schema.field(f.name).type for f in PACKAGE_SCHEMA] == PACKAGE_SCHEMA.types
+    assert data["id"].tolist() == [package["id"] for package in raw]
+    assert len(data.loc[0, "tags"]) == 0 and pd.isna(data.loc[1, "tags"])
+    assert pd.isna(data.loc[1, "organization.title"])
+    assert data.loc[2, "tags"][1]["display_name"] is None
+    assert data.loc[2, "resources"][0]["format"] is None
+    assert isinstance(data["author"].dtype, pd.CategoricalDtype)
+    assert str(data["metadata_modified"].dtype) == "datetime64[us]"
+    assert json.loads(data.loc[2, "relationships"]) == raw[2]["relationships"]
+
+
+def test_active_tag_names_match_the_row_wise_extraction(packages, tmp_path):
+    path = str(tmp_path / "metadata.parquet")
+    raw = irregular_packages(packages)
+    write_snapshot(flatten_packages(raw), path)
+
+    names = active_tag_names(read_snapshot(path)["tags"])
+
+    assert names.tolist() == [
+        extract_active_names(package.get("tags")) for package in raw
+    ]
+    assert names[2] == [tag["name"] for tag in raw[2]["tags"][1:]]
+
+
+def test_read_snapshot_selects_columns(packages, tmp_path):
+    path = str(tmp_path / "metadata.parquet")
+    write_snapshot(flatten_packages(packages[:2]), path)
+
+    assert list(read_snapshot(path).columns) == ckan.ANALYSIS_COLUMNS
+    assert list(read_snapshot(path, columns=["title", "id", "unknown"]).columns) == [
+        "title",
+        "id",
+    ]
@@ -0,0 +1,56 @@
+import numpy as np
+
+from dedup import (
+    _MERSENNE_PRIME,
+    _universal_hash,
+    cluster_datasets,
+    minhash_signatures,
+    propagate_results,
+)
+
+
+def test_universal_hash_is_exact_modulo_the_prime():
+    rng = np.random.default_rng(1)
+    a = rng.integers(1, _MERSENNE_PRIME, size=64, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE_PRIME, size=64, dtype=np.uint64)
+    x = np.array([0, 1, 12345, (1 << 32) - 1], dtype=np.uint64)
+
+    expected = [
+        [(int(ai) * int(xi) + int(bi)) % _MERSENNE_PRIME for xi in x]
+        for ai, bi in zip(a, b)
+    ]
+
+    assert _universal_hash(a, b, x).tolist() == expected
+
+
+def test_identical_texts_have_identical_signatures():
+    signatures = minhash_signatures(["Haushalt 2020", "Haushalt 2021", "Baumkataster"])
+
+    assert (signatures[0] == signatures[1]).all()
+    assert (signatures[0] == signatures[2]).mean() < 0.5
+
+
+def test_series_are_clustered_with_one_representative(metadata):
+    df = metadata.copy()
+    series = "Haushaltsplan des Bezirks {} mit allen Einnahmen und Ausgaben"
+    titles = [series.format(year) for year in range(2000, 2020)]
+    df["title"] = titles + df["title"][20:].tolist()
+    df["notes"] = ["Der Haushaltsplan des Bezirks."] * 20 + df["notes"][20:].tolist()
+    df["formatted_tags"] = [["haushalt"]] * 20 + df["formatted_tags"][20:].tolist()
+
+    clusters = cluster_datasets(df, sample_size=8)
+
+    series_clusters = clusters.iloc[:20]
+    assert series_clusters["cluster_id"].nunique() == 1
+    assert series_clusters["cluster_size"].eq(20).all()
+    assert series_clusters["is_representative"].sum() == 1
+    assert series_clusters["representative"].iloc[0] in df.index[:20]
+    assert clusters.iloc[20:]["cluster_size"].eq(1).all()
+    assert clusters.iloc[20:]["is_representative"].all()
+
+    results = df.loc[clusters["representative"].unique(), ["id"]].rename(
+        columns={"id": "analysed"}
+    )
+    propagated = propagate_results(results, df, clusters)
+    assert propagated["analysed"].iloc[:20].nunique() == 1
+    assert propagated["diff_fields"].iloc[:20].str.contains("title").sum() == 19
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic_results
+from export import aggregate_tables, export_results, export_table, score_aggregates
+from utils import CRITERION_LABELS
+
+
+@pytest.fixture
+def df_final(metadata):
+    df = metadata.head(6)
+    df = pd.concat([df, synthetic_results(df)], axis=1)
+    df["title"] = df["title"].astype(object)
+    df.loc[df.index[0], "title"] = "Titel mit \x07Steuerzeichen"
+    df.loc[df.index[1], "methodik_score"] = pd.NA
+    return df
+
+
+def test_xlsx_round_trip(df_final, tmp_path):
+    (path,) = export_results(df_final, output_dir=str(tmp_path), timestamp="t")["xlsx"]
+
+    sheets = pd.read_excel(path, sheet_name=None)
+
+    assert list(sheets) == ["datensaetze", "kriterien", "organisationen", "autoren"]
+    table = sheets["datensaetze"]
+    expected = export_table(df_final)
+    assert list(table.columns) == list(expected.columns)
+    assert table["id"].tolist() == expected["id"].tolist()
+    assert table.loc[0, "title"] == "Titel mit Steuerzeichen"
+    assert table.loc[0, "formatted_tags"] == ", ".join(
+        df_final["formatted_tags"].iloc[0]
+    )
+    assert pd.isna(table.loc[1, "methodik_score"])
+    assert table["referenz_score"].tolist() == df_final["referenz_score"].tolist()
+    assert table["dateninhalt"].tolist() == df_final["dateninhalt"].tolist()
+
+
+def test_parquet_round_trip(df_final, tmp_path):
+    paths = export_results(
+        df_final, output_dir=str(tmp_path), formats=("parquet",), timestamp="t"
+    )["parquet"]
+
+    table = pd.read_parquet(paths[0])
+
+    assert [path.rsplit("_t", 1)[-1] for path in paths] == [
+        ".parquet",
+        "_kriterien.parquet",
+        "_organisationen.parquet",
+        "_autoren.parquet",
+    ]
+    pd.testing.assert_frame_equal(
+        table, export_table(df_final), check_dtype=False, check_categorical=False
+    )
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(paths[1]), score_aggregates(df_final), check_dtype=False
+    )
+
+
+def test_parquet_is_partitioned_by_portal(df_final, tmp_path):
+    df_final["portal"] = ["berlin", "hamburg"] * 3
+    path, *_ = export_results(
+        df_final, output_dir=str(tmp_path), formats=("parquet",), timestamp="t"
+    )["parquet"]
+
+    table = pd.read_parquet(path)
+
+    partitions = sorted(p.name for p in (tmp_path / path.split("/")[-1]).iterdir())
+    assert partitions == ["portal=berlin", "portal=hamburg"]
+    assert sorted(table["id"]) == sorted(df_final["id"])
+    assert table["portal"].astype(str).value_counts().to_dict() == {
+        "berlin": 3,
+        "hamburg": 3,
+    }
+
+
+def test_csv_round_trip(df_final, tmp_path):
+    paths = export_results(
+        df_final, output_dir=str(tmp_path), formats=("csv",), timestamp="t"
+    )["csv"]
+
+    with open(paths[0], encoding="utf-8") as file:
+        assert file.read(1) == "\ufeff"
+    table = pd.read_csv(paths[0], encoding="utf-8-sig")
+    expected = export_table(df_final)
+    assert list(table.columns) == list(expected.columns)
+    assert table["title"].tolist() == expected["title"].tolist()
+    assert table["formatted_tags"].tolist() == expected["formatted_tags"].tolist()
+    assert table["methodik_score"].isna().sum() == 1
+    assert pd.isna(table.loc[1, "methodik_score"])
+    assert len(pd.read_csv(paths[2], encoding="utf-8-sig")) == len(
+        score_aggregates(df_final, by="organization.title")
+    )
+
+
+def test_score_distribution_per_publisher():
+    scores = {f"{criterion}_score": 2 for criterion in CRITERION_LABELS}
+    df = pd.DataFrame([scores] * 4)
+    df["organization.title"] = pd.Categorical(["A", "A", "B", None])
+    df["dateninhalt_score"] = pd.array([1, 3, 2, pd.NA], dtype="Int64")
+
+    tables = aggregate_tables(df)
+
+    publishers = tables["organisationen"].set_index(["organization.title", "criterion"])
+    assert set(tables) == {"kriterien", "organisationen"}
+    assert len(publishers) == 3 * len(CRITERION_LABELS)
+    a = publishers.loc[("A", "dateninhalt")]
+    columns = ["n", "mean_score", "n_1", "n_2", "n_3", "unscored"]
+    assert a[columns].tolist() == [2, 2.0, 1, 0, 1, 0]
+    assert a["share_1"] == a["share_3"] == 0.5
+    missing = publishers.loc[("(ohne Angabe)", "dateninhalt")]
+    assert (missing["n"], missing["unscored"]) == (0, 1)
+    assert np.isnan(missing["share_2"])
+    assert publishers.loc[("B", "methodik"), "n_2"] == 1
+    overall = tables["kriterien"].set_index("criterion")
+    assert overall.loc["dateninhalt", ["n", "unscored"]].tolist() == [3, 1]
+    assert overall.loc["referenz", "share_2"] == 1.0
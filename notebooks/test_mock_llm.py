@@ -0,0 +1,64 @@
+import random
+
+import requests
+
+from mock_llm import MockLLMServer, fake_instance, fake_tagged_answer
+from utils import MetadataAnalysis, MetadataAnalysisList, parse_analysis_results
+
+
+def completion(server, **request):
+    return requests.post(
+        server.openai_url + "/chat/completions",
+        json={"model": "mock", "messages": [{"role": "user", "content": "Hallo"}]}
+        | request,
+        timeout=5,
+    )
+
+
+def test_fake_payloads_are_valid_answers():
+    rng = random.Random(0)
+    schema = MetadataAnalysisList.model_json_schema()
+
+    batch = MetadataAnalysisList(**fake_instance(schema, rng, dataset_ids=["a", "b"]))
+
+    assert [item.dataset_id for item in batch.analysen] == ["a", "b"]
+    MetadataAnalysis(**fake_instance(MetadataAnalysis.model_json_schema(), rng))
+    parsed = parse_analysis_results([fake_tagged_answer(rng)])
+    assert parsed["parse_error"].isna().all()
+
+
+def test_server_answers_in_the_requested_format():
+    schema = MetadataAnalysis.model_json_schema()
+    with MockLLMServer(latency=0.001) as server:
+        tool_call = completion(
+            server,
+            tools=[
+                {
+                    "type": "function",
+                    "function": {"name": "MetadataAnalysis", "parameters": schema},
+                }
+            ],
+        ).json()
+        structured = completion(
+            server,
+            response_format={"type": "json_schema", "json_schema": {"schema": schema}},
+        ).json()
+
+    arguments = tool_call["choices"][0]["message"]["tool_calls"][0]["function"]
+    MetadataAnalysis.model_validate_json(arguments["arguments"])
+    MetadataAnalysis.model_validate_json(structured["choices"][0]["message"]["content"])
+    assert structured["usage"]["total_tokens"] > 0
+    assert server.stats == {"requests": 2, "errors": 0, "rate_limited": 0}
+
+
+def test_server_simulates_errors_and_rate_limits():
+    with MockLLMServer(latency=0.001, error_rate=1.0) as server:
+        assert completion(server).status_code == 500
+
+    with MockLLMServer(latency=0.001, rpm=2) as server:
+        statuses = [completion(server).status_code for _ in range(3)]
+        limited = completion(server)
+
+    assert statuses == [200, 200, 429]
+    assert float(limited.headers["Retry-After"]) > 0
+    assert server.stats["rate_limited"] == 2
@@ -0,0 +1,74 @@
+import copy
+
+import pandas as pd
+import pytest
+
+import portals
+from portals import (
+    PORTALS,
+    dataset_links,
+    harvest_portals,
+    interleave_portals,
+    read_portals,
+    register_portal,
+)
+
+
+@pytest.fixture
+def two_portals(ckan_server, packages, monkeypatch):
+    """Berlin and a second portal on stub servers, both serving the same ids."""
+    monkeypatch.setattr(portals, "PORTALS", copy.deepcopy(PORTALS))
+    monkeypatch.setattr(
+        portals,
+        "DEFAULT_HOST_LIMITS",
+        {"max_connections": 2, "requests_per_second": 1e6},
+    )
+    berlin = ckan_server(packages[:10])
+    other = ckan_server(packages[:4])
+    register_portal("berlin", berlin.api_base, "https://daten.berlin.de/datensaetze/")
+    register_portal("hamburg", other.api_base, "https://transparenz.hamburg.de/")
+    return berlin, other
+
+
+def test_harvested_portals_keep_berlin_ids_and_link_per_portal(
+    two_portals, packages, tmp_path
+):
+    changes = harvest_portals(["berlin", "hamburg"], data_dir=str(tmp_path))
+
+    assert {name: len(ids["new"]) for name, ids in changes.items()} == {
+        "berlin": 10,
+        "hamburg": 4,
+    }
+    df = read_portals(str(tmp_path))
+    berlin = df[df["portal"] == "berlin"]
+    hamburg = df[df["portal"] == "hamburg"]
+    assert sorted(berlin["id"]) == sorted(package["id"] for package in packages[:10])
+    assert sorted(hamburg["id"]) == sorted(
+        f"hamburg:{package['id']}" for package in packages[:4]
+    )
+    assert df["id"].is_unique
+
+    links = dataset_links(df)
+    assert (
+        links[berlin.index] == "https://daten.berlin.de/datensaetze/" + berlin["name"]
+    ).all()
+    assert (
+        links[hamburg.index] == "https://transparenz.hamburg.de/" + hamburg["name"]
+    ).all()
+
+
+def test_links_without_portal_column_or_dataset_url(monkeypatch):
+    monkeypatch.setattr(portals, "PORTALS", copy.deepcopy(PORTALS))
+    register_portal("ohne-links", "http://127.0.0.1/api/3/action")
+    df = pd.DataFrame({"name": ["a", None]})
+
+    assert dataset_links(df).tolist()[0] == PORTALS["berlin"]["dataset_url"] + "a"
+    assert dataset_links(df).isna().tolist() == [False, True]
+    assert dataset_links(df.assign(portal="ohne-links")).isna().all()
+
+
+def test_interleave_portals_takes_turns():
+    df = pd.DataFrame({"portal": ["a", "a", "a", "b", "c", "c"]}, index=list("uvwxyz"))
+
+    assert interleave_portals(df).tolist() == list("uxyvzw")
+    assert interleave_portals(df.drop(columns="portal")).equals(df.index)
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+
+import pytest
+
+from mock_llm import fake_instance
+from router import ProviderRouter
+from scheduler import AdaptiveConcurrency, RateLimitedScheduler
+from utils import AnalysisCache, MetadataAnalysis, openai_model, render_analysis_prompt
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def analysis(seed=0):
+    schema = MetadataAnalysis.model_json_schema()
+    return MetadataAnalysis(**fake_instance(schema, random.Random(seed)))
+
+
+@pytest.fixture
+def data(metadata):
+    return metadata.iloc[0]
+
+
+def test_cache_hits_are_not_counted_as_provider_calls(data, tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite"))
+    cached = analysis()
+    key = cache.make_key(render_analysis_prompt(data), openai_model, temperature=0)
+    cache.set(key, cached)
+    router = ProviderRouter(cache=cache, limits={"openai": {"rpm": 10}})
+    router.breakers["openai"].failures = 2
+
+    assert router.analyze(data) == cached
+
+    router.close()
+    assert router.breakers["openai"].failures == 2
+    assert len(router.latencies["openai"].latencies) == 0
+    assert router.budgets["openai"][0].tokens == 10
+
+
+def test_hedges_are_charged_to_the_budget_of_their_provider(data):
+    router = ProviderRouter(
+        limits={"openai": {"rpm": 600}, "mistral": {"rpm": 60, "tpm": 10**6}},
+        default_hedge_delay=0.01,
+        min_hedge_delay=0.01,
+    )
+
+    def slow_openai(data, use_openai, cache, raise_errors):
+        time.sleep(0.2 if use_openai else 0)
+        return analysis()
+
+    router.analysis = slow_openai
+
+    router.analyze(data)
+
+    router.close()
+    assert router.answered_by == {str(data["id"]): "mistral"}
+    assert router.stats["hedge_wins"] == 1
+    assert router.budgets["mistral"][0].tokens == pytest.approx(59, abs=0.1)
+    assert router.budgets["mistral"][1].tokens < 10**6
+    assert router.budgets["openai"][0].tokens == pytest.approx(599, abs=1)
+    assert len(router.latencies["mistral"].latencies) == 1
+
+
+def test_rate_limits_drain_the_budget_and_fail_over(data):
+    router = ProviderRouter(hedge_percentile=None, limits={"openai": {"rpm": 60}})
+
+    def limited_openai(data, use_openai, cache, raise_errors):
+        if use_openai:
+            raise RateLimitError("slow down")
+        return analysis()
+
+    router.analysis = limited_openai
+
+    router.analyze(data)
+
+    router.close()
+    assert router.stats["failovers"] == 1
+    assert router.breakers["openai"].failures == 1
+    assert router.budgets["openai"][0].tokens < 1
+
+
+def test_scheduler_limits_the_datasets_in_flight(metadata, tmp_path):
+    rows = [row for _, row in metadata.head(12).iterrows()]
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite"))
+    key = cache.make_key(render_analysis_prompt(rows[0]), openai_model, temperature=0)
+    cache.set(key, analysis())
+    router = ProviderRouter(cache=cache, hedge_percentile=None)
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def slow_analysis(data, use_openai, cache, raise_errors):
+        if data["id"] == rows[0]["id"]:
+            return cache.get(key)
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        return analysis()
+
+    router.analysis = slow_analysis
+    # A tolerance below 1 never lets the limit grow above the minimum.
+    concurrency = AdaptiveConcurrency(
+        initial=2, minimum=2, maximum=16, latency_tolerance=0.5
+    )
+    scheduler = RateLimitedScheduler(
+        rpm=60_000, tpm=10**9, base_backoff=0.001, concurrency=concurrency
+    )
+
+    results = scheduler.map(router.analyze, rows, estimate=router.estimate)
+
+    router.close()
+    assert router.estimate(rows[0]) == 0 and router.estimate(rows[1]) == 1
+    assert all(result is not None for result in results)
+    assert in_flight[1] == 2
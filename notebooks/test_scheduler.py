@@ -0,0 +1,77 @@
+import pytest
+
+from scheduler import AdaptiveConcurrency, RateLimitedScheduler
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class BadRequestError(Exception):
+    status_code = 400
+
+
+def fast_scheduler(**options):
+    return RateLimitedScheduler(
+        rpm=60_000, tpm=10**9, base_backoff=0.001, max_backoff=0.01, **options
+    )
+
+
+def test_limit_recovers_after_a_latency_shift():
+    concurrency = AdaptiveConcurrency(initial=8, maximum=16)
+    for _ in range(20):
+        concurrency.acquire()
+        concurrency.release(0.002)
+    for _ in range(200):
+        concurrency.acquire()
+        concurrency.release(2.1)
+
+    assert concurrency.best_latency == pytest.approx(2.1, rel=0.01)
+    assert concurrency.limit == 16
+
+
+def test_failed_requests_do_not_change_the_latency():
+    concurrency = AdaptiveConcurrency(initial=8)
+    concurrency.acquire()
+    concurrency.release(1.0)
+    concurrency.acquire()
+    concurrency.release()
+
+    assert concurrency.latency == 1.0
+    assert concurrency.in_flight == 0
+    concurrency.acquire()
+    concurrency.release(rate_limited=True)
+    assert concurrency.limit == 4
+
+
+def test_cache_hits_bypass_the_concurrency_controller():
+    scheduler = fast_scheduler(concurrency=AdaptiveConcurrency(initial=1, maximum=1))
+    in_flight = []
+
+    def cached(item):
+        in_flight.append(scheduler.concurrency.in_flight)
+        return item
+
+    assert scheduler.map(cached, range(20), estimate=lambda item: 0) == list(range(20))
+    assert set(in_flight) == {0}
+    assert scheduler.concurrency.latency is None
+
+
+def test_map_retries_transient_errors_and_reports_failures():
+    scheduler = fast_scheduler(max_retries=2)
+    calls = {}
+
+    def flaky(item):
+        calls[item] = calls.get(item, 0) + 1
+        if item == "bad":
+            raise BadRequestError("invalid")
+        if calls[item] == 1:
+            raise RateLimitError("slow down")
+        return item.upper()
+
+    results = scheduler.map(flaky, ["a", "bad", "b"], estimate=lambda item: 10)
+
+    assert results == ["A", None, "B"]
+    assert list(scheduler.failed) == [1]
+    assert calls == {"a": 2, "bad": 1, "b": 2}
+    assert scheduler.retries == 2
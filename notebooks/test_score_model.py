@@ -0,0 +1,48 @@
+from benchmarks import synthetic_results
+from ckan import active_tag_names, flatten_packages, read_snapshot, write_snapshot
+from score_model import (
+    CRITERIA,
+    TEXT_FIELDS,
+    ScorePredictor,
+    dataset_features,
+    predicted_results,
+)
+
+
+def snapshot(packages, path):
+    for package in packages[::3]:
+        package["author"] = None
+        package["geographical_granularity"] = None
+    write_snapshot(flatten_packages(packages), str(path))
+    df = read_snapshot(str(path))
+    df["formatted_tags"] = active_tag_names(df["tags"])
+    return df
+
+
+def test_features_of_a_snapshot_with_missing_categories(packages, tmp_path):
+    df = snapshot(packages, tmp_path / "metadata.parquet")
+    assert df["author"].dtype == "category" and df["author"].isna().any()
+
+    features = dataset_features(df)
+
+    assert features.shape[0] == len(df)
+    author_block = slice(
+        sum(TEXT_FIELDS[field] for field in list(TEXT_FIELDS)[:5]),
+        sum(TEXT_FIELDS.values()),
+    )
+    has_author = features[:, author_block].getnnz(axis=1) > 0
+    assert (has_author == df["author"].notna().to_numpy()).all()
+
+
+def test_predictor_trains_and_predicts_on_a_snapshot(packages, tmp_path):
+    df = snapshot(packages, tmp_path / "metadata.parquet")
+    results = synthetic_results(df).assign(id=df["id"])
+
+    predictor = ScorePredictor(min_samples=20, target_agreement=0.5).fit(df, results)
+    predictions = predictor.predict(df)
+
+    assert predictions.index.equals(df.index)
+    for criterion in CRITERIA:
+        assert predictions[f"{criterion}_score"].isin([1, 2, 3]).all()
+    local = predicted_results(predictions[predictions["confident"]])
+    assert list(local.columns[1::2]) == [f"{criterion}_score" for criterion in CRITERIA]
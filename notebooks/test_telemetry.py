@@ -0,0 +1,137 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from telemetry import (
+    CallMetrics,
+    add_hook,
+    attach_instructor_hooks,
+    dataset_context,
+    instrument_call,
+    record_cache_hit,
+    record_usage,
+    remove_hook,
+    set_scheduling,
+)
+
+
+class FakeInstructor:
+    """Stands in for an instructor client, which calls its hooks around each attempt."""
+
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def emit(self, event, *args):
+        self.handlers[event](*args)
+
+
+def usage(prompt_tokens, completion_tokens):
+    return SimpleNamespace(
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+        )
+    )
+
+
+@pytest.fixture
+def metrics(tmp_path):
+    metrics = add_hook(CallMetrics(str(tmp_path / "metrics.jsonl")))
+    yield metrics
+    remove_hook(metrics)
+
+
+def test_every_call_is_one_record(metrics):
+    client = attach_instructor_hooks(FakeInstructor())
+    with dataset_context("a"):
+        set_scheduling(queue_wait=0.5, attempt=0)
+        with instrument_call("openai", "gpt-4o-mini", "MetadataAnalysis"):
+            record_usage(usage(1000, 200))
+    with dataset_context("b"), pytest.raises(ValueError):
+        set_scheduling(queue_wait=1.5, attempt=2)
+        with instrument_call("openai", "gpt-4o-mini", "MetadataAnalysis"):
+            raise ValueError("invalid")
+    with dataset_context("c"):
+        record_cache_hit("openai", "gpt-4o-mini")
+    with dataset_context("d"):
+        with instrument_call("mistral", "mistral-small-latest", "MetadataAnalysis"):
+            client.emit("parse:error", ValueError("invalid"))
+            client.emit("completion:response", usage(300, 50))
+            client.emit("completion:response", usage(200, 50))
+
+    df = metrics.to_frame()
+    with open(metrics.path, encoding="utf-8") as file:
+        lines = [json.loads(line) for line in file]
+
+    assert df["dataset_id"].tolist() == [line["dataset_id"] for line in lines]
+    assert df["dataset_id"].tolist() == ["a", "b", "c", "d"]
+    assert df["outcome"].tolist() == ["ok", "error", "cache_hit", "ok"]
+    assert df.loc[1, "error"] == "ValueError: invalid"
+    assert df[["queue_wait", "attempt"]].values.tolist()[:2] == [[0.5, 0], [1.5, 2]]
+    assert df.loc[3, ["prompt_tokens", "completion_tokens"]].tolist() == [500, 100]
+    assert df.loc[3, "validation_retries"] == 1
+
+
+def test_summary_totals_and_provider_table(metrics):
+    with dataset_context("a"):
+        with instrument_call("openai", "gpt-4o-mini", "MetadataAnalysis"):
+            record_usage(usage(1000, 200))
+    with dataset_context("b"), pytest.raises(RuntimeError):
+        with instrument_call("openai", "gpt-4o-mini", "MetadataAnalysis"):
+            raise RuntimeError("timeout")
+    with dataset_context("a"):
+        record_cache_hit("openai", "gpt-4o-mini")
+    with dataset_context("c"):
+        with instrument_call("mistral", "mistral-small-latest", "MetadataScores"):
+            record_usage(usage(500, 100))
+
+    summary = metrics.summary()
+
+    totals = summary["totals"]
+    assert {
+        key: totals[key]
+        for key in ("calls", "errors", "cache_hits", "datasets", "prompt_tokens")
+    } == {
+        "calls": 3,
+        "errors": 1,
+        "cache_hits": 1,
+        "datasets": 2,
+        "prompt_tokens": 1500,
+    }
+    assert totals["completion_tokens"] == 300
+    assert totals["cost_usd"] == pytest.approx(
+        (1000 * 0.15 + 200 * 0.60 + 500 * 0.10 + 100 * 0.30) / 1e6
+    )
+    table = summary["by_provider"]
+    openai = table.loc[("openai", "gpt-4o-mini", "MetadataAnalysis")]
+    mistral = table.loc[("mistral", "mistral-small-latest", "MetadataScores")]
+    columns = ["calls", "errors", "prompt_tokens"]
+    assert openai[columns].tolist() == [2, 1, 500]
+    assert mistral[columns].tolist() == [1, 0, 500]
+    assert summary["slowest_datasets"].index.tolist().count("a") == 1
+
+
+def test_calls_without_hooks_are_not_recorded():
+    metrics = CallMetrics()
+    with instrument_call("openai", "gpt-4o-mini") as record:
+        record_usage(usage(10, 10))
+
+    assert record is None
+    assert metrics.summary()["totals"]["calls"] == 0
+
+
+def test_failing_hooks_do_not_break_the_call(metrics):
+    def broken(record):
+        raise KeyError("broken")
+
+    add_hook(broken)
+    try:
+        with instrument_call("openai", "gpt-4o-mini"):
+            pass
+    finally:
+        remove_hook(broken)
+
+    assert len(metrics.records) == 1
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from triage import (
+    NOT_SCORED,
+    TRIAGE_POLICY,
+    is_missing,
+    select_for_llm,
+    triage_metadata,
+    triage_results,
+)
+
+
+def test_rows_without_description_still_go_to_the_llm(metadata):
+    df = metadata.head(3).copy()
+    df["notes"] = ["", "Beschreibung", "null"]
+    df.loc[df.index[2], ["author", "formatted_tags"]] = [None, ""]
+
+    triage = triage_metadata(df)
+    needs_llm = select_for_llm(triage)
+
+    assert triage["missing_notes"].tolist() == [True, False, True]
+    assert needs_llm.tolist() == [True, True, False]
+    assert triage.loc[df.index[0], "dateninhalt_score"] == 1
+
+    strict = select_for_llm(triage, {**TRIAGE_POLICY, "skip_without_notes": True})
+    assert strict.tolist() == [False, True, False]
+
+
+def test_rule_results_leave_undecided_criteria_unscored(metadata):
+    df = metadata.head(1).copy()
+    df["notes"] = None
+
+    results = triage_results(triage_metadata(df))
+
+    assert results["dateninhalt_score"].tolist() == [1]
+    assert results["tag_qualitaet"].tolist() == [NOT_SCORED]
+    assert results["tag_qualitaet_score"].isna().all()
+
+
+def test_empty_lists_and_hidden_nulls_are_missing():
+    values = pd.Series([[], ["a"], None, " NULL ", np.array([]), "Titel"], dtype=object)
+    tags = pd.Series([[], ["a"], None], dtype=pd.ArrowDtype(pa.list_(pa.string())))
+
+    assert is_missing(values).tolist() == [True, False, True, True, True, False]
+    assert is_missing(tags).tolist() == [True, False, True]
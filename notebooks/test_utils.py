@@ -0,0 +1,428 @@
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+
+import pandas as pd
+
+import utils
+from checkpoint import CheckpointStore
+from mock_llm import fake_instance
+from scheduler import RateLimitedScheduler
+from utils import (
+    ANALYSIS_TAGS,
+    CRITERION_LABELS,
+    AnalysisCache,
+    MetadataAnalysis,
+    MetadataScores,
+    SYSTEM_MESSAGE,
+    PROMPT_DATASET,
+    _prompt_fields,
+    add_rationales,
+    analyze_batch,
+    check_text_properties_chunked,
+    chunk_texts,
+    configure_client,
+    do_full_analysis,
+    get_client,
+    do_batched_analysis,
+    estimate_tokens,
+    iter_text_anomalies,
+    merge_anomalies,
+    pack_batches,
+    parse_analysis_results,
+    PROMPT_ANOMALIES,
+    render_batch_prompt,
+)
+
+CRITERIA = [
+    "dateninhalt",
+    "methodik",
+    "datenqualität",
+    "geographie",
+    "tag-qualität",
+    "referenz",
+]
+
+
+def tagged(score=2):
+    return "".join(
+        f"<{tag}>Analyse {tag}</{tag}><{tag}-score>{score}</{tag}-score>\n"
+        for tag in CRITERIA
+    )
+
+
+def test_sections_wrapped_in_other_tags_are_found():
+    responses = [
+        tagged(),
+        f"<analyse>\n{tagged(3)}</analyse>",
+        "<antwort><analyse><dateninhalt>gut</dateninhalt></analyse></antwort>",
+    ]
+
+    df = parse_analysis_results(responses)
+
+    assert df["parse_error"].iloc[:2].isna().all()
+    assert df["methodik_score"].tolist()[:2] == [2, 3]
+    assert df.loc[1, "tag_qualitaet"] == "Analyse tag-qualität"
+    assert df.loc[2, "dateninhalt"] == "gut"
+    assert "missing dateninhalt;" not in df.loc[2, "parse_error"]
+    assert (
+        df.loc[2, "parse_error"].count("missing")
+        == len(set(ANALYSIS_TAGS.values())) - 1
+    )
+
+
+def test_invalid_scores_and_missing_responses_are_reported():
+    df = parse_analysis_results(
+        [tagged().replace(">2</referenz", ">5</referenz"), None]
+    )
+
+    assert df.loc[0, "parse_error"] == "invalid referenz_score: '5'"
+    assert df["referenz_score"].isna().all()
+    assert df.loc[1, "parse_error"] == "no response"
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_rationales_are_retried_and_checkpointed(metadata, tmp_path, monkeypatch):
+    df = metadata.head(3)
+    scores = {f"{criterion}_score": 2 for criterion in CRITERION_LABELS}
+    results = pd.DataFrame([scores] * 3, index=df.index)
+    results.loc[df.index[0], "referenz_score"] = 1
+    results.loc[df.index[2], "methodik_score"] = 1
+    store = CheckpointStore("v1", path=str(tmp_path / "analysis.jsonl"))
+    calls = []
+
+    def explain_scores(data, scores, criteria, use_openai, cache, raise_errors):
+        calls.append(data["id"])
+        assert raise_errors
+        if calls.count(data["id"]) == 1 and data.name == df.index[2]:
+            raise RateLimitError("slow down")
+        return {criterion: f"Begründung {criterion}" for criterion in criteria}
+
+    monkeypatch.setattr(utils, "explain_scores", explain_scores)
+    scheduler = RateLimitedScheduler(rpm=60_000, tpm=10**9, base_backoff=0.001)
+
+    explained = add_rationales(df, results, scheduler=scheduler, store=store)
+
+    assert explained["referenz"].fillna("").tolist() == ["Begründung referenz", "", ""]
+    assert explained["methodik"].fillna("").tolist() == ["", "", "Begründung methodik"]
+    assert scheduler.retries == 1
+    stored = store.load_results().set_index("id")
+    assert sorted(stored.index) == sorted(df["id"].iloc[[0, 2]])
+    assert stored.loc[df["id"].iloc[2], "methodik"] == "Begründung methodik"
+    assert stored.loc[df["id"].iloc[2], "methodik_score"] == 1
+    assert stored.loc[df["id"].iloc[2], "referenz_score"] == 2
+    assert store.pending([df.iloc[0]]) == []
+
+
+def test_cache_hits_misses_and_key_changes(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite"))
+    key = cache.make_key("Prompt", "model-a", temperature=0)
+    result = MetadataAnalysis(
+        **fake_instance(MetadataAnalysis.model_json_schema(), random.Random(0))
+    )
+
+    assert cache.get(key) is None
+    cache.set(key, result)
+    cache.set("failed", None)
+
+    assert cache.get(key) == result
+    assert key in cache and "failed" not in cache
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1}
+    assert {
+        cache.make_key("Prompt 2", "model-a", temperature=0),
+        cache.make_key("Prompt", "model-b", temperature=0),
+        cache.make_key("Prompt", "model-a", temperature=0.5),
+        cache.make_key("Prompt", "model-a", 0, response_model=MetadataScores),
+    }.isdisjoint({key})
+    assert cache.make_key("Prompt", "model-a", temperature=0) == key
+
+
+def test_cache_evicts_least_recently_used_and_old_entries(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    result = MetadataAnalysis(
+        **fake_instance(MetadataAnalysis.model_json_schema(), random.Random(0))
+    )
+    now = [1_000_000.0]
+    monkeypatch.setattr(utils.time, "time", lambda: now[0])
+    cache = AnalysisCache(path, max_entries=2, max_age_days=1)
+    for key in ("a", "b", "c"):
+        now[0] += 1
+        cache.set(key, result)
+    now[0] += 1
+    cache.get("a")
+
+    assert cache.evict() == 1
+    assert "a" in cache and "c" in cache and "b" not in cache
+
+    now[0] += 86400 - 2
+    cache.set("d", result)
+    assert cache.evict() == 1  # "a" is the oldest, although recently used
+    assert "a" not in cache
+
+    now[0] += 86400 + 1
+    assert AnalysisCache(path, max_entries=2, max_age_days=1).stats()["entries"] == 0
+
+
+def label_answers(server, monkeypatch, drop=None, break_with=None):
+    """Answer every dataset of a batch with its own id as `dateninhalt`.
+
+    Batches containing `drop` leave it out, batches containing `break_with` are
+    answered with invalid JSON. Single-dataset answers are labelled "einzeln". The
+    dataset ids of each request are recorded in the returned list.
+    """
+    completion = server._completion
+    requests = []
+
+    def answer(request, rng):
+        payload = completion(request, rng)
+        prompt = " ".join(str(m.get("content")) for m in request["messages"])
+        ids = list(dict.fromkeys(re.findall(r'<datensatz id="([^"]+)">', prompt)))
+        requests.append(ids)
+        message = payload["choices"][0]["message"]
+        target, key = (
+            (message["tool_calls"][0]["function"], "arguments")
+            if message.get("tool_calls")
+            else (message, "content")
+        )
+        content = json.loads(target[key])
+        if not ids:
+            content["dateninhalt"] = "einzeln"
+        elif break_with in ids and len(ids) > 1:
+            target[key] = "kein JSON"
+            return payload
+        else:
+            content["analysen"] = [
+                dict(item, dateninhalt=item["dataset_id"])
+                for item in content["analysen"]
+                if item["dataset_id"] != drop
+            ]
+        target[key] = json.dumps(content)
+        return payload
+
+    monkeypatch.setattr(server, "_completion", answer)
+    return requests
+
+
+def test_batches_respect_the_token_budget(metadata):
+    rows = [row for _, row in metadata.iterrows()]
+    base = estimate_tokens(SYSTEM_MESSAGE + render_batch_prompt([]))
+    tokens = [estimate_tokens(PROMPT_DATASET.format(**_prompt_fields(r))) for r in rows]
+    budget = base + 3 * max(tokens)
+
+    batches = pack_batches(rows, max_datasets=5, max_prompt_tokens=budget)
+
+    assert [row["id"] for batch in batches for row in batch] == metadata["id"].tolist()
+    start = 0
+    for batch in batches:
+        used = base + sum(tokens[start : start + len(batch)])
+        assert 3 <= len(batch) <= 5 or batch is batches[-1]
+        assert used <= budget
+        if start + len(batch) < len(rows) and len(batch) < 5:
+            assert used + tokens[start + len(batch)] > budget
+        start += len(batch)
+    assert {
+        len(batch)
+        for batch in pack_batches(
+            rows, max_completion_tokens=2000, completion_tokens_per_dataset=1000
+        )
+    } == {2}
+
+
+def test_missing_batch_answers_are_retried_alone(metadata, llm_server, monkeypatch):
+    rows = [row for _, row in metadata.head(4).iterrows()]
+    ids = [row["id"] for row in rows]
+    requests = label_answers(llm_server, monkeypatch, drop=ids[1])
+
+    results = analyze_batch(rows)
+
+    assert requests == [ids, []]
+    assert {key: value.dateninhalt for key, value in results.items()} == {
+        ids[0]: ids[0],
+        ids[1]: "einzeln",
+        ids[2]: ids[2],
+        ids[3]: ids[3],
+    }
+
+
+def test_malformed_batches_are_halved(metadata, llm_server, monkeypatch):
+    rows = [row for _, row in metadata.head(4).iterrows()]
+    ids = [row["id"] for row in rows]
+    requests = label_answers(llm_server, monkeypatch, break_with=ids[1])
+
+    results = analyze_batch(rows)
+
+    # instructor may ask again after invalid JSON, so only distinct batches count.
+    batches = [batch for batch in requests if batch]
+    assert [b for i, b in enumerate(batches) if b not in batches[:i]] == [
+        ids,
+        ids[:2],
+        ids[2:],
+    ]
+    assert requests.count([]) == 2
+    assert {key: value.dateninhalt for key, value in results.items()} == {
+        ids[0]: "einzeln",
+        ids[1]: "einzeln",
+        ids[2]: ids[2],
+        ids[3]: ids[3],
+    }
+
+
+def test_batched_analysis_keeps_the_row_order(metadata, llm_server, monkeypatch):
+    rows = [row for _, row in metadata.head(7).iterrows()]
+    requests = label_answers(llm_server, monkeypatch)
+
+    results = do_batched_analysis(rows, n_parallel=3, max_datasets=3)
+
+    # The last dataset is left alone in its batch and analyzed on its own.
+    assert sorted(map(len, requests)) == [0, 3, 3]
+    assert [result.dateninhalt for result in results] == [
+        row["id"] for row in rows[:6]
+    ] + ["einzeln"]
+
+
+def answer_anomalies(server, monkeypatch):
+    """Report a typo in the first and the last entry of every chunk, plus a made up one.
+
+    The category is spelled differently per chunk. The prompts are recorded in the
+    returned list.
+    """
+    completion = server._completion
+    prompts = []
+
+    def answer(request, rng):
+        payload = completion(request, rng)
+        prompt = request["messages"][-1]["content"]
+        prompts.append(prompt)
+        n = len(re.findall(r"^\[\d+\] ", prompt, flags=re.M))
+        content = {
+            "anomalien": [
+                {
+                    "kategorie": "Tippfehler" if len(prompts) % 2 else " tippfehler",
+                    "beschreibung": "Der Titel enthält einen Tippfehler.",
+                    "referenzen": [1, n, n + 1, 0],
+                }
+            ]
+        }
+        message = payload["choices"][0]["message"]
+        message["tool_calls"][0]["function"]["arguments"] = json.dumps(content)
+        return payload
+
+    monkeypatch.setattr(server, "_completion", answer)
+    return prompts
+
+
+def test_chunks_are_bounded_by_tokens():
+    texts = pd.Series(
+        ["a" * 40, None, "b" * 40, "c" * 400, "d" * 20, "e" * 20],
+        index=[f"id-{i}" for i in range(6)],
+    )
+
+    chunks = chunk_texts(texts, max_tokens=20)
+
+    assert [chunk.index.tolist() for chunk in chunks] == [
+        ["id-0", "id-1", "id-2"],
+        ["id-3"],  # longer than max_tokens, so alone in its chunk
+        ["id-4", "id-5"],
+    ]
+    assert pd.concat(chunks).equals(texts)
+    assert chunk_texts(texts.iloc[:0]) == []
+
+
+def test_chunk_references_are_mapped_to_dataset_ids(metadata, llm_server, monkeypatch):
+    texts = metadata.set_index("id")["title"].head(9)
+    max_tokens = texts.map(estimate_tokens).max() * 3
+    chunks = chunk_texts(texts, max_tokens=max_tokens)
+    prompts = answer_anomalies(llm_server, monkeypatch)
+
+    found = dict(
+        iter_text_anomalies("Titel", texts, use_openai=True, max_tokens=max_tokens)
+    )
+    prompts.clear()
+    merged = check_text_properties_chunked(
+        "Titel", texts, use_openai=True, n_parallel=1, max_tokens=max_tokens
+    )
+
+    assert len(chunks) == len(found) > 1
+    assert [finding["dataset_ids"] for finding in found[0]] == [
+        [texts.index[0], chunks[0].index[-1]]
+    ]
+    assert len(merged) == 1
+    assert merged.loc[0, "kategorie"] == "Tippfehler"
+    assert merged.loc[0, "dataset_ids"] == [
+        id_ for chunk in chunks for id_ in (chunk.index[0], chunk.index[-1])
+    ]
+    assert merged.loc[0, "n_datasets"] == 2 * len(chunks)
+    assert len(prompts) == len(chunks)
+
+
+def test_single_chunk_sees_the_same_texts_as_the_global_check(
+    metadata, llm_server, monkeypatch
+):
+    texts = metadata.set_index("id")["title"].head(5)
+    prompts = answer_anomalies(llm_server, monkeypatch)
+
+    merged = check_text_properties_chunked("Titel", texts, use_openai=True)
+
+    (prompt,) = prompts
+    global_prompt = PROMPT_ANOMALIES.format(feature="Titel", data=", ".join(texts))
+    listed = re.findall(r"^\[\d+\] (.*)$", prompt, flags=re.M)
+    assert listed == texts.tolist()
+    assert all(text in global_prompt for text in listed)
+    assert merged["dataset_ids"].tolist() == [[texts.index[0], texts.index[-1]]]
+
+
+def test_findings_of_one_category_are_merged():
+    merged = merge_anomalies(
+        [
+            {"kategorie": "Abkürzung", "beschreibung": "a", "dataset_ids": ["x"]},
+            {"kategorie": "Tippfehler", "beschreibung": "b", "dataset_ids": ["x", "y"]},
+            {
+                "kategorie": "tippfehler ",
+                "beschreibung": "c",
+                "dataset_ids": ["y", "z"],
+            },
+        ]
+    )
+
+    assert merged[["kategorie", "beschreibung", "n_datasets"]].values.tolist() == [
+        ["Tippfehler", "b", 3],
+        ["Abkürzung", "a", 1],
+    ]
+    assert merged.loc[0, "dataset_ids"] == ["x", "y", "z"]
+
+
+def test_importing_utils_creates_no_client():
+    code = (
+        "import sys, utils; "
+        "print(sorted(set(sys.modules) & {'openai', 'mistralai', 'instructor'}), "
+        "utils._clients)"
+    )
+
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(utils.__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    assert output.strip() == "[] {}"
+
+
+def test_configured_base_url_is_used(metadata, llm_server):
+    client = get_client("openai_client")
+    assert str(client.base_url).rstrip("/") == llm_server.openai_url
+
+    result = do_full_analysis(metadata.iloc[0])
+
+    assert isinstance(result, MetadataAnalysis)
+    assert llm_server.stats["requests"] == 1
+    configure_client("openai", base_url="http://127.0.0.1:1/v1", api_key="mock")
+    assert get_client("openai_client") is not client
+    assert str(utils.openai_client.base_url) == "http://127.0.0.1:1/v1/"
@@ -0,0 +1,36 @@
+import json
+
+import pandas as pd
+
+from validation import distribution_table, validate_catalogue
+
+
+def test_catalogue_without_distributions(metadata):
+    df = metadata.head(3).copy()
+    df["resources"] = pd.Series([None, "[]", None], index=df.index, dtype=object)
+
+    packages, matrix = validate_catalogue(df)
+
+    assert matrix.empty
+    assert packages["n_distributions"].tolist() == [0, 0, 0]
+    assert not packages["has_distribution"].any()
+    assert not packages["mandatory_ok"].any()
+
+
+def test_distributions_are_checked_per_package(metadata):
+    df = metadata.head(2).copy()
+    resources = [
+        [{"url": "https://example.org/a.csv", "format": "CSV"}, {"name": "ohne URL"}],
+        [],
+    ]
+    df["resources"] = pd.Series(
+        [json.dumps(value) for value in resources], index=df.index, dtype=object
+    )
+
+    dist = distribution_table(df)
+    packages, matrix = validate_catalogue(df)
+
+    assert dist["package_id"].tolist() == [df["id"].iloc[0]] * 2
+    assert matrix["dcat:accessURL"].tolist() == [True, False]
+    assert packages["n_distributions"].tolist() == [2, 0]
+    assert packages.loc[df["id"].iloc[0], "dcat:accessURL"] == 0.5
@@ -0,0 +1,150 @@
+import pandas as pd
+
+from utils import DCAT_CLASS_DATASET, HIDDEN_NULLS
+
+# Metadata fields checked before the LLM analysis, mapped to the DataFrame columns.
+TRIAGE_FIELDS = {
+    "title": "title",
+    "notes": "notes",
+    "tags": "formatted_tags",
+    "geo_coverage": "geographical_coverage",
+    "geo_granularity": "geographical_granularity",
+    "author": "author",
+}
+
+# DCAT-AP.de properties of the Dataset class that correspond to TRIAGE_FIELDS
+DCAT_PROPERTY_FIELDS = {
+    "dct:title": "title",
+    "dct:description": "notes",
+    "dcat:keyword": "tags",
+    "dct:spatial": "geo_coverage",
+    "dcatde:politicalGeocodingLevelURI": "geo_granularity",
+    "dct:creator": "author",
+}
+
+MANDATORY_FIELDS = [
+    DCAT_PROPERTY_FIELDS[prop]
+    for _, prop, _, obligation, _ in DCAT_CLASS_DATASET
+    if obligation == "M" and prop in DCAT_PROPERTY_FIELDS
+]
+
+# Deterministic scores: (criterion, condition, rationale). The condition is the name of
+# a flag column created by `triage_metadata`. A criterion gets score 1 if its condition holds.
+TRIAGE_RULES = [
+    (
+        "dateninhalt",
+        "missing_notes",
+        "Die Beschreibung fehlt. Ohne Beschreibung ist nicht erkennbar, worum es in dem Datensatz geht.",
+    ),
+    (
+        "methodik",
+        "missing_notes",
+        "Die Beschreibung fehlt. Es gibt keine Angaben zur Erhebung oder Quelle der Daten.",
+    ),
+    (
+        "datenqualitaet",
+        "missing_notes",
+        "Die Beschreibung fehlt. Es gibt keine Angaben zur Qualität oder Vollständigkeit der Daten.",
+    ),
+    (
+        "geographie",
+        "missing_geo",
+        "Geographischer Bezug und geographische Granularität fehlen.",
+    ),
+    (
+        "tag_qualitaet",
+        "missing_tags",
+        "Es sind keine Tags vergeben.",
+    ),
+    (
+        "referenz",
+        "missing_author",
+        "Die zuständige Stelle fehlt.",
+    ),
+]
+
+# Which rows still go to the LLM. A row is skipped if at least `max_missing_fields`
+# of the TRIAGE_FIELDS are missing, or if it has no description and
+# `skip_without_notes` is set. Off by default: the rules only score the criteria that
+# depend on the description, the LLM still rates e.g. title, tags and time reference.
+TRIAGE_POLICY = {
+    "skip_without_notes": False,
+    "max_missing_fields": 3,
+}
+
+NOT_SCORED = (
+    "Nicht bewertet: Der Datensatz wurde wegen fehlender Metadaten nicht an das LLM übergeben."
+)
+
+
+def is_missing(series):
+    """Flag values that are empty, NaN or one of the HIDDEN_NULLS.
+
+    Only column-wise string operations are used. Empty lists (e.g. tags) are
+    rendered as "[]", one of the HIDDEN_NULLS, so they are missing too.
+    """
+    text = series.astype("string").str.strip().str.lower()
+    return (series.isna() | text.isin(HIDDEN_NULLS)).fillna(False).astype(bool)
+
+
+def triage_metadata(df):
+    """Check all records for missing or hidden-null metadata and score trivial cases.
+
+    Args:
+        df (pd.DataFrame): The metadata with the columns of TRIAGE_FIELDS.
+
+    Returns:
+        pd.DataFrame: Same index as `df`. One `missing_<field>` flag per field,
+            `missing_geo`, `n_missing`, `missing_mandatory`, and a nullable
+            `<criterion>_score` column per rule. Scores are NA where the rules
+            cannot decide.
+    """
+    triage = pd.DataFrame(index=df.index)
+    for field, column in TRIAGE_FIELDS.items():
+        if column in df.columns:
+            triage[f"missing_{field}"] = is_missing(df[column])
+        else:
+            triage[f"missing_{field}"] = True
+    triage["missing_geo"] = (
+        triage["missing_geo_coverage"] & triage["missing_geo_granularity"]
+    )
+    triage["n_missing"] = triage[[f"missing_{field}" for field in TRIAGE_FIELDS]].sum(
+        axis=1
+    )
+    triage["missing_mandatory"] = triage[
+        [f"missing_{field}" for field in MANDATORY_FIELDS]
+    ].any(axis=1)
+
+    for criterion, condition, _ in TRIAGE_RULES:
+        triage[f"{criterion}_score"] = pd.Series(pd.NA, index=df.index, dtype="Int64")
+        triage.loc[triage[condition], f"{criterion}_score"] = 1
+    return triage
+
+
+def select_for_llm(triage, policy=TRIAGE_POLICY):
+    """Decide which rows still need the LLM analysis.
+
+    Returns:
+        pd.Series: Boolean mask aligned with the triage index.
+    """
+    skip = triage["n_missing"] >= policy["max_missing_fields"]
+    if policy["skip_without_notes"]:
+        skip |= triage["missing_notes"]
+    print(
+        f"{(~skip).sum()} of {len(triage)} datasets need the LLM analysis, "
+        f"{skip.sum()} are scored by rules only."
+    )
+    return ~skip
+
+
+def triage_results(triage):
+    """Build analysis results for rows that are scored by rules only.
+
+    The columns match `parse_instructor_results`, so the rows can be combined with
+    the LLM results. Criteria the rules cannot decide are left unscored.
+    """
+    results = pd.DataFrame(index=triage.index)
+    for criterion, condition, rationale in TRIAGE_RULES:
+        results[criterion] = triage[condition].map({True: rationale, False: NOT_SCORED})
+        results[f"{criterion}_score"] = triage[f"{criterion}_score"]
+    return results
@@ -1,15 +1,27 @@
 import pandas as pd
 import os
 import re
-from openai import OpenAI
-from mistralai import Mistral
-import instructor
-from instructor import Mode
-from pydantic import BaseModel, Field
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
+from pydantic import BaseModel, Field, create_model
 from typing import Literal
 
 from dotenv import load_dotenv
 
+from scheduler import RateLimitedScheduler, estimate_tokens
+from telemetry import (
+    attach_instructor_hooks,
+    dataset_context,
+    instrument_call,
+    record_cache_hit,
+    record_usage,
+)
+
 load_dotenv()
 
 
@@ -59,85 +71,230 @@ class MetadataAnalysis(BaseModel):
     )
 
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI()
+class DatasetAnalysis(MetadataAnalysis):
+    dataset_id: str = Field(..., description="ID des analysierten Datensatzes")
+
+
+class MetadataAnalysisList(BaseModel):
+    analysen: list[DatasetAnalysis] = Field(
+        ..., description="Eine Analyse für jeden Datensatz"
+    )
+
+
+MetadataScores = create_model(
+    "MetadataScores",
+    __doc__="Scores only, without the rationales, for the fast analysis mode.",
+    **{
+        name: (field.annotation, field)
+        for name, field in MetadataAnalysis.model_fields.items()
+        if name.endswith("_score")
+    },
+)
+
 
-instructor_openai_client = instructor.from_openai(openai_client)
+@lru_cache(maxsize=None)
+def rationale_model(criteria):
+    """Build a response model with the rationale fields of MetadataAnalysis for `criteria` (a tuple)."""
+    return create_model(
+        "MetadataRationale",
+        **{
+            criterion: (str, MetadataAnalysis.model_fields[criterion])
+            for criterion in criteria
+        },
+    )
 
 
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
-mistral_client = Mistral(api_key=MISTRAL_API_KEY)
 model = "mistral-small-latest"
 SYSTEM_MESSAGE = """"Du bist ein hilfreicher Assistent für ein Statistikamt. Du wirst gebeten, Metadaten für einen Datensatz zu analysieren. Bleibe stets wahrheitsgemäß und objektiv. Schreib nur das, was du anhand der vom Benutzer bereitgestellten Metadaten sicher feststellen kannst. Mache keine Annahmen. Schreibe einfach und klar. Schreibe immer in deutscher Sprache."""
 
-instructor_mistral_client = instructor.from_mistral(
-    client=mistral_client,
-    model=model,
-    mode=Mode.MISTRAL_TOOLS,
-    max_tokens=4096,
-)
+
+# The provider SDKs are slow to import, so the clients are created on first use.
+# `configure_client` sets options like `base_url` or `api_key` before that.
+_client_options = {"openai": {}, "mistral": {}}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _make_openai_client():
+    from openai import OpenAI
+
+    return OpenAI(**_client_options["openai"])
+
+
+def _make_mistral_client():
+    from mistralai import Mistral
+
+    options = {"api_key": MISTRAL_API_KEY, **_client_options["mistral"]}
+    if "base_url" in options:
+        options["server_url"] = options.pop("base_url")
+    return Mistral(**options)
+
+
+def _make_instructor_openai_client():
+    import instructor
+
+    return attach_instructor_hooks(instructor.from_openai(get_client("openai_client")))
+
+
+def _make_instructor_mistral_client():
+    import instructor
+    from instructor import Mode
+
+    return attach_instructor_hooks(
+        instructor.from_mistral(
+            client=get_client("mistral_client"),
+            model=model,
+            mode=Mode.MISTRAL_TOOLS,
+            max_tokens=4096,
+        )
+    )
+
+
+CLIENT_FACTORIES = {
+    "openai_client": _make_openai_client,
+    "mistral_client": _make_mistral_client,
+    "instructor_openai_client": _make_instructor_openai_client,
+    "instructor_mistral_client": _make_instructor_mistral_client,
+}
+
+
+def get_client(name):
+    """Return one of the CLIENT_FACTORIES clients, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(name)
+    if client is None:
+        client = CLIENT_FACTORIES[name]()
+        with _clients_lock:
+            client = _clients.setdefault(name, client)
+    return client
+
+
+def configure_client(provider, **options):
+    """Set options for the clients of a provider ("openai" or "mistral"), e.g. `base_url`.
+
+    Already created clients of that provider are dropped and re-created on next use.
+    """
+    _client_options[provider] = options
+    with _clients_lock:
+        for name in list(_clients):
+            if provider in name:
+                del _clients[name]
+
+
+def __getattr__(name):
+    # Keeps `utils.openai_client` etc. working without creating clients at import time.
+    if name in CLIENT_FACTORIES:
+        return get_client(name)
+    if name == "few_shots":
+        return load_few_shots()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Using the currently most cheap but capable AI model GPT4o-Mini
+openai_model = "gpt-4o-mini"
+
+
 def call_openai(
-    prompt, modelId="gpt-4o-mini", temperature=0, max_tokens=4096, use_instructor=True
+    prompt,
+    modelId=openai_model,
+    temperature=0,
+    max_tokens=4096,
+    use_instructor=True,
+    raise_errors=False,
 ):
     try:
-        if use_instructor:
-            chat_response = instructor_openai_client.messages.create(
-                model=modelId,
-                response_model=MetadataAnalysis,
-                messages=[
-                    {"role": "system", "content": SYSTEM_MESSAGE},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0,
-            )
-            return chat_response
-        else:
-            completion = openai_client.chat.completions.create(
-                model=modelId,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                messages=[
-                    {"role": "system", "content": SYSTEM_MESSAGE},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            return completion.choices[0].message.content
+        with instrument_call(
+            "openai", modelId, "MetadataAnalysis" if use_instructor else "text"
+        ):
+            if use_instructor:
+                chat_response = get_client("instructor_openai_client").messages.create(
+                    model=modelId,
+                    response_model=MetadataAnalysis,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_MESSAGE},
+                        {"role": "user", "content": prompt},
+                    ],
+                    temperature=0,
+                )
+                return chat_response
+            else:
+                completion = get_client("openai_client").chat.completions.create(
+                    model=modelId,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_MESSAGE},
+                        {"role": "user", "content": prompt},
+                    ],
+                )
+                record_usage(completion)
+                return completion.choices[0].message.content
 
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error: {e}")
         return None
 
 
-def call_mistral(prompt, model=model, use_instructor=True):
+def call_mistral(prompt, model=model, use_instructor=True, raise_errors=False):
     try:
-        if use_instructor:
-            chat_response = instructor_mistral_client.messages.create(
-                response_model=MetadataAnalysis,
-                messages=[
-                    {"role": "system", "content": SYSTEM_MESSAGE},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0,
-            )
-            return chat_response
-        else:
-            chat_response = mistral_client.complete(
-                model=model,
-                messages=[
-                    {"role": "system", "content": SYSTEM_MESSAGE},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0,
-            )
-            return chat_response.choices[0].message.content
+        with instrument_call(
+            "mistral", model, "MetadataAnalysis" if use_instructor else "text"
+        ):
+            if use_instructor:
+                chat_response = get_client("instructor_mistral_client").messages.create(
+                    response_model=MetadataAnalysis,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_MESSAGE},
+                        {"role": "user", "content": prompt},
+                    ],
+                    temperature=0,
+                )
+                return chat_response
+            else:
+                chat_response = get_client("mistral_client").complete(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_MESSAGE},
+                        {"role": "user", "content": prompt},
+                    ],
+                    temperature=0,
+                )
+                record_usage(chat_response)
+                return chat_response.choices[0].message.content
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error: {e}")
         return None
 
 
+def call_structured(prompt, response_model, use_openai=True, max_tokens=4096):
+    """Send a prompt through instructor and return an instance of `response_model`. Raises on errors."""
+    client = get_client(
+        "instructor_openai_client" if use_openai else "instructor_mistral_client"
+    )
+    kwargs = {"model": openai_model} if use_openai else {}
+    with instrument_call(
+        "openai" if use_openai else "mistral",
+        openai_model if use_openai else model,
+        response_model.__name__,
+    ):
+        return client.messages.create(
+            response_model=response_model,
+            messages=[
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0,
+            max_tokens=max_tokens,
+            **kwargs,
+        )
+
+
 PROMPT_ANOMALIES = """Du bist Experte für Datenqualität und sollst einen Datenkatalog überprüfen. Du erhältst eine kommagetrennte Liste von {feature} aller Datensätze im Katalog. Du sollst die Beschreibungen auf Anomalien prüfen. Hier ist die kommagetrennte Liste von {feature} der Datensätze:
 
 <datensatz-{feature}>
@@ -151,10 +308,164 @@ def check_text_properties(feature, data):
     """Check the text properties of the titles and descriptions of the datasets globally. Each will be provided to the LLM as a comma-separated list. The analysis will be done in one go, not per dataset."""
     return call_mistral(PROMPT_ANOMALIES.format(feature=feature, data=data))
 
-with open('../data/few_shot_prompts.txt', 'r', encoding='utf-8') as file:
-    few_shots = file.read()
 
-PROMPT_ANALYSIS = """Du erhältst die Metadaten eines Datensatzes. Diese sollst du detailliert und genau analysieren. Die Metadaten bestehen aus einem Titel, einer Beschreibung, dem geographischem Bezug, der geographischen Granularität, einer Liste von Tags und der zuständigen Stelle. Du sollst die Metadaten analysieren und sicherstellen, dass diese aussagekräftig, vollständig und von hoher Qualität sind. 
+class Anomalie(BaseModel):
+    kategorie: str = Field(
+        ..., description="Kurze, allgemeine Bezeichnung der Art der Anomalie"
+    )
+    beschreibung: str = Field(
+        ..., description="Kurze Erklärung, warum diese Anomalie ein Problem ist"
+    )
+    referenzen: list[int] = Field(
+        ...,
+        description="Nummern der Einträge, in denen die Anomalie vorkommt",
+    )
+
+
+class AnomalieListe(BaseModel):
+    anomalien: list[Anomalie] = Field(..., description="Alle gefundenen Anomalien")
+
+
+PROMPT_ANOMALIES_CHUNK = """Du bist Experte für Datenqualität und sollst einen Datenkatalog überprüfen. Du erhältst eine nummerierte Liste von {feature} eines Teils der Datensätze im Katalog. Du sollst die Einträge auf Anomalien prüfen. Hier ist die Liste von {feature} der Datensätze:
+
+<datensatz-{feature}>
+{data}
+</datensatz-{feature}>
+
+Prüfe nun, ob es Anomalien oder sonstige Auffälligkeiten in den {feature} gibt. Bitte liste alle Anomalien auf, die du findest, kommentiere kurz, warum diese ein Problem sind, und gib die Nummern aller Einträge an, in denen die Anomalie vorkommt."""
+
+
+def chunk_texts(texts, max_tokens=6000):
+    """Split a Series of texts (indexed by dataset id) into chunks of at most `max_tokens` tokens."""
+    chunks = []
+    start, chunk_tokens = 0, 0
+    tokens = texts.fillna("").astype(str).map(estimate_tokens).to_numpy()
+    for position, text_tokens in enumerate(tokens):
+        if position > start and chunk_tokens + text_tokens > max_tokens:
+            chunks.append(texts.iloc[start:position])
+            start, chunk_tokens = position, 0
+        chunk_tokens += text_tokens
+    if start < len(texts):
+        chunks.append(texts.iloc[start:])
+    return chunks
+
+
+def _check_chunk(feature, chunk, use_openai):
+    """Map step: find anomalies in one chunk and resolve the entry numbers to dataset ids."""
+    data = "\n".join(
+        f"[{number}] {text}" for number, text in enumerate(chunk.fillna(""), start=1)
+    )
+    response = call_structured(
+        PROMPT_ANOMALIES_CHUNK.format(feature=feature, data=data),
+        AnomalieListe,
+        use_openai=use_openai,
+    )
+    ids = [str(id_) for id_ in chunk.index]
+    return [
+        {
+            "kategorie": anomalie.kategorie,
+            "beschreibung": anomalie.beschreibung,
+            # Numbers outside of the chunk are hallucinated and dropped.
+            "dataset_ids": [
+                ids[ref - 1] for ref in anomalie.referenzen if 0 < ref <= len(ids)
+            ],
+        }
+        for anomalie in response.anomalien
+    ]
+
+
+def iter_text_anomalies(feature, texts, max_tokens=6000, n_parallel=4, use_openai=False):
+    """Check the texts of the whole catalogue for anomalies, chunk by chunk.
+
+    The texts are split into token-bounded chunks that are analyzed in parallel.
+    Findings are yielded as soon as a chunk is done, so partial results can be shown
+    while the rest of the catalogue is still being checked.
+
+    Args:
+        feature (str): Name of the checked property, e.g. "Titel" or "Beschreibungen".
+        texts (pd.Series): The texts, indexed by dataset id.
+        max_tokens (int): Maximum number of text tokens per chunk.
+        n_parallel (int): Number of chunks analyzed in parallel.
+        use_openai (bool): Use OpenAI if True, otherwise Mistral.
+
+    Yields:
+        tuple: The chunk number and a list of findings (dicts with `kategorie`,
+            `beschreibung` and `dataset_ids`).
+    """
+    chunks = chunk_texts(texts, max_tokens=max_tokens)
+    print(f"Checking {len(texts)} {feature} in {len(chunks)} chunks.")
+    with ThreadPoolExecutor(max_workers=n_parallel) as executor:
+        futures = {
+            executor.submit(_check_chunk, feature, chunk, use_openai): number
+            for number, chunk in enumerate(chunks)
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                print(f"Error in chunk {futures[future]}: {e}")
+                yield futures[future], []
+
+
+def merge_anomalies(findings):
+    """Reduce step: merge findings of the same category across chunks.
+
+    Categories are compared case-insensitively. The dataset ids are de-duplicated
+    while keeping their order, and the first description of a category is kept.
+
+    Returns:
+        pd.DataFrame: One row per category, sorted by the number of affected datasets.
+    """
+    merged = {}
+    for finding in findings:
+        key = " ".join(finding["kategorie"].lower().split())
+        if key not in merged:
+            merged[key] = {
+                "kategorie": finding["kategorie"],
+                "beschreibung": finding["beschreibung"],
+                "dataset_ids": {},
+            }
+        merged[key]["dataset_ids"].update(dict.fromkeys(finding["dataset_ids"]))
+
+    rows = [
+        {**entry, "dataset_ids": list(entry["dataset_ids"])} for entry in merged.values()
+    ]
+    df = pd.DataFrame(rows, columns=["kategorie", "beschreibung", "dataset_ids"])
+    df["n_datasets"] = df["dataset_ids"].map(len)
+    return df.sort_values("n_datasets", ascending=False, ignore_index=True)
+
+
+def check_text_properties_chunked(feature, texts, **kwargs):
+    """Map-reduce version of `check_text_properties` for catalogues of any size.
+
+    Args:
+        feature (str): Name of the checked property, e.g. "Titel" or "Beschreibungen".
+        texts (pd.Series): The texts, indexed by dataset id.
+        **kwargs: Passed on to `iter_text_anomalies`.
+
+    Returns:
+        pd.DataFrame: The merged anomalies, see `merge_anomalies`.
+    """
+    findings = []
+    for number, chunk_findings in iter_text_anomalies(feature, texts, **kwargs):
+        print(f"Chunk {number}: {len(chunk_findings)} anomalies found.")
+        findings.extend(chunk_findings)
+    return merge_anomalies(findings)
+
+
+FEW_SHOTS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "data", "few_shot_prompts.txt"
+)
+
+
+@lru_cache(maxsize=None)
+def load_few_shots(path=FEW_SHOTS_PATH):
+    """Read the few-shot examples for PROMPT_ANALYSIS on first use."""
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+PROMPT_RUBRIC = """Du erhältst die Metadaten eines Datensatzes. Diese sollst du detailliert und genau analysieren. Die Metadaten bestehen aus einem Titel, einer Beschreibung, dem geographischem Bezug, der geographischen Granularität, einer Liste von Tags und der zuständigen Stelle. Du sollst die Metadaten analysieren und sicherstellen, dass diese aussagekräftig, vollständig und von hoher Qualität sind. 
 Gib niemals die originalen Metadatenfelder wieder. Verwende stattdessen Formulierungen wie 'der Titel' oder 'die Beschreibung', anstatt deren Inhalt zu wiederholen.
 Liefere ausschließlich deine kritische Bewertung der Metadaten. 
 
@@ -189,12 +500,9 @@ Hier ist die Bewertungsskala:
 {few_shots}
 
 
-Analysiere und bewerte jetzt die Metadaten des Datensatzes.
-
-Hier sind die Metadaten des Datensatzes, den du analysieren sollst:
----------------------------------------------------------------------
+"""
 
-Titel: {title}
+PROMPT_DATASET = """Titel: {title}
 Beschreibung: {description}
 Geographischer Bezug: {geo_reference}
 Geographischen Granularität: {geo_granularity}
@@ -202,38 +510,689 @@ Tags: {tags}
 Zuständige Stelle: {author}
 """
 
+PROMPT_ANALYSIS = (
+    PROMPT_RUBRIC
+    + """Analysiere und bewerte jetzt die Metadaten des Datensatzes.
 
-def do_full_analysis(data, use_openai=True):
-    """Check the titles and descriptions of each dataset individually."""
-    if use_openai:
-        return call_openai(
-            PROMPT_ANALYSIS.format(
-                title=data["title"],
-                description=data["notes"],
-                geo_reference=data["geographical_coverage"],
-                geo_granularity=data["geographical_granularity"],
-                tags=", ".join(data["formatted_tags"]),
-                author=data["author"],
-            )
+Hier sind die Metadaten des Datensatzes, den du analysieren sollst:
+---------------------------------------------------------------------
+
+"""
+    + PROMPT_DATASET
+)
+
+PROMPT_BATCH_ANALYSIS = (
+    PROMPT_RUBRIC
+    + """Analysiere und bewerte jetzt die Metadaten der folgenden {n} Datensätze. Jeder Datensatz wird für sich allein bewertet, vergleiche die Datensätze nicht miteinander. Liefere für jeden Datensatz genau eine Analyse und übernimm seine ID unverändert in das Feld dataset_id.
+
+Hier sind die Metadaten der Datensätze, die du analysieren sollst:
+---------------------------------------------------------------------
+
+{datasets}"""
+)
+
+
+PROMPT_SCORES = (
+    PROMPT_RUBRIC
+    + """Bewerte jetzt die Metadaten des Datensatzes. Gib nur die sechs Bewertungen zurück, ohne Begründung.
+
+Hier sind die Metadaten des Datensatzes, den du bewerten sollst:
+---------------------------------------------------------------------
+
+"""
+    + PROMPT_DATASET
+)
+
+PROMPT_RATIONALE = (
+    PROMPT_RUBRIC
+    + """Die Metadaten des folgenden Datensatzes wurden bereits so bewertet:
+{scores}
+
+Begründe jetzt die Bewertung der Kriterien {criteria}. Nenne die spezifischen Mängel oder Stärken, die zu der Bewertung geführt haben. Ändere die Bewertungen nicht.
+
+Hier sind die Metadaten des Datensatzes:
+---------------------------------------------------------------------
+
+"""
+    + PROMPT_DATASET
+)
+
+# Names of the criteria in the prompts, keyed by their result column.
+CRITERION_LABELS = {
+    "dateninhalt": "Dateninhalt",
+    "methodik": "Methodik",
+    "datenqualitaet": "Datenqualität",
+    "geographie": "Geographie",
+    "tag_qualitaet": "Tag-Qualität",
+    "referenz": "Referenz",
+}
+
+
+def _prompt_fields(data):
+    return dict(
+        title=data["title"],
+        description=data["notes"],
+        geo_reference=data["geographical_coverage"],
+        geo_granularity=data["geographical_granularity"],
+        tags=", ".join(data["formatted_tags"]),
+        author=data["author"],
+    )
+
+
+def render_analysis_prompt(data):
+    """Render PROMPT_ANALYSIS for a single dataset row."""
+    return PROMPT_ANALYSIS.format(few_shots=load_few_shots(), **_prompt_fields(data))
+
+
+def render_scores_prompt(data):
+    """Render PROMPT_SCORES for a single dataset row."""
+    return PROMPT_SCORES.format(few_shots=load_few_shots(), **_prompt_fields(data))
+
+
+def render_rationale_prompt(data, scores, criteria):
+    """Render PROMPT_RATIONALE for the given scores (dict of score columns) and criteria."""
+    lines = []
+    for criterion, label in CRITERION_LABELS.items():
+        score = scores.get(f"{criterion}_score")
+        if pd.isna(score):
+            lines.append(f"{label}: nicht bewertet")
+        else:
+            lines.append(f"{label}: {int(score)} Punkt{'' if int(score) == 1 else 'e'}")
+    return PROMPT_RATIONALE.format(
+        few_shots=load_few_shots(),
+        scores="\n".join(lines),
+        criteria=", ".join(CRITERION_LABELS[criterion] for criterion in criteria),
+        **_prompt_fields(data),
+    )
+
+
+def render_batch_prompt(data_rows):
+    """Render PROMPT_BATCH_ANALYSIS for several dataset rows, each tagged with its id."""
+    datasets = "\n".join(
+        f'<datensatz id="{data["id"]}">\n'
+        + PROMPT_DATASET.format(**_prompt_fields(data))
+        + "</datensatz>\n"
+        for data in data_rows
+    )
+    return PROMPT_BATCH_ANALYSIS.format(
+        few_shots=load_few_shots(), n=len(data_rows), datasets=datasets
+    )
+
+
+# Like all default paths, relative to this module, so that the notebook and
+# run_pipeline.py share one cache whatever directory they are started from.
+ANALYSIS_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "_cache", "analysis_cache.sqlite"
+)
+
+
+class AnalysisCache:
+    """Persistent, content-addressed cache for LLM analysis results.
+
+    Entries are keyed on a hash of everything that determines the model output:
+    the rendered prompt, the system message, the model id, the temperature and
+    the JSON schema of the response model. Changing any of these (e.g. editing
+    the rubric or the few-shot examples) automatically invalidates old entries.
+
+    Args:
+        path (str): Location of the SQLite file holding the cache.
+        max_entries (int): Maximum number of entries kept; least recently used entries are evicted first.
+        max_age_days (float): Entries older than this are evicted. None disables age-based eviction.
+    """
+
+    def __init__(self, path=ANALYSIS_CACHE_PATH, max_entries=50_000, max_age_days=90):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(prompt, model_id, temperature, response_model=MetadataAnalysis):
+        """Build the cache key for a single request."""
+        payload = json.dumps(
+            {
+                "prompt": prompt,
+                "system_message": SYSTEM_MESSAGE,
+                "model_id": model_id,
+                "temperature": temperature,
+                "schema": response_model.model_json_schema(),
+            },
+            sort_keys=True,
+            ensure_ascii=False,
         )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, response_model=MetadataAnalysis):
+        """Return the cached result for `key` or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE analysis_cache SET accessed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._conn.commit()
+        return response_model.model_validate_json(row[0])
+
+    def set(self, key, result):
+        """Store a result. None (failed calls) is never cached."""
+        if result is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache VALUES (?, ?, ?, ?)",
+                (key, result.model_dump_json(), now, now),
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """Drop entries that are too old or exceed `max_entries`. Returns the number of removed entries."""
+        removed = 0
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self._conn.execute(
+                    "DELETE FROM analysis_cache WHERE created_at < ?", (cutoff,)
+                ).rowcount
+            if self.max_entries is not None:
+                removed += self._conn.execute(
+                    """DELETE FROM analysis_cache WHERE key IN (
+                        SELECT key FROM analysis_cache
+                        ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,),
+                ).rowcount
+            self._conn.commit()
+        return removed
+
+    def stats(self):
+        """Return hit/miss counters and the current number of entries."""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": size,
+        }
+
+    def __len__(self):
+        return self.stats()["entries"]
+
+    def __contains__(self, key):
+        """Check for a key without touching the hit/miss counters."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+
+def estimate_analysis_tokens(
+    data, use_openai=True, cache=None, completion_tokens=1000, scores_only=False
+):
+    """Estimate the tokens a call of `do_full_analysis` (or `do_score_analysis` if
+    `scores_only`) will consume.
+
+    Returns 0 if the result is already cached, because no request will be sent.
+    """
+    if scores_only:
+        prompt, response_model = render_scores_prompt(data), MetadataScores
+        completion_tokens = min(completion_tokens, 100)
     else:
-        return call_mistral(
-            PROMPT_ANALYSIS.format(
-                title=data["title"],
-                description=data["notes"],
-                geo_reference=data["geographical_coverage"],
-                geo_granularity=data["geographical_granularity"],
-                tags=", ".join(data["formatted_tags"]),
-                author=data["author"],
+        prompt, response_model = render_analysis_prompt(data), MetadataAnalysis
+    if cache is not None:
+        model_id = openai_model if use_openai else model
+        key = cache.make_key(
+            prompt, model_id, temperature=0, response_model=response_model
+        )
+        if key in cache:
+            return 0
+    return estimate_tokens(SYSTEM_MESSAGE + prompt) + completion_tokens
+
+
+def do_full_analysis(data, use_openai=True, cache=None, raise_errors=False):
+    """Check the titles and descriptions of each dataset individually.
+
+    Args:
+        data (pd.Series): A row of the metadata DataFrame.
+        use_openai (bool): Use OpenAI if True, otherwise Mistral.
+        cache (AnalysisCache): Optional cache. On a hit the stored result is returned without calling the LLM.
+        raise_errors (bool): Raise exceptions of the LLM call instead of returning None, e.g. to retry them.
+
+    Returns:
+        MetadataAnalysis: The analysis, or None if the LLM call failed.
+    """
+    prompt = render_analysis_prompt(data)
+    model_id = openai_model if use_openai else model
+    provider = "openai" if use_openai else "mistral"
+
+    with dataset_context(data.get("id")):
+        if cache is not None:
+            key = cache.make_key(prompt, model_id, temperature=0)
+            cached = cache.get(key)
+            if cached is not None:
+                record_cache_hit(provider, model_id)
+                return cached
+
+        if use_openai:
+            result = call_openai(prompt, modelId=model_id, raise_errors=raise_errors)
+        else:
+            result = call_mistral(prompt, model=model_id, raise_errors=raise_errors)
+
+    if cache is not None:
+        cache.set(key, result)
+    return result
+
+
+def _structured_analysis(
+    prompt, response_model, use_openai, cache, raise_errors, max_tokens
+):
+    """Call the LLM with `response_model` through the cache, like `do_full_analysis`."""
+    model_id = openai_model if use_openai else model
+    if cache is not None:
+        key = cache.make_key(
+            prompt, model_id, temperature=0, response_model=response_model
+        )
+        cached = cache.get(key, response_model=response_model)
+        if cached is not None:
+            record_cache_hit(
+                "openai" if use_openai else "mistral", model_id, response_model.__name__
             )
+            return cached
+    try:
+        result = call_structured(
+            prompt, response_model, use_openai=use_openai, max_tokens=max_tokens
+        )
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"Error: {e}")
+        return None
+    if cache is not None:
+        cache.set(key, result)
+    return result
+
+
+def do_score_analysis(data, use_openai=True, cache=None, raise_errors=False):
+    """Score a dataset without the rationales (fast mode).
+
+    The model only generates the six scores, so the answer has a few dozen output
+    tokens instead of several hundred. Rationales can be added later for selected
+    criteria with `add_rationales`.
+
+    Args:
+        data (pd.Series): A row of the metadata DataFrame.
+        use_openai (bool): Use OpenAI if True, otherwise Mistral.
+        cache (AnalysisCache): Optional cache. On a hit the stored result is returned without calling the LLM.
+        raise_errors (bool): Raise exceptions of the LLM call instead of returning None, e.g. to retry them.
+
+    Returns:
+        MetadataScores: The scores, or None if the LLM call failed.
+    """
+    with dataset_context(data.get("id")):
+        return _structured_analysis(
+            render_scores_prompt(data),
+            MetadataScores,
+            use_openai,
+            cache,
+            raise_errors,
+            max_tokens=256,
+        )
+
+
+def explain_scores(
+    data, scores, criteria, use_openai=True, cache=None, raise_errors=False
+):
+    """Generate the rationales of already scored criteria of one dataset.
+
+    Args:
+        data (pd.Series): A row of the metadata DataFrame.
+        scores (dict): The six `<criterion>_score` values, e.g. a row of the results.
+        criteria (list): The criteria to explain, e.g. ["dateninhalt", "referenz"].
+        use_openai (bool): Use OpenAI if True, otherwise Mistral.
+        cache (AnalysisCache): Optional cache.
+        raise_errors (bool): Raise exceptions of the LLM call instead of returning None.
+
+    Returns:
+        dict: The rationale per criterion, or None if the LLM call failed.
+    """
+    criteria = tuple(
+        criterion for criterion in CRITERION_LABELS if criterion in criteria
+    )
+    with dataset_context(data.get("id")):
+        result = _structured_analysis(
+            render_rationale_prompt(data, scores, criteria),
+            rationale_model(criteria),
+            use_openai,
+            cache,
+            raise_errors,
+            max_tokens=4096,
         )
+    return None if result is None else result.model_dump()
+
+
+def select_for_rationale(results, max_score=1, criteria=None):
+    """Pick the criteria to explain per dataset: those scored at most `max_score`
+    whose rationale is still missing.
+
+    Args:
+        results (pd.DataFrame): Results with the columns of RESULT_COLUMNS.
+        max_score (int): Highest score that still gets a rationale. 3 explains all.
+        criteria (list): Criteria to consider. None considers all six.
+
+    Returns:
+        pd.Series: A list of criteria per row, only for rows with at least one.
+    """
+    criteria = list(CRITERION_LABELS) if criteria is None else criteria
+    selected = pd.DataFrame(
+        {
+            criterion: pd.to_numeric(results[f"{criterion}_score"]).le(max_score)
+            & results[criterion].isna()
+            for criterion in criteria
+        },
+        index=results.index,
+    )
+    selected = selected[selected.any(axis=1)]
+    return pd.Series(
+        [
+            [criterion for criterion, keep in zip(criteria, mask) if keep]
+            for mask in selected.to_numpy()
+        ],
+        index=selected.index,
+        dtype="object",
+    )
+
+
+def add_rationales(
+    df,
+    results,
+    max_score=1,
+    criteria=None,
+    use_openai=True,
+    cache=None,
+    scheduler=None,
+    store=None,
+):
+    """Fill in the rationales of selected scores, e.g. after `do_score_analysis`.
+
+    Only the criteria chosen by `select_for_rationale` are sent to the LLM, one
+    request per dataset, within the rate limits of `scheduler`. Existing rationales
+    are kept. With a `store`, every completed result is written to the checkpoint
+    file, so the rationales are not requested again after an interruption.
+
+    Args:
+        df (pd.DataFrame): The metadata, indexed like `results`.
+        results (pd.DataFrame): Results with the columns of RESULT_COLUMNS.
+        max_score, criteria: See `select_for_rationale`.
+        use_openai (bool): Use OpenAI if True, otherwise Mistral.
+        cache (AnalysisCache): Optional cache.
+        scheduler (RateLimitedScheduler): Scheduler of the requests. Defaults to a
+            new one for the provider.
+        store (CheckpointStore): Optional checkpoint store of the analysis.
+
+    Returns:
+        pd.DataFrame: A copy of `results` with the rationales filled in.
+    """
+    results = results.copy()
+    for criterion in CRITERION_LABELS:
+        # After the scores-only mode the rationale columns are missing or all-NaN floats.
+        if criterion not in results.columns or results[criterion].isna().all():
+            results[criterion] = pd.Series(None, index=results.index, dtype="object")
+    selection = select_for_rationale(results, max_score=max_score, criteria=criteria)
+    print(
+        f"Generating {selection.map(len).sum()} rationales for {len(selection)} datasets."
+    )
+    if scheduler is None:
+        scheduler = RateLimitedScheduler(provider="openai" if use_openai else "mistral")
+
+    def scores(index):
+        return results.loc[index].to_dict()
+
+    def estimate(data):
+        criteria = tuple(
+            criterion
+            for criterion in CRITERION_LABELS
+            if criterion in selection[data.name]
+        )
+        prompt = render_rationale_prompt(data, scores(data.name), criteria)
+        if cache is not None:
+            key = cache.make_key(
+                prompt,
+                openai_model if use_openai else model,
+                temperature=0,
+                response_model=rationale_model(criteria),
+            )
+            if key in cache:
+                return 0
+        return estimate_tokens(SYSTEM_MESSAGE + prompt) + 300 * len(criteria)
+
+    def explain(data):
+        rationales = explain_scores(
+            data,
+            scores(data.name),
+            selection[data.name],
+            use_openai=use_openai,
+            cache=cache,
+            raise_errors=True,
+        )
+        # The complete result of the dataset, so that it replaces the stored one.
+        result = {
+            column: None if pd.isna(value) else value
+            for column, value in results.loc[data.name, RESULT_COLUMNS].items()
+        }
+        for column in RESULT_COLUMNS[1::2]:
+            if result[column] is not None:
+                result[column] = int(result[column])
+        return {**result, **rationales}
+
+    completed = scheduler.map(
+        explain if store is None else store.wrap(explain),
+        [df.loc[index] for index in selection.index],
+        estimate=estimate,
+    )
+    for index, result in zip(selection.index, completed):
+        for criterion in selection[index] if result else ():
+            results.at[index, criterion] = result[criterion]
+    return results
+
+
+def pack_batches(
+    data_rows,
+    max_datasets=10,
+    max_prompt_tokens=30_000,
+    completion_tokens_per_dataset=1000,
+    max_completion_tokens=16_000,
+):
+    """Greedily pack dataset rows into batches for `analyze_batch`.
+
+    A batch is closed when it reaches `max_datasets`, when its prompt would exceed
+    `max_prompt_tokens` or when the expected output would exceed `max_completion_tokens`.
+    """
+    base_tokens = estimate_tokens(SYSTEM_MESSAGE + render_batch_prompt([]))
+    max_datasets = min(
+        max_datasets, max(1, max_completion_tokens // completion_tokens_per_dataset)
+    )
+    batches = []
+    batch, batch_tokens = [], base_tokens
+    for data in data_rows:
+        tokens = estimate_tokens(PROMPT_DATASET.format(**_prompt_fields(data)))
+        if batch and (
+            len(batch) >= max_datasets or batch_tokens + tokens > max_prompt_tokens
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], base_tokens
+        batch.append(data)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def call_batch(prompt, use_openai=True, max_tokens=16_000):
+    """Send a multi-dataset prompt and return the validated MetadataAnalysisList."""
+    return call_structured(
+        prompt, MetadataAnalysisList, use_openai=use_openai, max_tokens=max_tokens
+    )
+
+
+def analyze_batch(data_rows, use_openai=True):
+    """Analyze several datasets in one request.
+
+    If the response is invalid or misses some datasets, the missing datasets are
+    split in two halves and retried. Single datasets fall back to `do_full_analysis`.
+
+    Args:
+        data_rows (list): Rows of the metadata DataFrame, each with an `id`.
+        use_openai (bool): Use OpenAI if True, otherwise Mistral.
+
+    Returns:
+        dict: MetadataAnalysis objects keyed by dataset id. Datasets that could not be
+            analyzed at all are missing.
+    """
+    if len(data_rows) == 1:
+        result = do_full_analysis(data_rows[0], use_openai=use_openai)
+        return {} if result is None else {str(data_rows[0]["id"]): result}
+
+    expected = {str(data["id"]) for data in data_rows}
+    results = {}
+    try:
+        with dataset_context(",".join(sorted(expected))):
+            response = call_batch(render_batch_prompt(data_rows), use_openai=use_openai)
+        for analysis in response.analysen:
+            if analysis.dataset_id in expected:
+                results[analysis.dataset_id] = MetadataAnalysis(
+                    **analysis.model_dump(exclude={"dataset_id"})
+                )
+    except Exception as e:
+        print(f"Error in batch of {len(data_rows)} datasets: {e}")
+
+    missing = [data for data in data_rows if str(data["id"]) not in results]
+    if missing:
+        half = (len(missing) + 1) // 2
+        results.update(analyze_batch(missing[:half], use_openai=use_openai))
+        if missing[half:]:
+            results.update(analyze_batch(missing[half:], use_openai=use_openai))
+    return results
+
+
+def do_batched_analysis(data_rows, use_openai=True, n_parallel=4, **pack_kwargs):
+    """Analyze datasets in multi-dataset requests.
+
+    The rubric and the few-shot examples are sent once per batch instead of once per
+    dataset, which cuts the input tokens per dataset considerably.
+
+    Args:
+        data_rows (list): Rows of the metadata DataFrame, each with an `id`.
+        use_openai (bool): Use OpenAI if True, otherwise Mistral.
+        n_parallel (int): Number of batches analyzed in parallel.
+        **pack_kwargs: Passed on to `pack_batches`.
+
+    Returns:
+        list: MetadataAnalysis (or None) for every row, in the order of `data_rows`.
+    """
+    data_rows = list(data_rows)
+    batches = pack_batches(data_rows, **pack_kwargs)
+    print(f"Analyzing {len(data_rows)} datasets in {len(batches)} batches.")
+    results = {}
+    with ThreadPoolExecutor(max_workers=n_parallel) as executor:
+        for batch_results in executor.map(
+            partial(analyze_batch, use_openai=use_openai), batches
+        ):
+            results.update(batch_results)
+    return [results.get(str(data["id"])) for data in data_rows]
+
+
+def compare_batched_vs_single(data_rows, use_openai=True, **pack_kwargs):
+    """Compare the single-dataset and the batched analysis on the same rows.
+
+    Both paths run sequentially so that throughput is comparable. Prompt tokens are
+    estimated from the rendered prompts.
+
+    Returns:
+        pd.DataFrame: Prompt tokens per dataset, datasets per minute and number of
+            valid results for both paths.
+    """
+    data_rows = list(data_rows)
+    batches = pack_batches(data_rows, **pack_kwargs)
+    runs = {
+        "single": (
+            lambda: [do_full_analysis(data, use_openai=use_openai) for data in data_rows],
+            sum(
+                estimate_tokens(SYSTEM_MESSAGE + render_analysis_prompt(data))
+                for data in data_rows
+            ),
+        ),
+        "batched": (
+            lambda: do_batched_analysis(
+                data_rows, use_openai=use_openai, n_parallel=1, **pack_kwargs
+            ),
+            sum(
+                estimate_tokens(SYSTEM_MESSAGE + render_batch_prompt(batch))
+                for batch in batches
+            ),
+        ),
+    }
+    rows = []
+    for name, (run, prompt_tokens) in runs.items():
+        start = time.monotonic()
+        results = run()
+        elapsed = time.monotonic() - start
+        rows.append(
+            {
+                "mode": name,
+                "prompt_tokens_per_dataset": prompt_tokens / len(data_rows),
+                "datasets_per_minute": len(data_rows) / elapsed * 60,
+                "valid_results": sum(result is not None for result in results),
+            }
+        )
+    return pd.DataFrame(rows).set_index("mode")
+
+
+RESULT_COLUMNS = [
+    "dateninhalt",
+    "dateninhalt_score",
+    "methodik",
+    "methodik_score",
+    "datenqualitaet",
+    "datenqualitaet_score",
+    "geographie",
+    "geographie_score",
+    "tag_qualitaet",
+    "tag_qualitaet_score",
+    "referenz",
+    "referenz_score",
+]
 
 
 def parse_instructor_results(results):
     """Parse the LLM instructor response given the MetadataAnalysis class. Extract the scores and the qualitative analysis.
 
     Args:
-        results (MetadataAnalysis): The response from the LLM, already parsed into a MetadataAnalysis object.
+        results (list): The responses from the LLM, already parsed into MetadataAnalysis or MetadataScores objects. None entries become empty rows.
 
     Returns:
         pd.DataFrame: A DataFrame with the scores and the qualitative analysis.
@@ -242,96 +1201,101 @@ def parse_instructor_results(results):
 
     # Process each MetadataAnalysis object
     for results in results:
-        data_rows.append(
-            {
-                "dateninhalt": results.dateninhalt,
-                "dateninhalt_score": results.dateninhalt_score,
-                "methodik": results.methodik,
-                "methodik_score": results.methodik_score,
-                "datenqualitaet": results.datenqualitaet,
-                "datenqualitaet_score": results.datenqualitaet_score,
-                "geographie": results.geographie,
-                "geographie_score": results.geographie_score,
-                "tag_qualitaet": results.tag_qualitaet,
-                "tag_qualitaet_score": results.tag_qualitaet_score,
-                "referenz": results.referenz,
-                "referenz_score": results.referenz_score,
-            }
-        )
+        # Failed LLM calls are kept as empty rows, so the rows stay aligned with the input.
+        if results is None:
+            data_rows.append({})
+            continue
+        # MetadataScores (fast mode) have no rationales, their columns stay empty.
+        data_rows.append(results.model_dump(include=set(RESULT_COLUMNS)))
 
     # Create DataFrame from all results
-    df = pd.DataFrame(data_rows)
+    df = pd.DataFrame(data_rows, columns=RESULT_COLUMNS)
 
     return df
 
 
+# Tags of the plain-text (non-instructor) LLM output, mapped to the result columns.
+ANALYSIS_TAGS = {
+    "dateninhalt": "dateninhalt",
+    "methodik": "methodik",
+    "datenqualität": "datenqualitaet",
+    "datenqualitaet": "datenqualitaet",
+    "geographie": "geographie",
+    "tag-qualität": "tag_qualitaet",
+    "tag_qualitaet": "tag_qualitaet",
+    "tagqualität": "tag_qualitaet",
+    "referenz": "referenz",
+}
+ANALYSIS_TAGS.update(
+    {f"{tag}-score": f"{column}_score" for tag, column in list(ANALYSIS_TAGS.items())}
+)
+
+# One pattern for all sections; the closing tag must match the opening tag.
+_TAGGED_SECTION = re.compile(r"<([\w\-äöüÄÖÜ]+)>(.*?)</\1>", re.DOTALL)
+_SCORE = re.compile(r"\s*([123])\s*(?:/\s*3)?\s*(?:punkte?)?\s*$", re.IGNORECASE)
+
+
+def _parse_tagged_response(response):
+    """Extract all sections of one tagged response in a single scan.
+
+    Sections can be wrapped in other tags (e.g. `<analyse>...</analyse>`): the
+    contents of unknown tags are scanned for sections as well.
+    """
+    record = dict.fromkeys(RESULT_COLUMNS)
+    if not isinstance(response, str):
+        return record, "no response"
+
+    texts = [response]
+    while texts:
+        for match in _TAGGED_SECTION.finditer(texts.pop()):
+            column = ANALYSIS_TAGS.get(match.group(1).lower())
+            if column is None:
+                texts.append(match.group(2))
+            elif record[column] is None:
+                record[column] = match.group(2).strip()
+
+    errors = [f"missing {column}" for column, value in record.items() if value is None]
+    for column in RESULT_COLUMNS[1::2]:
+        if record[column] is None:
+            continue
+        score = _SCORE.match(record[column])
+        if score is None:
+            errors.append(f"invalid {column}: {record[column][:20]!r}")
+            record[column] = None
+        else:
+            record[column] = int(score.group(1))
+    return record, "; ".join(errors) or None
+
+
 def parse_analysis_results(results):
-    """Parse the LLM response. Extract the scores and the qualitative analysis.
+    """Parse the tagged LLM responses. Extract the scores and the qualitative analysis.
+
+    Each response is scanned once with a precompiled pattern. All six criteria and
+    their scores are extracted and the scores are validated (1-3). Responses with
+    missing or invalid sections do not raise; the affected fields stay empty and the
+    problem is described in the `parse_error` column.
 
     Args:
-        results (str): The response from the LLM.
+        results (str | list): One response or a list of responses from the LLM.
 
     Returns:
-        pd.DataFrame: A DataFrame with the scores and the qualitative analysis.
-
+        pd.DataFrame: One row per response with the columns of
+            `parse_instructor_results` plus `parse_error`.
     """
-    content = re.findall(r"<dateninhalt>(.*?)</dateninhalt>", results, re.DOTALL)[
-        0
-    ].strip()
-    content_score = re.findall(
-        r"<dateninhalt-score>(.*?)</dateninhalt-score>", results, re.DOTALL
-    )[0].strip()
-    context = re.findall(
-        r"<methodik>(.*?)</methodik>",
-        results,
-        re.DOTALL,
-    )[0].strip()
-    context_score = re.findall(
-        r"<methodik-score>(.*?)</methodik-score>",
-        results,
-        re.DOTALL,
-    )[0].strip()
-    quality = re.findall(r"<datenqualität>(.*?)</datenqualität>", results, re.DOTALL)[
-        0
-    ].strip()
-    quality_score = re.findall(
-        r"<datenqualität-score>(.*?)</datenqualität-score>",
-        results,
-        re.DOTALL,
-    )[0].strip()
-    spacial = re.findall(
-        r"<geographie>(.*?)</geographie>",
-        results,
-        re.DOTALL,
-    )[0].strip()
-    spacial_score = re.findall(
-        r"<geographie-score>(.*?)</geographie-score>",
-        results,
-        re.DOTALL,
-    )[0].strip()
-    tmp = pd.DataFrame(
-        (
-            content,
-            content_score,
-            context,
-            context_score,
-            quality,
-            quality_score,
-            spacial,
-            spacial_score,
-        )
-    ).T
-    tmp.columns = [
-        "content",
-        "content_score",
-        "context",
-        "context_score",
-        "quality",
-        "quality_score",
-        "spacial",
-        "spacial_score",
-    ]
-    return tmp
+    if isinstance(results, str) or results is None:
+        results = [results]
+
+    columns = {column: [] for column in RESULT_COLUMNS + ["parse_error"]}
+    for response in results:
+        record, error = _parse_tagged_response(response)
+        for column, value in record.items():
+            columns[column].append(value)
+        columns["parse_error"].append(error)
+
+    df = pd.DataFrame(columns)
+    for column in RESULT_COLUMNS[1::2]:
+        df[column] = df[column].astype("Int64")
+    return df
 
 
 # Data derived from the DCAT-AP.de specification here:
@@ -0,0 +1,193 @@
+import json
+
+import pandas as pd
+import pyarrow.compute as pc
+
+from ckan import arrow_array
+from triage import is_missing
+from utils import DCAT_CLASS_DISTRIBUTION, VOCAB_EU_FREQUENCY, VOCAB_EU_THEME
+
+# CKAN resource keys that hold each DCAT-AP.de distribution property.
+# The first non-missing key wins. Properties without a mapping are reported as missing.
+DISTRIBUTION_FIELDS = {
+    "dcat:accessURL": ["url", "access_url"],
+    "dct:title": ["name"],
+    "dct:modified": ["modified", "last_modified", "metadata_modified"],
+    "dct:license": ["license", "license_id"],
+    "dct:format": ["format"],
+    "dcatap:availability": ["availability"],
+    "dcatde:plannedAvailability": ["planned_availability"],
+    "dcatde:licenseAttributionByText": ["license_attribution_by_text"],
+    "dct:description": ["description"],
+    "dcat:byteSize": ["size", "byte_size"],
+    "dct:issued": ["issued", "created"],
+    "dcat:downloadURL": ["download_url"],
+    "dct:language": ["language"],
+    "foaf:page": ["documentation"],
+    "dct:rights": ["rights"],
+    "dct:conformsTo": ["conforms_to"],
+    "dcat:mediaType": ["mimetype", "media_type"],
+    "dcat:compressFormat": ["compress_format"],
+    "dcat:packageFormat": ["package_format"],
+    "odrl:hasPolicy": ["has_policy"],
+    "adms:status": ["status"],
+    "dcat:accessService": ["access_services"],
+    "spdx:checksum": ["hash", "checksum"],
+}
+
+# Vocabularies as hash sets of their codes (the last part of the URI), so that both
+# full URIs and bare codes like "TRAN" can be looked up in constant time.
+EU_THEME_CODES = frozenset(uri.rsplit("/", 1)[-1] for uri in VOCAB_EU_THEME)
+EU_FREQUENCY_CODES = frozenset(uri.rsplit("/", 1)[-1] for uri in VOCAB_EU_FREQUENCY)
+
+
+def distribution_table(df):
+    """Decode the `resources` JSON of all packages into one flat distribution table.
+
+    Args:
+        df (pd.DataFrame): The metadata with `id` and `resources` (JSON strings or
+            lists of dicts, as read from the snapshot).
+
+    Returns:
+        pd.DataFrame: One row per distribution with a `package_id` column and one
+            column per resource key.
+    """
+    if isinstance(df["resources"].dtype, pd.ArrowDtype):
+        # Arrow-backed snapshot columns are flattened without a dict per resource.
+        array = arrow_array(df["resources"])
+        flat = pc.list_flatten(array)
+        dist = pd.DataFrame(
+            {
+                field.name: flat.field(field.name).to_pandas()
+                for field in flat.type
+                if flat.field(field.name).null_count < len(flat)
+            }
+        )
+        dist["package_id"] = df["id"].to_numpy()[
+            pc.list_parent_indices(array).to_numpy()
+        ]
+        return dist
+    records = [
+        dict(resource, package_id=package_id)
+        for package_id, resources in zip(df["id"], df["resources"])
+        if resources is not None
+        for resource in (
+            json.loads(resources) if isinstance(resources, str) else resources
+        )
+    ]
+    if not records:
+        return pd.DataFrame(columns=["package_id"])
+    return pd.DataFrame.from_records(records)
+
+
+def _coalesce(dist, keys):
+    """Return the first non-missing value among `keys` for every distribution."""
+    values = pd.Series(pd.NA, index=dist.index, dtype="object")
+    for key in keys:
+        if key in dist.columns:
+            values = values.where(~is_missing(values), dist[key])
+    return values
+
+
+def validate_distributions(dist):
+    """Check all distributions against DCAT_CLASS_DISTRIBUTION.
+
+    The presence of each property is checked with column operations on the whole
+    table. Only the cardinality check looks at single values, and only at properties
+    that contain lists.
+
+    Returns:
+        pd.DataFrame: Per-distribution compliance matrix with one boolean column per
+            DCAT property (present), `cardinality_ok`, `mandatory_ok` and
+            `recommended_share`.
+    """
+    matrix = pd.DataFrame({"package_id": dist["package_id"]}, index=dist.index)
+    cardinality_ok = pd.Series(True, index=dist.index)
+    for _, prop, _, _, cardinality in DCAT_CLASS_DISTRIBUTION:
+        values = _coalesce(dist, DISTRIBUTION_FIELDS.get(prop, []))
+        matrix[prop] = ~is_missing(values)
+        is_list = values.map(type).eq(list)
+        if cardinality == "0..1" and is_list.any():
+            too_many = values[is_list].map(len).gt(1)
+            cardinality_ok &= ~too_many.reindex(dist.index, fill_value=False)
+    matrix["cardinality_ok"] = cardinality_ok
+
+    mandatory = [
+        prop for _, prop, _, obligation, _ in DCAT_CLASS_DISTRIBUTION if obligation == "M"
+    ]
+    recommended = [
+        prop for _, prop, _, obligation, _ in DCAT_CLASS_DISTRIBUTION if obligation == "R"
+    ]
+    matrix["mandatory_ok"] = matrix[mandatory].all(axis=1)
+    matrix["recommended_share"] = matrix[recommended].mean(axis=1)
+    return matrix
+
+
+def is_in_vocabulary(values, codes):
+    """Check values (URIs or bare codes) against a vocabulary code set."""
+    code = values.astype("string").str.strip().str.rsplit("/", n=1).str[-1].str.upper()
+    return code.isin(codes).fillna(False).astype(bool)
+
+
+def validate_packages(df, matrix, theme_column="theme", frequency_column="frequency"):
+    """Aggregate the distribution matrix per package and check package vocabularies.
+
+    Args:
+        df (pd.DataFrame): The metadata with an `id` column.
+        matrix (pd.DataFrame): Output of `validate_distributions`.
+        theme_column (str): Column with EU data themes (one value or a JSON list), if present.
+        frequency_column (str): Column with the EU update frequency, if present.
+
+    Returns:
+        pd.DataFrame: Per-package compliance matrix indexed by package id. It holds the
+            number of distributions, the share of distributions having each DCAT
+            property, whether all distributions are compliant, and the vocabulary checks.
+    """
+    props = [prop for _, prop, _, _, _ in DCAT_CLASS_DISTRIBUTION]
+    grouped = matrix.groupby("package_id")
+    packages = grouped[props + ["recommended_share"]].mean()
+    packages["n_distributions"] = grouped.size()
+    packages["mandatory_ok"] = grouped["mandatory_ok"].all()
+    packages["cardinality_ok"] = grouped["cardinality_ok"].all()
+    packages = packages.reindex(df["id"])
+    packages["n_distributions"] = packages["n_distributions"].fillna(0).astype(int)
+    packages["has_distribution"] = packages["n_distributions"] > 0
+    packages[["mandatory_ok", "cardinality_ok"]] = (
+        packages[["mandatory_ok", "cardinality_ok"]].fillna(False).astype(bool)
+    )
+
+    if theme_column in df.columns:
+        themes = df[["id", theme_column]].copy()
+        themes[theme_column] = themes[theme_column].map(
+            lambda value: json.loads(value)
+            if isinstance(value, str) and value.startswith("[")
+            else value
+        )
+        themes = themes.explode(theme_column)
+        valid = is_in_vocabulary(themes[theme_column], EU_THEME_CODES)
+        packages["theme_valid"] = (
+            valid.groupby(themes["id"].values).all().reindex(df["id"])
+        )
+    if frequency_column in df.columns:
+        packages["frequency_valid"] = is_in_vocabulary(
+            df[frequency_column], EU_FREQUENCY_CODES
+        ).values
+    return packages
+
+
+def validate_catalogue(df):
+    """Run the distribution-level validation for the whole catalogue.
+
+    Returns:
+        tuple: The per-package and the per-distribution compliance matrices.
+    """
+    dist = distribution_table(df)
+    matrix = validate_distributions(dist)
+    packages = validate_packages(df, matrix)
+    print(
+        f"{len(dist)} distributions in {len(df)} packages checked: "
+        f"{matrix['mandatory_ok'].mean():.1%} of distributions have all mandatory "
+        f"properties, {packages['has_distribution'].mean():.1%} of packages have "
+        "a distribution."
+    )
+    return packages, matrix